@@ -0,0 +1,486 @@
+import hashlib
+import http.client
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """A thread-safe, size-bounded cache that evicts the least recently
+    used entry first. Entries may be given a time to live in seconds.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if it is missing
+        or has expired.
+        """
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                return default
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store value under key, evicting the oldest entries if full."""
+        if ttl is None:
+            ttl = self.ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        sentinel = object()
+        return self.get(key, sentinel) is not sentinel
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LocationCache(LRUCache):
+    """Cache of get_file_system results keyed by
+    (meta_id, file_path, location tuple).
+
+    Located files are kept for hit_ttl seconds. Files that could not be
+    found on any location are kept for the (usually shorter) miss_ttl so
+    repeated lookups of missing objects don't wait out every timeout.
+    Misses where some location didn't answer (so the file may be there)
+    are kept for the shorter unavailable_ttl (see get_file_system).
+    """
+
+    def __init__(self, maxsize=10000, hit_ttl=3600, miss_ttl=60, unavailable_ttl=10):
+        super().__init__(maxsize)
+        self.hit_ttl = hit_ttl
+        self.miss_ttl = miss_ttl
+        self.unavailable_ttl = unavailable_ttl
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.hit_ttl if value[0] is not None else self.miss_ttl
+        super().set(key, value, ttl)
+
+
+class BlockCache(LRUCache):
+    """Cache of fixed size blocks of remote files, keyed by
+    (url, block number), used by open_file_ranges. maxsize is the number
+    of blocks kept.
+    """
+
+    def __init__(self, maxsize=256, block_size=65536, ttl=300):
+        super().__init__(maxsize, ttl)
+        self.block_size = block_size
+
+
+class DirectoryCache:
+    """Store of bytes values as files in a local directory, so snapshots
+    can be shared by every process on a host. Files are written
+    atomically, so concurrent readers never see a partial value.
+    """
+
+    # The cache can be given to other processes (see load_many)
+    shared = True
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _filename(self, key):
+        return os.path.join(self.path, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key, default=None):
+        try:
+            with open(self._filename(key), 'rb') as cache_file:
+                return cache_file.read()
+        except OSError:
+            return default
+
+    def set(self, key, value):
+        fd, temp_name = tempfile.mkstemp(dir=self.path)
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(value)
+            os.replace(temp_name, self._filename(key))
+        except Exception:
+            os.unlink(temp_name)
+            raise
+
+    def delete(self, key):
+        try:
+            os.unlink(self._filename(key))
+        except OSError:
+            pass
+
+
+class CachedResponse:
+    """File-like url response served from an HTTPCache."""
+
+    status = 200
+
+    def __init__(self, url, metadata, body):
+        self.url = url
+        self._body = body
+        self.headers = http.client.HTTPMessage()
+        for name, value in metadata['headers']:
+            self.headers[name] = value
+
+    def read(self, amt=None):
+        return self._body.read(amt)
+
+    def readinto(self, buffer):
+        return self._body.readinto(buffer)
+
+    def readline(self, limit=-1):
+        return self._body.readline(limit)
+
+    def __iter__(self):
+        return iter(self._body)
+
+    def tell(self):
+        return self._body.tell()
+
+    def close(self):
+        self._body.close()
+
+    def getcode(self):
+        return self.status
+
+    def geturl(self):
+        return self.url
+
+    def info(self):
+        return self.headers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class HTTPCache:
+    """On-disk cache of url responses and their validators (ETag and
+    Last-Modified), used by open_url to make conditional requests. The
+    least recently used responses are removed once the bodies take up
+    more than max_size bytes. Responses larger than max_entry_size bytes,
+    or without a Content-Length, aren't stored.
+    """
+
+    def __init__(self, path, max_size=1024 ** 3, max_entry_size=16 * 1024 ** 2):
+        self.path = path
+        self.max_size = max_size
+        self.max_entry_size = max_entry_size
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._total_size = None
+
+    def _filename(self, url, extension):
+        name = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, name + extension)
+
+    def get(self, url):
+        """Return (metadata, open body file) for a cached url, or None."""
+        try:
+            with open(self._filename(url, '.json')) as metadata_file:
+                metadata = json.load(metadata_file)
+            body = open(self._filename(url, '.body'), 'rb')
+        except (OSError, ValueError):
+            return None
+        # The body may have been replaced since the metadata was read
+        if metadata.get('url') != url or os.fstat(body.fileno()).st_size != metadata['size']:
+            body.close()
+            return None
+        return metadata, body
+
+    def touch(self, url):
+        """Mark a url as recently used."""
+        try:
+            os.utime(self._filename(url, '.json'))
+        except OSError:
+            pass
+
+    def set(self, url, headers, body_file):
+        """Store the response headers (a list of (name, value) pairs) and
+        the body read from body_file, and return the body's size.
+        """
+        fd, temp_name = tempfile.mkstemp(dir=self.path)
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                shutil.copyfileobj(body_file, temp_file)
+                size = temp_file.tell()
+            os.replace(temp_name, self._filename(url, '.body'))
+        except Exception:
+            os.unlink(temp_name)
+            raise
+        metadata = {'url': url, 'headers': headers, 'size': size}
+        fd, temp_name = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, 'w') as temp_file:
+            json.dump(metadata, temp_file)
+        os.replace(temp_name, self._filename(url, '.json'))
+        with self._lock:
+            if self._total_size is not None:
+                self._total_size += size
+            total_size = self._total_size
+        if total_size is None or total_size > self.max_size:
+            self.evict()
+        return size
+
+    def delete(self, url):
+        for extension in ('.json', '.body'):
+            try:
+                os.unlink(self._filename(url, extension))
+            except OSError:
+                pass
+
+    def evict(self):
+        """Remove the least recently used responses until the cache is
+        within max_size.
+        """
+        entries = []
+        total_size = 0
+        with os.scandir(self.path) as directory:
+            for entry in directory:
+                if not entry.name.endswith('.json'):
+                    continue
+                name = entry.name[:-len('.json')]
+                try:
+                    size = os.stat(os.path.join(self.path, name + '.body')).st_size
+                    used = entry.stat().st_mtime
+                except OSError:
+                    continue
+                entries.append((used, name, size))
+                total_size += size
+        entries.sort()
+        for _, name, size in entries:
+            if total_size <= self.max_size:
+                break
+            for extension in ('.json', '.body'):
+                try:
+                    os.unlink(os.path.join(self.path, name + extension))
+                except OSError:
+                    pass
+            total_size -= size
+        with self._lock:
+            self._total_size = total_size
+
+
+class SQLiteCache:
+    """Cache stored in a SQLite database on local disk, shared by every
+    process (such as WSGI workers) that opens the same file, so each
+    entry is fetched and stored once per host rather than once per
+    process.
+
+    Values are bytes, or anything that can be pickled, and keys are
+    strings or tuples of strings. The least recently used entries are
+    removed once the values take up more than max_size bytes. Entries may
+    be given a time to live in seconds. Times are wall-clock, so they
+    mean the same in every process.
+    """
+
+    # The cache can be given to other processes (see load_many)
+    shared = True
+    # Seconds between updates of an entry's last use, so most gets
+    # don't need to write
+    access_resolution = 60
+
+    def __init__(self, path, max_size=256 * 1024 ** 2, ttl=None, timeout=10):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.timeout = timeout
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.executescript(SQLITE_CACHE_SCHEMA)
+
+    def _connect(self):
+        """Return this thread's connection, opening one if needed (each
+        process opens its own).
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def _key(key):
+        return key if isinstance(key, str) else repr(key)
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if it is missing
+        or has expired.
+        """
+        key = self._key(key)
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                'SELECT value, pickled, expires, accessed FROM entries WHERE key = ?',
+                (key,)).fetchone()
+            if row is None:
+                return default
+            value, pickled, expires, accessed = row
+            now = time.time()
+            if expires is not None and expires <= now:
+                connection.execute('DELETE FROM entries WHERE key = ? AND expires <= ?',
+                                   (key, now))
+                return default
+            if now - accessed >= self.access_resolution:
+                connection.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+        except sqlite3.Error:
+            return default
+        if pickled:
+            return pickle.loads(value)
+        return value
+
+    def set(self, key, value, ttl=None):
+        """Store value under key, evicting the least recently used
+        entries if the cache is full.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        if isinstance(value, bytes):
+            data, pickled = value, 0
+        else:
+            data, pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL), 1
+        now = time.time()
+        expires = now + ttl if ttl is not None else None
+        key = self._key(key)
+        connection = self._connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+                connection.execute(
+                    'INSERT INTO entries (key, value, pickled, size, expires, accessed) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, sqlite3.Binary(data), pickled, len(data), expires, now))
+                self._evict(connection, now)
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+        except sqlite3.Error:
+            # The value just isn't cached if the database is busy or full
+            pass
+
+    def _evict(self, connection, now):
+        total_size, = connection.execute('SELECT total_size FROM stats').fetchone()
+        if total_size <= self.max_size:
+            return
+        connection.execute('DELETE FROM entries WHERE expires <= ?', (now,))
+        total_size, = connection.execute('SELECT total_size FROM stats').fetchone()
+        # Evict down to 90% so the next sets don't all have to evict
+        excess = total_size - self.max_size * 0.9
+        keys = []
+        for key, size in connection.execute('SELECT key, size FROM entries ORDER BY accessed'):
+            if excess <= 0:
+                break
+            keys.append((key,))
+            excess -= size
+        connection.executemany('DELETE FROM entries WHERE key = ?', keys)
+
+    def delete(self, key):
+        try:
+            self._connect().execute('DELETE FROM entries WHERE key = ?', (self._key(key),))
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        self._connect().execute('DELETE FROM entries')
+
+    def __contains__(self, key):
+        sentinel = object()
+        return self.get(key, sentinel) is not sentinel
+
+    def __len__(self):
+        return self._connect().execute('SELECT count(*) FROM entries').fetchone()[0]
+
+    def total_size(self):
+        """Return the size of the stored values in bytes."""
+        return self._connect().execute('SELECT total_size FROM stats').fetchone()[0]
+
+    def close(self):
+        """Close this thread's connection."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+
+class SharedLocationCache(SQLiteCache):
+    """SQLiteCache of get_file_system results, with the hit, miss and
+    unavailable times to live of a LocationCache.
+    """
+
+    def __init__(self, path, max_size=64 * 1024 ** 2, hit_ttl=3600, miss_ttl=60,
+                 timeout=10, unavailable_ttl=10):
+        super().__init__(path, max_size, timeout=timeout)
+        self.hit_ttl = hit_ttl
+        self.miss_ttl = miss_ttl
+        self.unavailable_ttl = unavailable_ttl
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.hit_ttl if value[0] is not None else self.miss_ttl
+        super().set(key, value, ttl)
+
+
+SQLITE_CACHE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    pickled INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE TABLE IF NOT EXISTS stats (total_size INTEGER NOT NULL);
+INSERT INTO stats (total_size)
+    SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM stats);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    UPDATE stats SET total_size = total_size + new.size;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    UPDATE stats SET total_size = total_size - old.size;
+END;
+'''
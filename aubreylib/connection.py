@@ -0,0 +1,286 @@
+import http.client
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import deque
+
+
+class PooledResponse:
+    """File-like wrapper around an http.client.HTTPResponse that gives
+    its connection back to the pool once the body has been fully read.
+    """
+
+    def __init__(self, response, url, pool, key, conn):
+        self._response = response
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self.url = url
+        # Responses without a body (HEAD, 204, 304, ...) are done already
+        if response.length == 0:
+            response.read()
+            self._release()
+
+    def _release(self):
+        if self._conn is not None and self._response.isclosed():
+            self._pool.release(self._key, self._conn)
+            self._conn = None
+
+    def read(self, amt=None):
+        data = self._response.read(amt)
+        self._release()
+        return data
+
+    def readinto(self, buffer):
+        size = self._response.readinto(buffer)
+        self._release()
+        return size
+
+    def readline(self, limit=-1):
+        data = self._response.readline(limit)
+        self._release()
+        return data
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def close(self):
+        """Close the response. A connection whose body wasn't fully read
+        can't be reused, so it is closed rather than pooled.
+        """
+        if self._conn is not None:
+            if self._response.isclosed():
+                self._release()
+            else:
+                self._pool.discard(self._key, self._conn)
+                self._conn = None
+        self._response.close()
+
+    def getcode(self):
+        return self._response.status
+
+    def geturl(self):
+        return self.url
+
+    def info(self):
+        return self._response.headers
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ConnectionPool:
+    """A thread-safe pool of keep-alive HTTP(S) connections.
+
+    maxsize is the number of idle connections kept for each host, and
+    connections left idle for longer than idle_timeout seconds are
+    closed instead of reused. If max_connections is given, no more than
+    that many connections (in use or idle) are open to a host at once;
+    requests wait up to wait_timeout seconds (None waits as long as it
+    takes) for one to be free, then raise urllib.error.URLError.
+    timeout is used for requests that don't give one, and defaults to
+    the socket module's default timeout, as it does for
+    urllib.request.urlopen. urlopen() behaves like
+    urllib.request.urlopen: redirects are followed and error statuses
+    raise urllib.error.HTTPError.
+    """
+
+    redirect_codes = (301, 302, 303, 307, 308)
+
+    def __init__(self, maxsize=10, idle_timeout=60,
+                 timeout=socket._GLOBAL_DEFAULT_TIMEOUT, max_redirects=5,
+                 max_connections=None, wait_timeout=None):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.max_connections = max_connections
+        self.wait_timeout = wait_timeout
+        self._idle = {}
+        # Number of open connections to each host
+        self._open = {}
+        self._lock = threading.Condition()
+
+    def _new_connection(self, key, timeout):
+        scheme, netloc = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=timeout)
+        elif scheme == 'http':
+            return http.client.HTTPConnection(netloc, timeout=timeout)
+        raise urllib.error.URLError('unknown url type: %s' % (scheme,))
+
+    def get_connection(self, key, timeout):
+        """Return (connection, reused) for the (scheme, netloc) key,
+        waiting for one if the host has max_connections open already.
+        """
+        stale = []
+        conn = None
+        reserved = False
+        deadline = None
+        if self.wait_timeout is not None:
+            deadline = time.monotonic() + self.wait_timeout
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                idle = self._idle.get(key)
+                while idle:
+                    candidate, released = idle.pop()
+                    if now - released < self.idle_timeout:
+                        conn = candidate
+                        break
+                    stale.append(candidate)
+                    self._open[key] -= 1
+                if conn is not None:
+                    break
+                open_count = self._open.get(key, 0)
+                if self.max_connections is None or open_count < self.max_connections:
+                    self._open[key] = open_count + 1
+                    reserved = True
+                    break
+                if deadline is not None and now >= deadline:
+                    break
+                self._lock.wait(None if deadline is None else deadline - now)
+            if stale:
+                self._lock.notify_all()
+        for stale_conn in stale:
+            stale_conn.close()
+        if conn is None:
+            if not reserved:
+                raise urllib.error.URLError('Too many connections to %s' % (key[1],))
+            try:
+                return self._new_connection(key, timeout), False
+            except Exception:
+                self._closed(key)
+                raise
+        conn.timeout = timeout
+        if conn.sock is not None:
+            # The default timeout is a marker, not a value for settimeout
+            if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+                conn.sock.settimeout(socket.getdefaulttimeout())
+            else:
+                conn.sock.settimeout(timeout)
+        return conn, True
+
+    def _closed(self, key, count=1):
+        """Count connections to a host as closed, letting waiting
+        requests open new ones.
+        """
+        with self._lock:
+            self._open[key] -= count
+            self._lock.notify_all()
+
+    def release(self, key, conn):
+        """Return a connection to the pool, or close it if the pool for
+        its host is full.
+        """
+        with self._lock:
+            idle = self._idle.setdefault(key, deque())
+            if len(idle) < self.maxsize:
+                idle.append((conn, time.monotonic()))
+                self._lock.notify_all()
+                return
+        self.discard(key, conn)
+
+    def discard(self, key, conn):
+        """Close a connection taken from the pool that can't be reused."""
+        conn.close()
+        self._closed(key)
+
+    def evict_idle(self):
+        """Close every connection that has been idle too long.
+
+        Idle connections are also checked when they would be reused, so
+        this only frees the sockets of hosts that aren't requested any
+        more. Call it now and then (such as from a timer thread, or
+        between batches) in long running processes.
+        """
+        now = time.monotonic()
+        stale = []
+        with self._lock:
+            for key, idle in self._idle.items():
+                while idle and now - idle[0][1] >= self.idle_timeout:
+                    stale.append((key, idle.popleft()[0]))
+        for key, conn in stale:
+            self.discard(key, conn)
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle_lists = list(self._idle.items())
+            self._idle = {}
+        for key, idle in idle_lists:
+            for conn, _ in idle:
+                self.discard(key, conn)
+
+    def request(self, method, url, data=None, headers=None, timeout=None):
+        """Make a single request without following redirects."""
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path or '/'
+        if parts.query:
+            path = '%s?%s' % (path, parts.query)
+        if timeout is None:
+            timeout = self.timeout
+        while True:
+            conn, reused = self.get_connection(key, timeout)
+            try:
+                conn.request(method, path, body=data, headers=headers or {})
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError,
+                    BrokenPipeError):
+                self.discard(key, conn)
+                # The server closed an idle connection, so retry on
+                # another one
+                if reused:
+                    continue
+                raise
+            except Exception:
+                self.discard(key, conn)
+                raise
+            return PooledResponse(response, url, self, key, conn)
+
+    def urlopen(self, url, data=None, timeout=None):
+        """Open url (a string or urllib.request.Request) using a pooled
+        connection.
+        """
+        if isinstance(url, urllib.request.Request):
+            method = url.get_method()
+            headers = dict(url.header_items())
+            data = url.data
+            url = url.full_url
+        else:
+            method = 'POST' if data is not None else 'GET'
+            headers = {}
+        for _ in range(self.max_redirects + 1):
+            response = self.request(method, url, data, headers, timeout)
+            location = response.headers.get('Location')
+            if response.status in self.redirect_codes and location:
+                # Read the body so the connection can be reused
+                response.read()
+                response.close()
+                url = urllib.parse.urljoin(url, location)
+                if response.status == 303 or (
+                        response.status in (301, 302) and method == 'POST'):
+                    method, data = 'GET', None
+                # The Host header belongs to the original URL
+                headers.pop('Host', None)
+                continue
+            if response.status >= 400:
+                response.read()
+                response.close()
+                raise urllib.error.HTTPError(url, response.status,
+                                             response.reason,
+                                             response.headers, None)
+            return response
+        raise urllib.error.HTTPError(url, response.status,
+                                     'Too many redirects',
+                                     response.headers, None)
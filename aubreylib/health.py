@@ -0,0 +1,151 @@
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class LocationHealth:
+    """Health of a single metadata/static file location."""
+
+    __slots__ = ('state', 'failures', 'latency', 'opened_at', 'trial_running')
+
+    def __init__(self):
+        self.state = CLOSED
+        # Consecutive failures
+        self.failures = 0
+        # Moving average of successful response times in seconds
+        self.latency = None
+        self.opened_at = None
+        self.trial_running = False
+
+    def to_dict(self):
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'latency': self.latency,
+        }
+
+
+class HealthTracker:
+    """Circuit breaker for locations, shared between threads.
+
+    A location's circuit opens after failure_threshold consecutive
+    failures (timeouts, refused connections, ...) and it is skipped while
+    open. After reset_timeout seconds a single request is let through
+    (half-open): success closes the circuit, failure opens it again.
+    Locations that have failed recently but are still closed are tried
+    after the healthy ones. If recovery_interval is given, open locations
+    are also checked in a background thread with checker(location), which
+    returns True if the location is reachable.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=30,
+                 latency_weight=0.2, recovery_interval=None, checker=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.latency_weight = latency_weight
+        self.recovery_interval = recovery_interval
+        self.checker = checker
+        self._locations = {}
+        self._lock = threading.Lock()
+        self._recovery_thread = None
+        self._stopped = threading.Event()
+
+    def _get(self, location):
+        health = self._locations.get(location)
+        if health is None:
+            health = self._locations[location] = LocationHealth()
+        return health
+
+    def allow(self, location):
+        """Return True if a request may be made to the location."""
+        with self._lock:
+            health = self._locations.get(location)
+            if health is None or health.state == CLOSED:
+                return True
+            if health.state == OPEN:
+                if time.monotonic() - health.opened_at < self.reset_timeout:
+                    return False
+                health.state = HALF_OPEN
+            # Only one trial request at a time while half-open
+            if health.trial_running:
+                return False
+            health.trial_running = True
+            return True
+
+    def record_success(self, location, latency=None):
+        with self._lock:
+            health = self._get(location)
+            health.state = CLOSED
+            health.failures = 0
+            health.trial_running = False
+            if latency is not None:
+                if health.latency is None:
+                    health.latency = latency
+                else:
+                    health.latency += self.latency_weight * (latency - health.latency)
+
+    def record_failure(self, location):
+        with self._lock:
+            health = self._get(location)
+            health.failures += 1
+            health.trial_running = False
+            if health.state == HALF_OPEN or health.failures >= self.failure_threshold:
+                health.state = OPEN
+                health.opened_at = time.monotonic()
+                start_recovery = self.recovery_interval is not None \
+                    and self.checker is not None and self._recovery_thread is None
+                if start_recovery:
+                    self._recovery_thread = threading.Thread(
+                        target=self._recover, name='aubreylib-location-recovery', daemon=True)
+            else:
+                start_recovery = False
+        if start_recovery:
+            self._recovery_thread.start()
+
+    def order(self, locations):
+        """Return the locations that may be tried, healthy ones first,
+        otherwise keeping their order.
+        """
+        with self._lock:
+            healthy = []
+            failing = []
+            for location in locations:
+                health = self._locations.get(location)
+                if health is None or health.failures == 0:
+                    healthy.append(location)
+                elif health.state != OPEN or \
+                        time.monotonic() - health.opened_at >= self.reset_timeout:
+                    failing.append(location)
+        return healthy + failing
+
+    def get_state(self, location):
+        with self._lock:
+            health = self._locations.get(location)
+            return CLOSED if health is None else health.state
+
+    def snapshot(self):
+        """Return the health of every known location as dicts."""
+        with self._lock:
+            return {location: health.to_dict()
+                    for location, health in self._locations.items()}
+
+    def stop(self):
+        """Stop the background recovery checks."""
+        self._stopped.set()
+
+    def _recover(self):
+        while not self._stopped.wait(self.recovery_interval):
+            with self._lock:
+                open_locations = [location for location, health in self._locations.items()
+                                  if health.state == OPEN]
+            for location in open_locations:
+                start = time.monotonic()
+                try:
+                    reachable = self.checker(location)
+                except Exception:
+                    reachable = False
+                if reachable:
+                    self.record_success(location, time.monotonic() - start)
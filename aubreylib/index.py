@@ -0,0 +1,144 @@
+import mmap
+import os
+
+from aubreylib.system import make_pair_path
+
+INDEX_HEADER = b'aubreylib-location-index 1\n'
+
+
+class LocationIndex:
+    """Map of meta_id to the (metadata location, static file location)
+    holding the object, so it can be found without probing every
+    location. Either location may be None.
+    """
+
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+
+    def get(self, meta_id):
+        return self.entries.get(meta_id, (None, None))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def save(self, path):
+        """Write the index as a sorted text file that MappedLocationIndex
+        can search without loading it.
+        """
+        locations = sorted(set(location for entry in self.entries.values()
+                               for location in entry if location is not None))
+        location_numbers = {location: str(number) for number, location in enumerate(locations)}
+        location_numbers[None] = '-'
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as index_file:
+            index_file.write(INDEX_HEADER)
+            index_file.write(b'%d\n' % (len(locations),))
+            for location in locations:
+                index_file.write(location.encode('utf-8') + b'\n')
+            for meta_id in sorted(self.entries, key=lambda meta_id: meta_id.encode('utf-8')):
+                metadata_location, static_location = self.entries[meta_id]
+                index_file.write(('%s\t%s\t%s\n' % (
+                    meta_id,
+                    location_numbers[metadata_location],
+                    location_numbers[static_location],
+                )).encode('utf-8'))
+        os.replace(temp_path, path)
+
+
+class MappedLocationIndex:
+    """Read-only LocationIndex backed by a memory-mapped index file (see
+    LocationIndex.save). Lookups are a binary search of the file, so the
+    index isn't loaded into memory and is shared by every process that
+    maps it. Pickling it (e.g. for worker processes) only keeps the path.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as index_file:
+            self._mmap = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(INDEX_HEADER)] != INDEX_HEADER:
+            self._mmap.close()
+            raise ValueError('Not a location index: %s' % (path,))
+        offset = len(INDEX_HEADER)
+        line_end = self._mmap.find(b'\n', offset)
+        count = int(self._mmap[offset:line_end])
+        self.locations = []
+        for _ in range(count):
+            offset = line_end + 1
+            line_end = self._mmap.find(b'\n', offset)
+            self.locations.append(self._mmap[offset:line_end].decode('utf-8'))
+        self._start = line_end + 1
+
+    def _location(self, number):
+        return None if number == b'-' else self.locations[int(number)]
+
+    def get(self, meta_id):
+        key = meta_id.encode('utf-8')
+        data = self._mmap
+        low, high = self._start, len(data)
+        while low < high:
+            middle = (low + high) // 2
+            # The record holding the middle byte
+            line_start = data.rfind(b'\n', self._start - 1, middle) + 1
+            line_end = data.find(b'\n', middle)
+            record_id, metadata_number, static_number = \
+                data[line_start:line_end].split(b'\t')
+            if record_id == key:
+                return self._location(metadata_number), self._location(static_number)
+            if record_id < key:
+                low = line_end + 1
+            else:
+                high = line_start
+        return None, None
+
+    def __len__(self):
+        return self._mmap[self._start:].count(b'\n')
+
+    def close(self):
+        self._mmap.close()
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+
+def find_local_objects(location):
+    """Yield the meta_ids of the objects in the pairtree of a file://
+    location.
+    """
+    root = location.replace('file:/', '', 1) if location.startswith('file://') else location
+    root = os.path.normpath(root)
+    for dirpath, dirnames, filenames in os.walk(root):
+        object_path = '/' + os.path.relpath(dirpath, root)
+        name = os.path.basename(dirpath)
+        # Object directories are named by their meta_id at the end of
+        # their pair path, and aren't searched further
+        if name and object_path == make_pair_path(name):
+            dirnames[:] = []
+            yield name
+        else:
+            dirnames.sort()
+
+
+def build_location_index(metadata_locations, static_locations):
+    """Build a LocationIndex by listing the objects in each file://
+    location. An object found in several locations is indexed with the
+    first, as get_file_system would find it.
+    """
+    entries = {}
+    for position, locations in enumerate((metadata_locations, static_locations)):
+        for location in locations:
+            if not location.startswith('file://'):
+                continue
+            for meta_id in find_local_objects(location):
+                entry = entries.setdefault(meta_id, [None, None])
+                if entry[position] is None:
+                    entry[position] = location
+    return LocationIndex({meta_id: tuple(entry) for meta_id, entry in entries.items()})
+
+
+def load_location_index(path):
+    """Memory map a location index file written by LocationIndex.save."""
+    return MappedLocationIndex(path)
@@ -0,0 +1,109 @@
+import threading
+import time
+
+# Callables given each finished Span. Spans are only timed when there is
+# at least one sink.
+sinks = []
+_sinks_lock = threading.Lock()
+
+
+class Span:
+    """A timed stage or I/O call. attributes may include bytes, host,
+    cache ('hit' or 'miss'), meta_id, and error (the exception name if
+    the stage failed).
+    """
+
+    __slots__ = ('name', 'attributes', 'start', 'duration')
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.start = None
+        self.duration = None
+
+    def set(self, **attributes):
+        """Add attributes learned while the span is running."""
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attributes['error'] = exc_type.__name__
+        for sink in sinks:
+            try:
+                sink(self)
+            except Exception:
+                pass
+        return False
+
+    def __repr__(self):
+        return 'Span(%r, %r, duration=%r)' % (self.name, self.attributes, self.duration)
+
+
+class NullSpan:
+    """Stand-in for Span when there are no sinks."""
+
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+def span(name, **attributes):
+    """Return a context manager that times the named stage and gives it to
+    every sink when it finishes.
+    """
+    if not sinks:
+        return NULL_SPAN
+    return Span(name, attributes)
+
+
+def add_sink(sink):
+    """Register a callable to be given each finished Span."""
+    global sinks
+    with _sinks_lock:
+        # Replaced rather than changed, so spans finishing in other
+        # threads can loop over the list safely
+        sinks = sinks + [sink]
+
+
+def remove_sink(sink):
+    global sinks
+    with _sinks_lock:
+        sinks = [registered for registered in sinks if registered is not sink]
+
+
+class SpanRecorder:
+    """Sink that keeps the spans it is given."""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def __call__(self, finished_span):
+        with self._lock:
+            self.spans.append(finished_span)
+
+    def names(self):
+        return [recorded.name for recorded in self.spans]
+
+    def get(self, name):
+        """Return the recorded spans with the given name."""
+        return [recorded for recorded in self.spans if recorded.name == name]
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
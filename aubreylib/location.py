@@ -0,0 +1,122 @@
+import functools
+import urllib.parse
+
+# Kinds of location
+METADATA = 'metadata'
+STATIC = 'static'
+
+URL_PREFIXES = ('http://', 'https://')
+
+_UNSET = object()
+_django_settings = _UNSET
+
+
+class Location:
+    """A metadata/static file location string, parsed once."""
+
+    __slots__ = ('url', 'scheme', 'host', 'path', 'local_path')
+
+    def __init__(self, url):
+        self.url = url
+        self.scheme, self.host, self.path = urllib.parse.urlsplit(url)[:3]
+        if url.startswith('file://'):
+            # file://disk2/ is the local directory /disk2/
+            self.local_path = url.replace('file:/', '')
+        else:
+            self.local_path = None
+
+    @property
+    def is_local(self):
+        return self.local_path is not None
+
+    @property
+    def is_remote(self):
+        return self.url.startswith(URL_PREFIXES)
+
+    def __repr__(self):
+        return 'Location(%r)' % (self.url,)
+
+
+@functools.lru_cache(maxsize=1024)
+def get_location(url):
+    """Return the parsed Location of a location string."""
+    return Location(url)
+
+
+def is_url(file_name):
+    """Return True if the file name is an http(s) url."""
+    return file_name.startswith(URL_PREFIXES)
+
+
+class LocationConfig:
+    """The metadata and static file locations, parsed once.
+
+    metadata_locations and static_file_locations keep the location
+    strings in order, for the functions that take location tuples,
+    all_locations has both (metadata locations first), and locations has
+    the (kind, Location) of each. repository_admin_contact is the
+    REPOSITORY_ADMIN_DICT setting, or None. source is the pair of setting
+    tuples a config built by from_settings was built from.
+    """
+
+    def __init__(self, metadata_locations=(), static_file_locations=(),
+                 repository_admin_contact=None):
+        self.metadata_locations = tuple(metadata_locations)
+        self.static_file_locations = tuple(static_file_locations)
+        self.all_locations = self.metadata_locations + self.static_file_locations
+        self.repository_admin_contact = repository_admin_contact
+        self.source = None
+        self.locations = tuple(
+            [(METADATA, get_location(url)) for url in self.metadata_locations] +
+            [(STATIC, get_location(url)) for url in self.static_file_locations]
+        )
+        self._kinds = {}
+        for kind, location in self.locations:
+            self._kinds.setdefault(location.url, kind)
+
+    def get_kind(self, url):
+        """Return the kind of a configured location, or None."""
+        return self._kinds.get(url)
+
+    @classmethod
+    def from_settings(cls):
+        """Build the config from the Django settings, or the aubreylib
+        METADATA_LOCATIONS and STATIC_FILE_LOCATIONS without Django.
+        """
+        metadata_locations, static_file_locations = get_settings_locations()
+        settings = get_django_settings()
+        try:
+            repository_admin_contact = getattr(settings, 'REPOSITORY_ADMIN_DICT', None)
+        except Exception:
+            repository_admin_contact = None
+        config = cls(metadata_locations, static_file_locations, repository_admin_contact)
+        config.source = (metadata_locations, static_file_locations)
+        return config
+
+
+def get_django_settings():
+    """Return django.conf.settings, or None without Django. The import is
+    only tried once.
+    """
+    global _django_settings
+    if _django_settings is _UNSET:
+        try:
+            from django.conf import settings
+        except Exception:
+            settings = None
+        _django_settings = settings
+    return _django_settings
+
+
+def get_settings_locations():
+    """Return the (metadata, static file) location tuples from the Django
+    settings, or the aubreylib defaults.
+    """
+    settings = get_django_settings()
+    if settings is not None:
+        try:
+            return settings.METADATA_LOCATIONS, settings.STATIC_FILE_LOCATIONS
+        except Exception:
+            pass
+    import aubreylib
+    return aubreylib.METADATA_LOCATIONS, aubreylib.STATIC_FILE_LOCATIONS
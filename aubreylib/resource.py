@@ -1,16 +1,92 @@
+import abc
 import os
 import re
-from io import BytesIO
 import datetime
-import urllib.request
+import hashlib
 import json
+import pickle
+import sys
+import urllib.error
+import urllib.request
+import zlib
+from collections import namedtuple
+from concurrent.futures import (FIRST_COMPLETED, Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
 from lxml import etree
-from aubreylib.system import get_file_system, open_system_file, get_pair_path
+from aubreylib import system
+from aubreylib.cache import LocationCache
+from aubreylib.connection import ConnectionPool
+from aubreylib.instrument import span
+from aubreylib.location import is_url
+from aubreylib.system import (create_valid_url, get_content_length, get_file_system,
+                              open_system_file, open_url, get_pair_path)
 from aubreylib import VIEW_TYPE_MIMETYPES, EMAIL_REGEX
-from pyuntl.untldoc import untlxml2pydict, untldict2py
+from pyuntl.quality import COMMON_DEFAULT_ATTRIBUTE_VALUES, DEFAULT_VALUE_REGEX
+from pyuntl.untldoc import untlxml2pydict
 from pyuntl.util import untldict_normalizer
 
 
+# Bump when the ResourceObject attributes change so old snapshots are ignored
+SNAPSHOT_VERSION = 3
+
+# Attributes that aren't saved in snapshots. They are either settings
+# given to the constructor, or data that can change without the METS
+# changing (the embargo status depends on today's date, and the static
+# files can move to another location). The settings that change the
+# built object (use and compact) are part of the snapshot key instead,
+# so compact and dictionary objects have separate snapshots.
+SNAPSHOT_EXCLUDED_ATTRIBUTES = (
+    'metadataLocations',
+    'staticFileLocations',
+    'use',
+    'location_cache',
+    'location_index',
+    'location_config',
+    'desc_metadata_cache',
+    'concurrent_probe',
+    'probe_grace_period',
+    'compact',
+    'getCopy_data',
+    'embargo_info',
+    'files_system',
+)
+
+
+# File attributes left out of the file pointers
+IGNORED_FILE_ATTRIBUTES = frozenset([
+    'ID',
+    'CHECKSUMTYPE',
+    'CHECKSUM',
+    'CREATED',
+    'OWNERID',
+])
+
+# Weight of each UNTL element in the completeness score, copied from
+# pyuntl.quality.determine_completeness (which keeps them in a local dict)
+COMPLETENESS_WEIGHTS = {
+    'title': 10,
+    'description': 1,
+    'language': 1,
+    'collection': 10,
+    'institution': 10,
+    'resourceType': 5,
+    'format': 1,
+    'subject': 1,
+    'meta': 20,
+}
+COMPLETENESS_TOTAL_WEIGHT = float(sum(COMPLETENESS_WEIGHTS.values()))
+
+# Transcription vtt_kind values, in FileSet vtt_kinds bit order
+VTT_KINDS = (
+    'captions',
+    'subtitles',
+    'descriptions',
+    'chapters',
+    'thumbnails',
+    'metadata',
+)
+
+
 class ResourceObjectException(Exception):
     """Base exception for the Resource object creation"""
 
@@ -21,18 +97,28 @@ class ResourceObjectException(Exception):
         return "%s" % (self.value,)
 
 
-def get_mets_record_system(meta_id, pair_path, metadata_locations):
+def get_mets_record_system(meta_id, pair_path, metadata_locations, cache=None,
+                           concurrent=False, grace_period=0, location_index=None):
     """ Find the system that the METS file is on, and return the file, and the
          metadata system path """
+    if location_index is not None:
+        indexed_location = location_index.get(meta_id)[0]
+    else:
+        indexed_location = None
 
     # Add the METS filename to the pair path
     resource_path = os.path.join(pair_path, meta_id + '.mets.xml')
     # Locate the system the mets file is on, and the mets file itself
-    mets_filename, metadata_system = get_file_system(
-        meta_id,
-        resource_path,
-        metadata_locations,
-    )
+    with span('resource.locate_mets', meta_id=meta_id):
+        mets_filename, metadata_system = get_file_system(
+            meta_id,
+            resource_path,
+            metadata_locations,
+            cache=cache,
+            concurrent=concurrent,
+            grace_period=grace_period,
+            indexed_location=indexed_location,
+        )
 
     if mets_filename is None or metadata_system is None:
         raise ResourceObjectException("Mets file could not be located on " +
@@ -44,12 +130,25 @@ def get_mets_record_system(meta_id, pair_path, metadata_locations):
 
 def get_desc_metadata(metadata_filename, metadata_type):
     """ Get the descriptive metadata for the object """
-    # Open and read the metadata file into a BytesIO filehandle
-    metadata_filehandle = open_system_file(metadata_filename)
-    metadata_stringfile = BytesIO(metadata_filehandle.read())
-    if metadata_type == 'UNTL':
-        # Get the untl descriptive metadata dictionary
-        desc_metadata = untlxml2pydict(metadata_stringfile)
+    if metadata_type != 'UNTL':
+        raise ResourceObjectException("Not a supported descriptive " +
+                                      "metadata type.")
+    return parse_desc_metadata(open_system_file(metadata_filename, cache=True))
+
+
+def parse_desc_metadata(metadata_filehandle):
+    """Parse and normalize UNTL descriptive metadata from an open file or
+    url response, closing it when done.
+    """
+    with span('resource.desc_metadata') as desc_span:
+        # Let the parser read the file in chunks as it goes, rather than
+        # holding a copy of the whole document
+        try:
+            # Get the untl descriptive metadata dictionary
+            desc_metadata = untlxml2pydict(metadata_filehandle)
+            desc_span.set(bytes=get_bytes_read(metadata_filehandle))
+        finally:
+            metadata_filehandle.close()
         normalize_required = {
             'subject': ['LCSH', 'UNTL-BS'],
         }
@@ -59,9 +158,120 @@ def get_desc_metadata(metadata_filename, metadata_type):
             normalize_required,
         )
         return normalized_metadata
-    else:
+
+
+def get_cached_desc_metadata(metadata_filename, metadata_type, cache):
+    """Return the descriptive metadata and its completeness, from the
+    cache (anything with get and set methods, such as an LRUCache) if the
+    file hasn't changed.
+
+    Local files are identified by their modification time and size.
+    Remote files are fetched with a conditional request using the ETag
+    and Last-Modified of the cached version. Each call returns a new copy
+    of the cached metadata.
+    """
+    if metadata_type != 'UNTL':
         raise ResourceObjectException("Not a supported descriptive " +
                                       "metadata type.")
+    with span('resource.desc_metadata_cache') as cache_span:
+        if not is_url(metadata_filename):
+            return get_cached_local_desc_metadata(metadata_filename, cache, cache_span)
+        return get_cached_url_desc_metadata(metadata_filename, cache, cache_span)
+
+
+def get_desc_metadata_key(metadata_filename, *identity):
+    return 'aubreylib-desc-md:%s:%s' % (
+        metadata_filename, ':'.join(str(value) for value in identity))
+
+
+def get_cached_local_desc_metadata(metadata_filename, cache, cache_span):
+    try:
+        stat = os.stat(metadata_filename)
+    except OSError:
+        # Let opening the file report the error
+        cache_span.set(cache='miss')
+        return get_desc_metadata_entry(open_system_file(metadata_filename))
+    cache_key = get_desc_metadata_key(metadata_filename, stat.st_mtime_ns, stat.st_size)
+    entry = load_desc_metadata_entry(cache.get(cache_key))
+    if entry is not None:
+        cache_span.set(cache='hit')
+        return entry
+    cache_span.set(cache='miss')
+    entry = get_desc_metadata_entry(open_system_file(metadata_filename))
+    cache.set(cache_key, dump_desc_metadata_entry(None, entry))
+    return entry
+
+
+def get_cached_url_desc_metadata(metadata_filename, cache, cache_span):
+    cache_key = get_desc_metadata_key(metadata_filename)
+    cached = cache.get(cache_key)
+    validators = None
+    if cached is not None:
+        try:
+            validators, entry = pickle.loads(cached)
+        except Exception:
+            cached = None
+    headers = {}
+    if cached is not None:
+        etag, last_modified = validators
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+    try:
+        response = open_url(urllib.request.Request(
+            create_valid_url(metadata_filename), None, headers))
+    except urllib.error.HTTPError as e:
+        if e.code != 304 or cached is None:
+            response = open_system_file(metadata_filename, cache=True)
+        else:
+            response = e
+    except Exception:
+        # Try the other systems
+        response = open_system_file(metadata_filename, cache=True)
+    if response.getcode() == 304 and cached is not None:
+        response.close()
+        cache_span.set(cache='hit')
+        return entry
+    cache_span.set(cache='miss')
+    info = response.info()
+    validators = (info.get('ETag'), info.get('Last-Modified'))
+    entry = get_desc_metadata_entry(response)
+    if any(validators):
+        cache.set(cache_key, dump_desc_metadata_entry(validators, entry))
+    return entry
+
+
+def get_desc_metadata_entry(metadata_filehandle):
+    """Parse the descriptive metadata and compute its completeness."""
+    desc_MD = parse_desc_metadata(metadata_filehandle)
+    return desc_MD, get_completeness(desc_MD)
+
+
+def dump_desc_metadata_entry(validators, entry):
+    return pickle.dumps((validators, entry), pickle.HIGHEST_PROTOCOL)
+
+
+def load_desc_metadata_entry(cached):
+    """Return the (desc_MD, completeness) of a cached local file entry, or
+    None if there isn't a usable one.
+    """
+    if cached is None:
+        return None
+    try:
+        return pickle.loads(cached)[1]
+    except Exception:
+        return None
+
+
+def get_bytes_read(filehandle):
+    """Return the number of bytes read from a file or the size of a url
+    response, or None if unknown.
+    """
+    try:
+        return filehandle.tell()
+    except Exception:
+        return get_content_length(filehandle)
 
 
 def get_getCopy_data(getCopy_url, meta_id):
@@ -69,11 +279,14 @@ def get_getCopy_data(getCopy_url, meta_id):
     # Create the url for the record
     record_url = "%s%s/" % (getCopy_url, meta_id)
     # Try returning the getCopy data
-    try:
-        return json.loads(urllib.request.urlopen(record_url).read())
-    except Exception:
-        # Otherwise, return an empty dictionary
-        return {}
+    with span('resource.getCopy', meta_id=meta_id) as getCopy_span:
+        try:
+            data = open_url(record_url).read()
+            getCopy_span.set(bytes=len(data))
+            return json.loads(data)
+        except Exception:
+            # Otherwise, return an empty dictionary
+            return {}
 
 
 def get_author_citation_string(desc_MD):
@@ -109,13 +322,44 @@ def get_author_citation_string(desc_MD):
     return author_citation_string
 
 
+def get_completeness(desc_MD):
+    """Return the completeness score of a UNTL dictionary, the same as
+    untldict2py(desc_MD).completeness, without building the element tree.
+    """
+    score = 0
+    for tag, weight in COMPLETENESS_WEIGHTS.items():
+        for element in desc_MD.get(tag, ()):
+            content = element.get('content')
+            # Elements with child elements have no content of their own
+            if not isinstance(content, str):
+                continue
+            content = content.strip().lower()
+            if not content or content in COMMON_DEFAULT_ATTRIBUTE_VALUES or \
+                    DEFAULT_VALUE_REGEX.search(content):
+                continue
+            # Only <meta qualifier="system"> records count
+            if tag == 'meta' and (element.get('qualifier') or '').strip() != 'system':
+                continue
+            score += weight
+            break
+    return score / COMPLETENESS_TOTAL_WEIGHT
+
+
+def get_completeness_scores(desc_MDs):
+    """Return the completeness score of each UNTL dictionary, for
+    reporting on many records.
+    """
+    return [get_completeness(desc_MD) for desc_MD in desc_MDs]
+
+
 def get_dimensions_data(mets_file):
     """Return the JSON dimensions file path if it exists."""
     dimensions_file = mets_file.replace('.mets.xml', '.json')
-    try:
-        return json.load(open_system_file(dimensions_file))
-    except Exception:
-        return None
+    with span('resource.dimensions'):
+        try:
+            return json.load(open_system_file(dimensions_file, cache=True))
+        except Exception:
+            return None
 
 
 def get_transcriptions_data(meta_id, resource_type, transcriptions_server_url):
@@ -123,15 +367,257 @@ def get_transcriptions_data(meta_id, resource_type, transcriptions_server_url):
     if resource_type not in ['sound', 'video'] or not transcriptions_server_url:
         return {}
     transcriptions_url = '{}/{}/'.format(transcriptions_server_url.rstrip('/'), meta_id)
+    with span('resource.transcriptions', meta_id=meta_id) as transcriptions_span:
+        try:
+            data = open_url(transcriptions_url, cache=True).read()
+            transcriptions_span.set(bytes=len(data))
+            return json.loads(data)
+        except Exception:
+            # Otherwise, return an empty dictionary
+            return {}
+
+
+def get_snapshot_key(meta_id, acp_modification_date, use, compact=False,
+                     transcriptions_server_url=None):
+    """Return the snapshot cache key for a version of an object built
+    with the given options, which change the built object.
+    """
+    options = repr((sorted(use.items()), bool(compact), transcriptions_server_url))
+    return 'aubreylib-snapshot:%s:%s:%s:%s' % (
+        SNAPSHOT_VERSION, meta_id, acp_modification_date,
+        hashlib.sha1(options.encode('utf-8')).hexdigest()[:16])
+
+
+class MetsIndex:
+    """Lookups into the fileSec and structMap of a METS document, built in
+    a single pass over each section.
+    """
+
+    def __init__(self, fileSec, structMap):
+        self.fileSec = fileSec
+        self.structMap = structMap
+        self.root = structMap.getroottree().getroot()
+        # Create an index for files within the fileSec file_ID --> file_group
+        self.file_groups = {}
+        for file_group in fileSec:
+            for file_item in file_group:
+                self.file_groups[file_item.get('ID')] = file_group
+        # div TYPE --> divs in document order
+        self.divs = {}
+        # FILEID --> (fileSet div, manifestation div) of the first pointer
+        # to the file within a manifestation
+        self.file_pointers = {}
+        self.first_fileSet = None
+        manifestation = None
+        for element in structMap.iter('div', 'fptr'):
+            if element.tag == 'div':
+                div_type = element.get('TYPE')
+                self.divs.setdefault(div_type, []).append(element)
+                if div_type == 'manifestation':
+                    manifestation = element
+                elif div_type == 'fileSet' and self.first_fileSet is None \
+                        and element.get('ORDER') == '1':
+                    self.first_fileSet = element
+                continue
+            # Pointers are only indexed if they are within the last
+            # manifestation seen
+            if manifestation is None or manifestation not in element.iterancestors('div'):
+                continue
+            self.file_pointers.setdefault(
+                element.get('FILEID'), (element.getparent(), manifestation))
+
+    def get_divs(self, div_type):
+        return self.divs.get(div_type, [])
+
+
+def get_vtt_kinds(transcriptions_list):
+    """Return a bitmask of the VTT_KINDS found in the transcriptions."""
+    vtt_kinds = 0
+    for transcription_dict in transcriptions_list:
+        vtt_kind = transcription_dict.get('vtt_kind')
+        if vtt_kind in VTT_KINDS:
+            vtt_kinds |= 1 << VTT_KINDS.index(vtt_kind)
+    return vtt_kinds
+
+
+class CompactRecord(abc.ABC):
+    """Base for the compact, read-only records used by ResourceObjects built
+    with compact=True. They support the same read access as the
+    dictionaries they replace, so templates work with either. Subclasses
+    provide keys() and __getitem__; the rest is built on those.
+    """
+
+    __slots__ = ()
+
+    @abc.abstractmethod
+    def keys(self):
+        """Return the keys the record has, like dict.keys()."""
+
+    @abc.abstractmethod
+    def __getitem__(self, key):
+        """Return the value for key, raising KeyError if it isn't set."""
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, CompactRecord):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.to_dict())
+
+
+class FilePointer(CompactRecord):
+    """A file pointer with the common attributes stored in slots. Repeated
+    values (MIMETYPE and USE) are interned so every pointer shares them.
+    """
+
+    fields = ('MIMETYPE', 'USE', 'SIZE', 'flocat', 'width', 'height')
+    interned_fields = ('MIMETYPE', 'USE')
+    __slots__ = fields + ('_extra',)
+
+    def __init__(self, file_dict):
+        extra = None
+        for key, value in file_dict.items():
+            if key in self.fields:
+                if key in self.interned_fields and isinstance(value, str):
+                    value = sys.intern(value)
+                setattr(self, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        self._extra = extra
+
+    def keys(self):
+        keys = [key for key in self.fields if hasattr(self, key)]
+        if self._extra:
+            keys.extend(self._extra)
+        return keys
+
+    def __getitem__(self, key):
+        if key in self.fields:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+
+class FileSet(CompactRecord):
+    """A fileSet with its has_vtt_* flags stored as a VTT_KINDS bitmask."""
+
+    fields = ('file_ptrs', 'order_label', 'label', 'fileSet_view_type', 'zoom')
+    __slots__ = fields + ('vtt_kinds',)
+
+    def __init__(self, file_ptrs, order_label, label, fileSet_view_type, zoom,
+                 vtt_kinds):
+        self.file_ptrs = file_ptrs
+        self.order_label = order_label
+        self.label = label
+        self.fileSet_view_type = fileSet_view_type
+        self.zoom = zoom
+        self.vtt_kinds = vtt_kinds
+
+    def keys(self):
+        return list(self.fields) + ['has_vtt_%s' % (kind,) for kind in VTT_KINDS]
+
+    def __getitem__(self, key):
+        if key in self.fields:
+            return getattr(self, key)
+        if key.startswith('has_vtt_') and key[8:] in VTT_KINDS:
+            return bool(self.vtt_kinds & (1 << VTT_KINDS.index(key[8:])))
+        raise KeyError(key)
+
+
+def get_file_records(file_group, xlink_namespace):
+    """Return (attributes, FLocat href) records for the files in a fileGrp
+    element. The href is None if the file has no FLocat.
+    """
+    records = []
+    for file_item in file_group:
+        href = None
+        for flocat in file_item:
+            href = flocat.get(xlink_namespace + 'href')
+            break
+        records.append((dict(file_item.attrib), href))
+    return records
+
+
+def submit_task(executor, function, *args, **kwargs):
+    """Run function on the executor and return its Future, or run it right
+    away and return a completed Future if there is no executor.
+    """
+    if executor is not None:
+        return executor.submit(system.bind_thread_settings(function), *args, **kwargs)
+    future = Future()
     try:
-        return json.loads(urllib.request.urlopen(transcriptions_url).read())
-    except Exception:
-        # Otherwise, return an empty dictionary
-        return {}
+        future.set_result(function(*args, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+    return future
 
 
 class ResourceObject:
 
+    # Attributes of lazy objects that are computed on first access, and
+    # the method that computes each attribute's group
+    LAZY_ATTRIBUTES = {
+        'dimensions': 'load_dimensions',
+        'getCopy_data': 'load_getCopy_data',
+        'desc_MD': 'load_desc_metadata',
+        'transcriptions': 'load_transcriptions',
+        'thumbnail_mimetype': 'load_images',
+        'thumbnail_filename': 'load_images',
+        'thumbnail_icon_mimetype': 'load_images',
+        'files_system': 'load_images',
+        'files_system_file': 'load_images',
+        'square_mimetype': 'load_images',
+        'square_filename': 'load_images',
+        'medium_mimetype': 'load_images',
+        'medium_filename': 'load_images',
+        'primary_fileSet': 'load_images',
+        'primary_manifestation': 'load_images',
+        'manifestation_dict': 'load_manifestations',
+        'manifestation_view_types': 'load_manifestations',
+        'manifestation_labels': 'load_manifestations',
+        'pdf_dict': 'load_manifestations',
+        'wacz_dict': 'load_manifestations',
+        'embargo_info': 'get_embargo',
+        'author_citation_string': 'load_author_citation_string',
+        'completeness': 'load_completeness',
+    }
+
     def __init__(self, identifier, metadataLocations, staticFileLocations,
                  mimetypeIconsPath, use, **kwargs):
         """
@@ -141,8 +627,125 @@ class ResourceObject:
         self.metadataLocations = metadataLocations
         self.staticFileLocations = staticFileLocations
         self.use = use
+        # Optional LocationCache shared between objects
+        self.location_cache = kwargs.get('location_cache', None)
+        # Optional LocationIndex (or MappedLocationIndex) of the locations
+        # holding each object, checked before probing
+        self.location_index = kwargs.get('location_index', None)
+        # Optional LocationConfig, otherwise system.get_location_config
+        # is used
+        self.location_config = kwargs.get('location_config', None)
+        # Optional cache (anything with get and set methods) of parsed
+        # descriptive metadata, keyed by the metadata file's version
+        self.desc_metadata_cache = kwargs.get('desc_metadata_cache', None)
+        # Store file pointers and fileSets as compact records
+        self.compact = kwargs.get('compact', False)
+        # Probe all metadata/static locations at once
+        self.concurrent_probe = kwargs.get('concurrent_probe', False)
+        self.probe_grace_period = kwargs.get('probe_grace_period', 0)
         getCopy_url = kwargs.get('getCopy_url', None)
+        self._getCopy_url = getCopy_url
+        self._transcriptions_server_url = kwargs.get('transcriptions_server_url')
+        # Compute each group of attributes when it is first accessed,
+        # instead of building everything now
+        lazy = kwargs.get('lazy', False)
+        # Build the object while the METS is read with iterparse, freeing
+        # each part of the document once it has been used (not lazy)
+        streaming = kwargs.get('streaming', False) and not lazy
+        # Optional cache (anything with get and set methods, such as a
+        # DirectoryCache or Django cache) of built objects, keyed by the
+        # METS LASTMODDATE, use, compact and transcriptions_server_url. The
+        # transcriptions are saved with the object, so they are only
+        # fetched again once the METS changes.
+        snapshot_cache = kwargs.get('snapshot_cache', None)
+        # Optional concurrent.futures executor used to fetch the dimensions
+        # and getCopy data while the METS document is read
+        executor = kwargs.get('executor', None)
+
+        self.locate_mets(identifier)
+        # If a getCopy url was given
+        if getCopy_url and not lazy:
+            getCopy_data = submit_task(executor, get_getCopy_data,
+                                       getCopy_url, self.meta_id)
+        else:
+            getCopy_data = None
+        # Get dimensions data (not needed if a snapshot is used)
+        if snapshot_cache is None and not lazy and not streaming:
+            dimensions = submit_task(executor, get_dimensions_data,
+                                     self.mets_filename)
+        # Open the METS document
+        try:
+            mets_filehandle = open_system_file(self.mets_filename, cache=True)
+        except Exception:
+            raise ResourceObjectException("Could not open the Mets " +
+                                          "document: %s" % (self.meta_id))
+        if streaming:
+            try:
+                with span('resource.stream_mets', meta_id=self.meta_id):
+                    restored = self.load_streamed_mets(mets_filehandle, executor,
+                                                       snapshot_cache)
+            finally:
+                mets_filehandle.close()
+            self.getCopy_data = getCopy_data.result() if getCopy_data else {}
+            self.get_embargo()
+            self.defer_completeness()
+            if restored:
+                self.locate_static_files()
+            else:
+                self.load_author_citation_string()
+                if snapshot_cache is not None:
+                    self.save_snapshot(snapshot_cache)
+            return
+        # Parse the mets document
+        with span('resource.parse_mets', meta_id=self.meta_id):
+            parsed_mets = etree.parse(mets_filehandle)
+        # Close the mets file
+        mets_filehandle.close()
+        # Get the acp last modification date (useful for ETag hashes)
+        self.get_acp_last_modification_date(parsed_mets)
+        # Get Metadata File
+        self.get_metadata_file(parsed_mets)
+        if snapshot_cache is not None:
+            # Restore the object if this version has been built before
+            if self.load_snapshot(snapshot_cache):
+                if lazy:
+                    self._pending_loaders = {'load_getCopy_data'}
+                else:
+                    self.getCopy_data = getCopy_data.result() if getCopy_data else {}
+                self.locate_static_files()
+                self.get_embargo()
+                self.defer_completeness()
+                return
+            if not lazy:
+                dimensions = submit_task(executor, get_dimensions_data,
+                                         self.mets_filename)
+        if lazy:
+            # Keep the parsed METS until the structMap has been read
+            self._parsed_mets = parsed_mets
+            self._pending_loaders = set(self.LAZY_ATTRIBUTES.values())
+            return
+        # Get the descriptive metadata
+        self.load_desc_metadata()
+        # Get transcriptions data
+        self.load_transcriptions()
+        # Wait for the dimensions and getCopy data
+        self.dimensions = dimensions.result()
+        self.getCopy_data = getCopy_data.result() if getCopy_data else {}
+        # Get the fileSets within the fileSec
+        self.get_structMap(parsed_mets)
+        # Get the embargo information, if it exists
+        self.get_embargo()
+        # Get the author citation string
+        self.load_author_citation_string()
+        # The completeness score is only computed if it is used
+        self.defer_completeness()
+        if snapshot_cache is not None:
+            self.save_snapshot(snapshot_cache)
 
+    def locate_mets(self, identifier):
+        """Set the meta_id, pair path, METS file name and metadata system
+        of the object.
+        """
         # if the identifier is a filename, use that.  Otherwise treat it as
         # a meta_id
         if identifier.endswith(".mets.xml"):
@@ -160,33 +763,75 @@ class ResourceObject:
             self.mets_filename, self.metadata_system = get_mets_record_system(
                 self.meta_id,
                 self.pair_path,
-                metadataLocations
+                self.metadataLocations,
+                cache=self.location_cache,
+                concurrent=self.concurrent_probe,
+                grace_period=self.probe_grace_period,
+                location_index=self.location_index,
             )
-        # Get dimensions data
+
+    def __getattr__(self, name):
+        """Compute a lazy attribute group the first time one of its
+        attributes is accessed.
+        """
+        pending = self.__dict__.get('_pending_loaders')
+        loader = self.LAZY_ATTRIBUTES.get(name)
+        # A loader is only run once, so attributes it doesn't set (or reads
+        # while it is running) raise AttributeError as usual
+        if not pending or loader not in pending:
+            raise AttributeError("'%s' object has no attribute '%s'"
+                                 % (type(self).__name__, name))
+        self.run_loader(loader)
+        return object.__getattribute__(self, name)
+
+    def __getstate__(self):
+        """Load any remaining lazy attributes and drop the parts of the
+        object that can't be pickled.
+        """
+        self.load_all()
+        state = self.__dict__.copy()
+        state['location_cache'] = None
+        state['location_index'] = None
+        state['desc_metadata_cache'] = None
+        state.pop('_mets_index', None)
+        return state
+
+    def run_loader(self, loader):
+        """Run a pending lazy attribute group loader."""
+        pending = self._pending_loaders
+        pending.discard(loader)
+        getattr(self, loader)()
+        # Free the METS tree once nothing else needs it
+        if not pending & {'load_images', 'load_manifestations'}:
+            self.__dict__.pop('_parsed_mets', None)
+            self.__dict__.pop('_mets_index', None)
+
+    def load_all(self):
+        """Compute every lazy attribute group that hasn't been loaded."""
+        pending = self.__dict__.get('_pending_loaders')
+        while pending:
+            self.run_loader(next(iter(pending)))
+
+    def load_dimensions(self):
         self.dimensions = get_dimensions_data(self.mets_filename)
-        # If a getCopy url was given
-        if getCopy_url:
-            self.getCopy_data = get_getCopy_data(getCopy_url, self.meta_id)
+
+    def load_getCopy_data(self):
+        if self._getCopy_url:
+            self.getCopy_data = get_getCopy_data(self._getCopy_url, self.meta_id)
         else:
             self.getCopy_data = {}
-        # Open the METS document
-        try:
-            mets_filehandle = open_system_file(self.mets_filename)
-        except Exception:
-            raise ResourceObjectException("Could not open the Mets " +
-                                          "document: %s" % (self.meta_id))
-        # Parse the mets document
-        parsed_mets = etree.parse(mets_filehandle)
-        # Close the mets file
-        mets_filehandle.close()
-        # Get the acp last modification date (useful for ETag hashes)
-        self.get_acp_last_modification_date(parsed_mets)
-        # Get Metadata File
-        self.get_metadata_file(parsed_mets)
-        # Get the descriptive metadata
-        self.desc_MD = get_desc_metadata(self.metadata_file,
-                                         self.metadata_type)
-        # Get transcriptions data
+
+    def load_desc_metadata(self):
+        """Get the descriptive metadata"""
+        if self.desc_metadata_cache is not None:
+            self.desc_MD, self.completeness = get_cached_desc_metadata(
+                self.metadata_file, self.metadata_type, self.desc_metadata_cache)
+        else:
+            self.desc_MD = get_desc_metadata(self.metadata_file,
+                                             self.metadata_type)
+
+    def load_transcriptions(self):
+        """Get the transcriptions data for the resource type"""
         resource_type = self.desc_MD.get('resourceType')
         if resource_type:
             resource_type = resource_type[0].get('content')
@@ -195,15 +840,196 @@ class ResourceObject:
         self.transcriptions = get_transcriptions_data(
             meta_id=self.meta_id,
             resource_type=resource_type,
-            transcriptions_server_url=kwargs.get('transcriptions_server_url'),
+            transcriptions_server_url=self._transcriptions_server_url,
         )
-        # Get the fileSets within the fileSec
-        self.get_structMap(parsed_mets)
-        # Get the embargo information, if it exists
-        self.get_embargo()
-        # Get the author citation string
-        self.author_citation_string = get_author_citation_string(self.desc_MD)
-        self.completeness = untldict2py(self.desc_MD).completeness
+
+    def load_images(self):
+        """Get the thumbnail, square and medium images"""
+        index = self.get_mets_index(self._parsed_mets)
+        self.get_images(index.fileSec, index.structMap)
+
+    def load_manifestations(self):
+        """Get the manifestations and their fileSets"""
+        index = self.get_mets_index(self._parsed_mets)
+        fileSec, structMap = index.fileSec, index.structMap
+        self.get_manifestations(fileSec, structMap, index.file_groups)
+
+    def load_author_citation_string(self):
+        with span('resource.author_citation', meta_id=self.meta_id):
+            self.author_citation_string = get_author_citation_string(self.desc_MD)
+
+    def load_completeness(self):
+        desc_MD = self.desc_MD
+        # The cached descriptive metadata comes with its completeness
+        if 'completeness' in self.__dict__:
+            return
+        with span('resource.completeness', meta_id=self.meta_id):
+            self.completeness = get_completeness(desc_MD)
+
+    def defer_completeness(self):
+        """Compute the completeness score when it is first accessed,
+        unless it is already known.
+        """
+        if 'completeness' not in self.__dict__:
+            self.__dict__.setdefault('_pending_loaders', set()).add('load_completeness')
+
+    def load_streamed_mets(self, mets_filehandle, executor=None,
+                           snapshot_cache=None):
+        """Read the METS with iterparse, setting the METS, descriptive
+        metadata, transcriptions, manifestation and image attributes.
+
+        Each section is cleared once it has been used, and file groups are
+        kept as compact records, so memory use follows the size of the
+        manifestation data rather than the METS tree. Return True if the
+        object was restored from the snapshot cache instead.
+        """
+        self.acp_modification_date = None
+        defaults_set = False
+        dimensions = None
+        text_data = None
+        fileSec = None
+        structMap = None
+        first_fileSet = None
+        # Compact fileSec and structMap lookups in place of MetsIndex's
+        file_groups = {}
+        file_pointers = {}
+        for _, element in etree.iterparse(mets_filehandle, events=('end',)):
+            tag = element.tag
+            parent = element.getparent()
+            # Set the defaults once the header (and a snapshot restore) is
+            # past, so they don't hide the restored attributes
+            if not defaults_set and tag != 'metsHdr' and parent is not None \
+                    and parent.getparent() is None:
+                self.manifestation_dict = {}
+                self.manifestation_view_types = {}
+                self.manifestation_labels = {}
+                self.pdf_dict = {}
+                self.wacz_dict = {}
+                defaults_set = True
+            if tag == 'metsHdr' and parent.getparent() is None:
+                # Get the acp last modification date
+                self.get_acp_last_modification_date(element.getroottree())
+                if snapshot_cache is not None and self.load_snapshot(snapshot_cache):
+                    return True
+                element.clear()
+            elif tag == 'dmdSec' and text_data is None:
+                # Get Metadata File, then fetch the descriptive metadata and
+                # transcriptions while the rest of the METS is read
+                self.get_metadata_file(element.getroottree())
+                text_data = submit_task(executor, self.load_text_data)
+                dimensions = submit_task(executor, get_dimensions_data,
+                                         self.mets_filename)
+                element.clear()
+            elif tag == 'fileGrp':
+                if text_data is None:
+                    raise ResourceObjectException("Descriptive metadata not " +
+                                                  "defined before the fileSec " +
+                                                  "in the METS file.")
+                records = get_file_records(element, self.xlink_namespace)
+                for file_item in element:
+                    file_groups[file_item.get('ID')] = records
+                element.clear()
+            elif tag == 'fileSec':
+                fileSec = element
+            elif tag == 'div' and element.get('TYPE') == 'manifestation':
+                if fileSec is None:
+                    raise ResourceObjectException("structMap found before " +
+                                                  "fileSec in the METS file.")
+                # The file pointers need the dimensions and transcriptions
+                if dimensions is not None:
+                    self.dimensions = dimensions.result()
+                    text_data.result()
+                    dimensions = None
+                manifest_num = int(element.get("ORDER", '1'))
+                self.manifestation_dict[manifest_num] = self.get_fileSets(
+                    element, fileSec, file_groups)
+                for fptr in element.iter('fptr'):
+                    # Stand-ins for the divs; only their ORDER is read
+                    file_pointers.setdefault(fptr.get('FILEID'), (
+                        {'ORDER': fptr.getparent().get('ORDER')},
+                        {'ORDER': element.get('ORDER')},
+                    ))
+                # Keep only the first fileSet, which is used when there
+                # isn't a thumbnail
+                for fileSet in list(element):
+                    if first_fileSet is None and fileSet.get('TYPE') == 'fileSet' \
+                            and fileSet.get('ORDER') == '1':
+                        first_fileSet = fileSet
+                    else:
+                        element.remove(fileSet)
+            elif tag == 'structMap':
+                structMap = element
+            elif parent is not None and parent.getparent() is None:
+                # Other top level sections (amdSec, ...) aren't used
+                element.clear()
+        if structMap is None:
+            raise ResourceObjectException("\"structMap\" not found in " +
+                                          "METS file.")
+        if fileSec is None:
+            raise ResourceObjectException("\"fileSec\" not found in METS " +
+                                          "file.")
+        # Objects without manifestations still need these
+        if dimensions is not None:
+            self.dimensions = dimensions.result()
+            text_data.result()
+        # Get the thumbnail, square and medium images from what is left of
+        # the structMap
+        index = MetsIndex(fileSec, structMap)
+        index.file_groups = file_groups
+        index.file_pointers = file_pointers
+        self._mets_index = index
+        self.get_images(fileSec, structMap)
+        del self._mets_index
+        return False
+
+    def load_text_data(self):
+        """Get the descriptive metadata and transcriptions"""
+        self.load_desc_metadata()
+        self.load_transcriptions()
+
+    def load_snapshot(self, snapshot_cache):
+        """Restore the object from a snapshot of the same METS version.
+        Return True if a usable snapshot was found.
+        """
+        if self.acp_modification_date is None:
+            return False
+        with span('resource.load_snapshot', meta_id=self.meta_id) as snapshot_span:
+            try:
+                snapshot = snapshot_cache.get(
+                    self.get_snapshot_key())
+                if snapshot is None:
+                    snapshot_span.set(cache='miss')
+                    return False
+                snapshot_span.set(cache='hit', bytes=len(snapshot))
+                state = pickle.loads(zlib.decompress(snapshot))
+            except Exception:
+                return False
+        # Attributes already set for this object (such as where its files
+        # were located) are kept
+        for key, value in state.items():
+            self.__dict__.setdefault(key, value)
+        return True
+
+    def get_snapshot_key(self):
+        """Return the snapshot cache key of the object."""
+        return get_snapshot_key(self.meta_id, self.acp_modification_date, self.use,
+                                self.compact, self._transcriptions_server_url)
+
+    def save_snapshot(self, snapshot_cache):
+        """Save the built object state to the snapshot cache."""
+        if self.acp_modification_date is None:
+            return
+        state = {
+            key: value for key, value in self.__dict__.items()
+            if key not in SNAPSHOT_EXCLUDED_ATTRIBUTES and not key.startswith('_')
+        }
+        try:
+            snapshot_cache.set(
+                self.get_snapshot_key(),
+                zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL)),
+            )
+        except Exception:
+            pass
 
     def get_metadata_file(self, parsed_mets):
         md_xpath = parsed_mets.getroot().xpath(
@@ -254,6 +1080,32 @@ class ResourceObject:
 
     # Grabs the structMap portion of the mets xml file
     def get_structMap(self, parsed_mets):
+        index = self.get_mets_index(parsed_mets)
+        fileSec, structMap = index.fileSec, index.structMap
+        # Get the thumbnail, square and medium images
+        self.get_images(fileSec, structMap)
+        # Get METS files Manifestations->FileSets->FilePointers
+        self.get_manifestations(fileSec, structMap, index.file_groups)
+        # Don't hold on to the METS tree
+        del self._mets_index
+
+    def get_mets_index(self, mets_node):
+        """Return the MetsIndex of the METS document that mets_node (the
+        parsed METS or one of its elements) belongs to.
+        """
+        if isinstance(mets_node, etree._ElementTree):
+            parsed_mets = mets_node
+        else:
+            parsed_mets = mets_node.getroottree()
+        index = self.__dict__.get('_mets_index')
+        if index is None or index.root is not parsed_mets.getroot():
+            with span('resource.mets_index', meta_id=self.meta_id):
+                index = MetsIndex(*self.get_structMap_sections(parsed_mets))
+            self._mets_index = index
+        return index
+
+    def get_structMap_sections(self, parsed_mets):
+        """Return the fileSec and structMap elements of the METS"""
         root = parsed_mets.getroot()
         structMap_xpath = root.xpath(
             './/structMap',
@@ -273,19 +1125,16 @@ class ResourceObject:
         else:
             raise ResourceObjectException("\"fileSec\" not found in METS " +
                                           "file.")
-        # Create an index for files within the fileSec file_ID --> file_group
-        file_index = {}
-        for file_group in fileSec:
-            for file_item in file_group:
-                file_index[file_item.get('ID')] = file_group
-        # Get thumbnail
-        self.thumbnail(fileSec, structMap)
-        # Get square
-        self.square(fileSec, structMap)
-        # Get medium
-        self.medium(fileSec, structMap)
-        # Get METS files Manifestations->FileSets->FilePointers
-        self.get_manifestations(fileSec, structMap, file_index)
+        return fileSec, structMap
+
+    def get_images(self, fileSec, structMap):
+        with span('resource.images', meta_id=self.meta_id):
+            # Get thumbnail
+            self.thumbnail(fileSec, structMap)
+            # Get square
+            self.square(fileSec, structMap)
+            # Get medium
+            self.medium(fileSec, structMap)
 
     def thumbnail(self, fileSec, structMap):
         """Get the thumbnail filename, mimetype, and system file lives on"""
@@ -293,6 +1142,33 @@ class ResourceObject:
         self.thumbnail_mimetype = thumbnail_dict['image_mimetype']
         self.thumbnail_filename = thumbnail_dict['image_filename']
         self.files_system = thumbnail_dict['files_system']
+        # Kept so the system can be found again (see locate_static_files)
+        self.files_system_file = thumbnail_dict['file_name']
+
+    def locate_static_files(self):
+        """Find the system the static files are on for an object restored
+        from a snapshot, as they may have moved since it was saved.
+        """
+        file_name = getattr(self, 'files_system_file', None)
+        if not file_name:
+            return
+        if self.location_index is not None:
+            indexed_location = self.location_index.get(self.meta_id)[1]
+        else:
+            indexed_location = None
+        files_system = get_file_system(
+            self.meta_id,
+            file_name,
+            self.staticFileLocations,
+            cache=self.location_cache,
+            concurrent=self.concurrent_probe,
+            grace_period=self.probe_grace_period,
+            indexed_location=indexed_location,
+        )[1]
+        if files_system is None:
+            raise ResourceObjectException("Location of static files " +
+                                          "could not be determined.")
+        self.files_system = files_system
 
     def square(self, fileSec, structMap):
         """Get the square image for the object"""
@@ -311,24 +1187,15 @@ class ResourceObject:
         for fptr in thumbnail:
             thumbnail_id = fptr.get('FILEID')
             break
-        manifestations = structMap.xpath(
-            './/div[@TYPE=\"manifestation\"]',
-        )
-        for manifest in manifestations:
-            thumbnail_ptr = manifest.xpath(
-                ".//fptr[@FILEID=\"%s\"]" % (thumbnail_id),
-            )
-            if len(thumbnail_ptr) != 0:
-                self.primary_fileSet = thumbnail_ptr[0].getparent()\
-                    .get('ORDER')
-                self.primary_manifestation = manifest.get('ORDER')
-                break
+        file_pointer = self.get_mets_index(structMap).file_pointers.get(thumbnail_id)
+        if file_pointer is not None:
+            fileSet, manifest = file_pointer
+            self.primary_fileSet = fileSet.get('ORDER')
+            self.primary_manifestation = manifest.get('ORDER')
 
     def get_image_data(self, size_name, fileSec, structMap):
         """Based on the size name, return the file information dictionary"""
-        found_image_xpath = structMap.xpath(
-            ".//div[@TYPE=\"%s\"]" % (size_name),
-        )
+        found_image_xpath = self.get_mets_index(structMap).get_divs(size_name)
         # Make sure the image exists in the METS file structMap
         if len(found_image_xpath) > 0:
             found_image = found_image_xpath[0]
@@ -348,6 +1215,7 @@ class ResourceObject:
                 'image_mimetype': file_dict['file_mimetype'],
                 'image_filename': file_dict['file_name'],
                 'files_system': file_dict['files_system'],
+                'file_name': file_dict['file_name'],
             }
         # else if we've been able to determine the first fileSet
         elif first_fileset is not None:
@@ -359,6 +1227,7 @@ class ResourceObject:
                 'image_mimetype': None,
                 'image_filename': None,
                 'files_system': file_dict['files_system'],
+                'file_name': file_dict['file_name'],
             }
         else:
             raise ResourceObjectException("The first fileSet was not found " +
@@ -377,17 +1246,26 @@ class ResourceObject:
             'file_name': None,
             'files_system': None,
         }
-        fileSet_dict = self.get_file_pointers(fileSet, fileSec)
+        fileSet_dict = self.get_file_pointers(fileSet, fileSec,
+                                              with_dimensions=False)
         for ptr in fileSet_dict['file_ptrs']:
             if ptr.get("USE") == str(use_type):
                 file_name = ptr.get('flocat')
                 # Get the file_system that static content is on if
                 # not already found
                 if getattr(self, 'files_system', None) is None:
+                    if self.location_index is not None:
+                        indexed_location = self.location_index.get(self.meta_id)[1]
+                    else:
+                        indexed_location = None
                     stripped_name, files_system = get_file_system(
                         self.meta_id,
                         file_name,
                         self.staticFileLocations,
+                        cache=self.location_cache,
+                        concurrent=self.concurrent_probe,
+                        grace_period=self.probe_grace_period,
+                        indexed_location=indexed_location,
                     )
                 else:
                     files_system = self.files_system
@@ -404,12 +1282,10 @@ class ResourceObject:
 
     def get_first_fileSet(self, structMap):
         """Gets the first fileSet div in the StructMap"""
-        first_fileset_xpath = structMap.xpath(
-            './/div[@TYPE=\"fileSet\"][@ORDER=\"1\"]',
-        )
+        first_fileset = self.get_mets_index(structMap).first_fileSet
         # Make sure the first fileset exists in the METS file
-        if len(first_fileset_xpath) > 0:
-            return first_fileset_xpath[0]
+        if first_fileset is not None:
+            return first_fileset
         else:
             raise ResourceObjectException("The first fileSet was not " +
                                           "found in the METS file.")
@@ -419,15 +1295,14 @@ class ResourceObject:
         self.manifestation_dict = {}
         self.manifestation_view_types = {}
         self.manifestation_labels = {}
-        manifestations = structMap.xpath(
-            './/div[@TYPE=\"manifestation\"]',
-        )
-        for manifest in manifestations:
-            # Get the manifestation order number
-            manifest_num = int(manifest.get("ORDER", '1'))
-            # Get the fileSet dictionary and manifestation view type
-            manifest_data = self.get_fileSets(manifest, fileSec, file_index)
-            self.manifestation_dict[manifest_num] = manifest_data
+        manifestations = self.get_mets_index(structMap).get_divs('manifestation')
+        with span('resource.manifestations', meta_id=self.meta_id):
+            for manifest in manifestations:
+                # Get the manifestation order number
+                manifest_num = int(manifest.get("ORDER", '1'))
+                # Get the fileSet dictionary and manifestation view type
+                manifest_data = self.get_fileSets(manifest, fileSec, file_index)
+                self.manifestation_dict[manifest_num] = manifest_data
 
     # Creates the fileSet dictionary, indexed by ORDER
     def get_fileSets(self, manifest, fileSec, file_index):
@@ -452,19 +1327,30 @@ class ResourceObject:
             # Add the transcriptions (if any) to the file_ptrs list.
             fileSet_data['file_ptrs'].extend(fileSet_transcriptions)
             # Create the fileSet data dictionary
-            manifestation_dict[fileSet_num] = {
-                'file_ptrs': fileSet_data['file_ptrs'],
-                'order_label': fileSet.get("ORDERLABEL"),
-                'label': fileSet.get("LABEL"),
-                'fileSet_view_type': fileSet_data['fileSet_view_type'],
-                'zoom': fileSet_data['zoom'],
-                'has_vtt_captions': self.has_vtt_type(fileSet_transcriptions, 'captions'),
-                'has_vtt_subtitles': self.has_vtt_type(fileSet_transcriptions, 'subtitles'),
-                'has_vtt_descriptions': self.has_vtt_type(fileSet_transcriptions, 'descriptions'),
-                'has_vtt_chapters': self.has_vtt_type(fileSet_transcriptions, 'chapters'),
-                'has_vtt_thumbnails': self.has_vtt_type(fileSet_transcriptions, 'thumbnails'),
-                'has_vtt_metadata': self.has_vtt_type(fileSet_transcriptions, 'metadata'),
-            }
+            if self.compact:
+                manifestation_dict[fileSet_num] = FileSet(
+                    fileSet_data['file_ptrs'],
+                    fileSet.get("ORDERLABEL"),
+                    fileSet.get("LABEL"),
+                    fileSet_data['fileSet_view_type'],
+                    fileSet_data['zoom'],
+                    get_vtt_kinds(fileSet_transcriptions),
+                )
+            else:
+                manifestation_dict[fileSet_num] = {
+                    'file_ptrs': fileSet_data['file_ptrs'],
+                    'order_label': fileSet.get("ORDERLABEL"),
+                    'label': fileSet.get("LABEL"),
+                    'fileSet_view_type': fileSet_data['fileSet_view_type'],
+                    'zoom': fileSet_data['zoom'],
+                    'has_vtt_captions': self.has_vtt_type(fileSet_transcriptions, 'captions'),
+                    'has_vtt_subtitles': self.has_vtt_type(fileSet_transcriptions, 'subtitles'),
+                    'has_vtt_descriptions': self.has_vtt_type(fileSet_transcriptions,
+                                                              'descriptions'),
+                    'has_vtt_chapters': self.has_vtt_type(fileSet_transcriptions, 'chapters'),
+                    'has_vtt_thumbnails': self.has_vtt_type(fileSet_transcriptions, 'thumbnails'),
+                    'has_vtt_metadata': self.has_vtt_type(fileSet_transcriptions, 'metadata'),
+                }
             # If the manifestation doesn't have a view
             # type (return as a regular file)
             if manifest_view_type == '':
@@ -509,7 +1395,8 @@ class ResourceObject:
     # Gets the file pointers from the given fileset
     # (searches for the fileset starting from the fileSec node or fileGrp node)
     # Slowest part of getting the resource object
-    def get_file_pointers(self, fileset, fileSec, file_index=None):
+    def get_file_pointers(self, fileset, fileSec, file_index=None,
+                          with_dimensions=True):
         # get the first file id file from the fileSec
         for fptr in fileset:
             first_file = fptr
@@ -519,45 +1406,39 @@ class ResourceObject:
             # get the group from the file index with FILEID as the key
             file_group = file_index[first_file.get('FILEID')]
         else:
-            # Look up the file with xpath using the file id
-            ptrs = fileSec.xpath(
-                './/file[@ID=\"' + first_file.get('FILEID') + '\"]',
-            )
-            # get the group that first file is in
-            file_group = ptrs[0].getparent()
+            # Look up the file's group in the METS index
+            file_group = self.get_mets_index(fileset).file_groups[
+                first_file.get('FILEID')]
+        # Streamed METS documents keep their file groups as records
+        if not isinstance(file_group, list):
+            file_group = get_file_records(file_group, self.xlink_namespace)
         # Loop through the file group and return all the file objects
         file_ptrs = []
         fileSet_view_type = ''
         zoom = False
         pdf = None
         wacz = None
-        for ptr_file in file_group:
+        high_res_use = str(self.use['high_res'])
+        zoom_use = str(self.use['zoom'])
+        for ptr_file, href in file_group:
             file_dict = {}
-            ignore_ptr_field = [
-                'ID',
-                'CHECKSUMTYPE',
-                'CHECKSUM',
-                'CREATED',
-                'OWNERID',
-            ]
             # Loop through file attributes and keep the ones that matter
-            for key, value in ptr_file.attrib.items():
+            for key, value in ptr_file.items():
                 if key == 'SIZE':
-                    if ptr_file.get('USE') == str(self.use['high_res']):
+                    if ptr_file.get('USE') == high_res_use:
                         file_dict[key] = value
-                elif key not in ignore_ptr_field:
+                elif key not in IGNORED_FILE_ATTRIBUTES:
                     file_dict[key] = value
             # Get the file location
-            for flocat in ptr_file:
-                file_dict['flocat'] = flocat.get(self.xlink_namespace + 'href')
-                break
+            if href is not None:
+                file_dict['flocat'] = href
             # Get the height/width
-            if self.dimensions is not None:
+            if with_dimensions and self.dimensions is not None:
                 file_dimensions = self.dimensions.get(file_dict['flocat'])
                 if file_dimensions is not None:
                     file_dict.update(file_dimensions)
             # if it is the main fileSet file
-            if ptr_file.get('USE') == str(self.use['high_res']):
+            if ptr_file.get('USE') == high_res_use:
                 # Get the file pointer view type
                 ptr_view_type = VIEW_TYPE_MIMETYPES.get(
                     file_dict.get('MIMETYPE', None),
@@ -581,9 +1462,12 @@ class ResourceObject:
                     # The manifestation has no specific view type
                     fileSet_view_type = VIEW_TYPE_MIMETYPES[None]
             # See if the object has zoom capabilities
-            elif ptr_file.get('USE') == str(self.use['zoom']):
+            elif ptr_file.get('USE') == zoom_use:
                 zoom = True
-            file_ptrs.append(file_dict)
+            if self.compact:
+                file_ptrs.append(FilePointer(file_dict))
+            else:
+                file_ptrs.append(file_dict)
         # Create the fileSet dictionary
         fileSet_dict = {
             'file_ptrs': file_ptrs,
@@ -600,72 +1484,283 @@ class ResourceObject:
             (dict with 'name' and 'email'), author contact list
             (list of dicts with 'name' and 'email')
         """
-        self.embargo_info = {
-            'embargo': False,
-            'embargo_until_date': None,
-            'repository_admin_contact': {},
-            'author_contact_list': [],
-        }
-        # Get the list of date fields
-        date_list = self.desc_MD.get('date', [])
-        # Loop through the date fields list
-        for date_item in date_list:
-            # if there is a date field with a qualifier of embargoUntil
-            if date_item.get('qualifier', None) == 'embargoUntil':
-                # Has an embargo date
-                # set it to true until it's determined if it's expired
-                self.embargo_info['embargo'] = True
-                # Get the date from the content
-                date_string = date_item.get('content', None)
-                # Try to parse out the date
-                try:
-                    embargo_date = datetime.datetime.strptime(
-                        date_string, "%Y-%m-%d")
-                except Exception:
-                    pass
-                else:
-                    self.embargo_info['embargo_until_date'] = date_string
-                    # Determine if the embargo is still effective,
-                    # based on today's date
-                    if embargo_date.date() <= datetime.date.today():
-                        self.embargo_info['embargo'] = False
+        with span('resource.embargo', meta_id=self.meta_id):
+            self.embargo_info = {
+                'embargo': False,
+                'embargo_until_date': None,
+                'repository_admin_contact': {},
+                'author_contact_list': [],
+            }
+            # Get the list of date fields
+            date_list = self.desc_MD.get('date', [])
+            # Loop through the date fields list
+            for date_item in date_list:
+                # if there is a date field with a qualifier of embargoUntil
+                if date_item.get('qualifier', None) == 'embargoUntil':
+                    # Has an embargo date
+                    # set it to true until it's determined if it's expired
+                    self.embargo_info['embargo'] = True
+                    # Get the date from the content
+                    date_string = date_item.get('content', None)
+                    # Try to parse out the date
+                    try:
+                        embargo_date = datetime.datetime.strptime(
+                            date_string, "%Y-%m-%d")
+                    except Exception:
+                        pass
                     else:
-                        self.embargo_info['embargo'] = True
-                # Set the default repository contact
-                default_contact = {
-                    'name': 'Repository Administrator',
-                    'email': 'untrepository@unt.edu',
-                }
-                # Try to get the repository admin dictionary from settings
-                # otherwise use the default
-                try:
-                    from django.conf import settings
-                    self.embargo_info['repository_admin_contact'] =\
-                        getattr(
-                            settings,
-                            'REPOSITORY_ADMIN_DICT',
-                            default_contact,
-                        )
-                except Exception:
+                        self.embargo_info['embargo_until_date'] = date_string
+                        # Determine if the embargo is still effective,
+                        # based on today's date
+                        if embargo_date.date() <= datetime.date.today():
+                            self.embargo_info['embargo'] = False
+                        else:
+                            self.embargo_info['embargo'] = True
+                    # Set the default repository contact
+                    default_contact = {
+                        'name': 'Repository Administrator',
+                        'email': 'untrepository@unt.edu',
+                    }
+                    # Try to get the repository admin dictionary from settings
+                    # otherwise use the default
+                    location_config = self.location_config or \
+                        system.get_location_config()
                     self.embargo_info['repository_admin_contact'] =\
-                        default_contact
-                # Attempt to get the author e-mails from the creator field
-                creator_list = self.desc_MD.get('creator', [])
-                # Loop through the creator fields list
-                for creator_item in creator_list:
-                    creator_content = creator_item.get('content', {})
-                    # if there is a creator field is a dictionary
-                    if isinstance(creator_content, dict):
-                        creator_info = creator_content.get('info', '')
-                        # Perform an e-mail search within the author info
-                        email_result = re.compile(EMAIL_REGEX).search(
-                            creator_info, 0)
-                        # Check and see if there is an e-mail in the info
-                        if email_result is not None:
-                            creator_email = email_result.group(0)
-                            creator_name = creator_content.get('name',
-                                                               'No Name ' +
-                                                               'Listed')
-                            self.embargo_info['author_contact_list'].append(
-                                {'name': creator_name, 'email': creator_email}
-                            )
+                        location_config.repository_admin_contact or default_contact
+                    # Attempt to get the author e-mails from the creator field
+                    creator_list = self.desc_MD.get('creator', [])
+                    # Loop through the creator fields list
+                    for creator_item in creator_list:
+                        creator_content = creator_item.get('content', {})
+                        # if there is a creator field is a dictionary
+                        if isinstance(creator_content, dict):
+                            creator_info = creator_content.get('info', '')
+                            # Perform an e-mail search within the author info
+                            email_result = re.compile(EMAIL_REGEX).search(
+                                creator_info, 0)
+                            # Check and see if there is an e-mail in the info
+                            if email_result is not None:
+                                creator_email = email_result.group(0)
+                                creator_name = creator_content.get('name',
+                                                                   'No Name ' +
+                                                                   'Listed')
+                                self.embargo_info['author_contact_list'].append(
+                                    {'name': creator_name, 'email': creator_email}
+                                )
+
+
+class ThumbnailObject(ResourceObject):
+    """The images of an object: the thumbnail, square and medium
+    attributes, thumbnail_icon_mimetype (None unless the object has no
+    thumbnail), files_system and the primary fileSet and manifestation.
+
+    They are read from the METS fileSec and structMap alone; the
+    descriptive metadata, dimensions, getCopy data, transcriptions and
+    manifestations aren't loaded. Takes the same location options as
+    ResourceObject (location_cache, location_index, concurrent_probe and
+    probe_grace_period).
+    """
+
+    def __init__(self, identifier, metadataLocations, staticFileLocations, use,
+                 **kwargs):
+        self.metadataLocations = metadataLocations
+        self.staticFileLocations = staticFileLocations
+        self.use = use
+        self.compact = False
+        self.location_cache = kwargs.get('location_cache', None)
+        self.location_index = kwargs.get('location_index', None)
+        self.concurrent_probe = kwargs.get('concurrent_probe', False)
+        self.probe_grace_period = kwargs.get('probe_grace_period', 0)
+        self.locate_mets(identifier)
+        try:
+            mets_filehandle = open_system_file(self.mets_filename, cache=True)
+        except Exception:
+            raise ResourceObjectException("Could not open the Mets " +
+                                          "document: %s" % (self.meta_id))
+        try:
+            with span('resource.thumbnail_mets', meta_id=self.meta_id):
+                fileSec, structMap = self.read_image_sections(mets_filehandle)
+        finally:
+            mets_filehandle.close()
+        self.thumbnail_icon_mimetype = None
+        self._mets_index = MetsIndex(fileSec, structMap)
+        self.get_images(fileSec, structMap)
+        del self._mets_index
+
+    def read_image_sections(self, mets_filehandle):
+        """Read the METS with iterparse up to the end of the structMap,
+        returning the fileSec and structMap. Other sections are cleared
+        as they are read.
+        """
+        self.acp_modification_date = None
+        self.xlink_namespace = '{http://www.w3.org/1999/xlink}'
+        fileSec = None
+        for _, element in etree.iterparse(mets_filehandle, events=('end',)):
+            tag = element.tag
+            parent = element.getparent()
+            if tag == 'metsHdr' and parent.getparent() is None:
+                self.acp_modification_date = element.get('LASTMODDATE')
+                element.clear()
+            elif tag == 'mdRef' and parent.tag == 'dmdSec':
+                # The FLocat hrefs use the same xlink namespace
+                for attribute in element.attrib:
+                    if attribute.endswith('}href'):
+                        self.xlink_namespace = attribute[:-len('href')]
+            elif tag == 'fileSec':
+                fileSec = element
+            elif tag == 'structMap':
+                if fileSec is None:
+                    raise ResourceObjectException("structMap found before " +
+                                                  "fileSec in the METS file.")
+                return fileSec, element
+            elif parent is not None and parent.getparent() is None:
+                # Other top level sections (dmdSec, amdSec, ...) aren't used
+                element.clear()
+        if fileSec is None:
+            raise ResourceObjectException("\"fileSec\" not found in METS " +
+                                          "file.")
+        raise ResourceObjectException("\"structMap\" not found in " +
+                                      "METS file.")
+
+
+# Result of building one object with load_many. resource is None and
+# error is the exception if the object couldn't be built.
+LoadResult = namedtuple('LoadResult', ['identifier', 'resource', 'error'])
+
+# Location cache shared by the objects built in a load_many worker process
+worker_location_cache = None
+
+# ResourceObject arguments that load_many only gives to worker processes
+# if they are shared between processes
+PROCESS_CACHE_ARGUMENTS = ('location_cache', 'snapshot_cache', 'desc_metadata_cache')
+
+
+def init_worker_process(config=None):
+    """Give a load_many worker process its own caches and connections,
+    and the batch's LocationConfig.
+    """
+    global worker_location_cache
+    worker_location_cache = LocationCache()
+    system.set_connection_pool(ConnectionPool())
+    system.set_location_config(config)
+
+
+def build_resource_object(identifier, args, kwargs):
+    """Build a ResourceObject for load_many."""
+    if worker_location_cache is not None and kwargs.get('location_cache') is None:
+        kwargs = dict(kwargs, location_cache=worker_location_cache)
+    return ResourceObject(identifier, *args, **kwargs)
+
+
+def load_many(identifiers, metadataLocations, staticFileLocations,
+              mimetypeIconsPath, use, max_workers=8, use_processes=False,
+              connection_pool=None, location_config=None, **kwargs):
+    """Build a ResourceObject for each identifier (meta_id or METS path),
+    yielding a LoadResult for each one as it completes.
+
+    The objects are built on a pool of max_workers threads that share a
+    LocationCache, a LocationConfig (location_config, or the one
+    system.get_location_config returns, read once for the batch) and a
+    ConnectionPool. The pool is connection_pool, the shared one if one
+    has been set, or else one opened for the batch. They are used by the
+    batch's threads only (see system.set_thread_settings), so the
+    module's shared settings aren't changed.
+
+    With use_processes=True the objects are built in worker processes
+    instead, so parsing runs on several CPUs; each process has its own
+    caches and connections. location_cache, snapshot_cache and
+    desc_metadata_cache are only used by the workers if they are shared
+    between processes (such as a SharedLocationCache, SQLiteCache or
+    DirectoryCache). Each object is built whole on one worker, as its
+    METS is parsed while it is read and the parsed trees can't be passed
+    between processes. Other keyword arguments are passed to
+    ResourceObject.
+    Errors are returned in the LoadResult rather than raised.
+    """
+    args = (metadataLocations, staticFileLocations, mimetypeIconsPath, use)
+    if location_config is None:
+        location_config = system.get_location_config()
+    kwargs['location_config'] = location_config
+    batch_pool = None
+    if use_processes:
+        # Caches and connections can't be shared between processes
+        for name in PROCESS_CACHE_ARGUMENTS:
+            if not getattr(kwargs.get(name), 'shared', False):
+                kwargs.pop(name, None)
+        kwargs.pop('executor', None)
+        executor = ProcessPoolExecutor(max_workers, initializer=init_worker_process,
+                                       initargs=(location_config,))
+    else:
+        kwargs.setdefault('location_cache', LocationCache())
+        if connection_pool is None and system.get_connection_pool() is None:
+            connection_pool = batch_pool = ConnectionPool(maxsize=max_workers)
+        executor = ThreadPoolExecutor(max_workers, initializer=system.set_thread_settings,
+                                      initargs=(connection_pool, location_config))
+    identifiers = iter(identifiers)
+    pending = {}
+    try:
+        while True:
+            # Keep a bounded number of objects in flight
+            while len(pending) < max_workers * 2:
+                try:
+                    identifier = next(identifiers)
+                except StopIteration:
+                    break
+                future = executor.submit(build_resource_object, identifier, args, kwargs)
+                pending[future] = identifier
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                identifier = pending.pop(future)
+                error = future.exception()
+                if error is None:
+                    result = LoadResult(identifier, future.result(), None)
+                else:
+                    result = LoadResult(identifier, None, error)
+                yield result
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+        if batch_pool is not None:
+            batch_pool.close()
+
+
+def load_thumbnails(identifiers, metadataLocations, staticFileLocations, use,
+                    max_workers=8, connection_pool=None, location_config=None,
+                    **kwargs):
+    """Build a ThumbnailObject for each identifier (meta_id or METS path)
+    on a pool of max_workers threads, and return their LoadResults in the
+    order the identifiers were given.
+
+    The objects share a LocationCache, a ConnectionPool and a
+    LocationConfig, as in load_many. Other keyword arguments are passed
+    to ThumbnailObject.
+    """
+    identifiers = list(identifiers)
+    kwargs.setdefault('location_cache', LocationCache())
+    if location_config is None:
+        location_config = system.get_location_config()
+    batch_pool = None
+    if connection_pool is None and system.get_connection_pool() is None:
+        connection_pool = batch_pool = ConnectionPool(maxsize=max_workers)
+    try:
+        with ThreadPoolExecutor(max_workers, initializer=system.set_thread_settings,
+                                initargs=(connection_pool, location_config)) as executor:
+            futures = [
+                executor.submit(ThumbnailObject, identifier, metadataLocations,
+                                staticFileLocations, use, **kwargs)
+                for identifier in identifiers
+            ]
+    finally:
+        if batch_pool is not None:
+            batch_pool.close()
+    results = []
+    for identifier, future in zip(identifiers, futures):
+        error = future.exception()
+        if error is None:
+            results.append(LoadResult(identifier, future.result(), None))
+        else:
+            results.append(LoadResult(identifier, None, error))
+    return results
@@ -1,8 +1,54 @@
+import functools
+import mmap
 import os
 import re
+import threading
+import time
+import urllib.error
 import urllib.request
 import urllib.parse
-from pypairtree.pairtree import get_pair_path
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from pypairtree import pairtree
+from aubreylib.cache import CachedResponse
+from aubreylib.instrument import NULL_SPAN, span
+from aubreylib.location import LocationConfig, get_location, get_settings_locations, is_url
+
+# Number of meta_id pair paths kept by get_pair_path
+PAIR_PATH_CACHE_SIZE = 65536
+
+# Matches the part of a file:// name below the object's pair path
+FILE_NAME_REGEX = re.compile(r'^file:/?/(web/?.+)')
+
+# Returned by probe_location for a location that was down or skipped
+UNAVAILABLE = object()
+
+# Shared ConnectionPool used for remote I/O. When None, every request
+# opens a new connection with urllib.request.urlopen.
+connection_pool = None
+
+# Shared HTTPCache of metadata url responses. When None, responses
+# aren't cached.
+http_cache = None
+
+# Shared HealthTracker of the locations. When None, every location is
+# always tried.
+location_health = None
+
+# Host that answered for each host that failed in get_other_system, tried
+# first the next time that host fails
+failover_hosts = {}
+
+# Try the failover locations in get_other_system all at once
+concurrent_failover = False
+
+# LocationConfig used by get_other_system. When None, it is built from
+# the settings (and rebuilt only if they change).
+location_config = None
+_settings_config = None
+
+# ConnectionPool and LocationConfig used by the current thread in place of
+# the shared ones (see set_thread_settings)
+_thread_settings = threading.local()
 
 
 class SystemMethodsException(Exception):
@@ -14,62 +60,461 @@ class SystemMethodsException(Exception):
         return "%s" % (self.value)
 
 
+class LocationUnavailable(SystemMethodsException):
+    """A location didn't answer (as opposed to not having a file)"""
+
+
+def set_connection_pool(pool):
+    """Use the given ConnectionPool (or None to disable pooling) for all
+    remote I/O in aubreylib.
+    """
+    global connection_pool
+    connection_pool = pool
+
+
+def set_http_cache(cache):
+    """Use the given HTTPCache (or None to disable caching) for the
+    metadata files aubreylib opens by url (METS, UNTL, dimensions and
+    transcriptions). Static files aren't cached.
+    """
+    global http_cache
+    http_cache = cache
+
+
+def set_location_health(tracker):
+    """Use the given HealthTracker (or None to disable it) to skip
+    locations that are down. A tracker without a checker checks
+    recovering locations with check_location_available.
+    """
+    global location_health
+    if tracker is not None and tracker.checker is None:
+        tracker.checker = check_location_available
+    location_health = tracker
+
+
+def set_location_config(config):
+    """Use the given LocationConfig (or None to read the settings)."""
+    global location_config
+    location_config = config
+
+
+def set_thread_settings(pool=None, config=None):
+    """Use the given ConnectionPool and LocationConfig in the current
+    thread instead of the shared ones, such as for a batch run on its own
+    threads. None uses the shared one.
+    """
+    _thread_settings.connection_pool = pool
+    _thread_settings.location_config = config
+
+
+def bind_thread_settings(function):
+    """Return function wrapped to run with the current thread's settings
+    (see set_thread_settings), for running it on another thread.
+    """
+    pool = getattr(_thread_settings, 'connection_pool', None)
+    config = getattr(_thread_settings, 'location_config', None)
+    if pool is None and config is None:
+        return function
+
+    def run_with_thread_settings(*args, **kwargs):
+        set_thread_settings(pool, config)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            set_thread_settings()
+    return run_with_thread_settings
+
+
+def get_connection_pool():
+    """Return the ConnectionPool of the current thread, or the shared one
+    (None if pooling is disabled).
+    """
+    pool = getattr(_thread_settings, 'connection_pool', None)
+    return connection_pool if pool is None else pool
+
+
+def get_location_config():
+    """Return the LocationConfig of the current thread or the one that
+    has been set, or the one built from the settings.
+    """
+    global _settings_config
+    config = getattr(_thread_settings, 'location_config', None)
+    if config is not None:
+        return config
+    if location_config is not None:
+        return location_config
+    metadata_locations, static_file_locations = get_settings_locations()
+    config = _settings_config
+    if config is None or config.source != (metadata_locations, static_file_locations):
+        config = _settings_config = LocationConfig.from_settings()
+    return config
+
+
+def set_concurrent_failover(concurrent):
+    """Make get_other_system try all its locations at once (True) or one
+    at a time (False, the default).
+    """
+    global concurrent_failover
+    concurrent_failover = concurrent
+
+
+def check_location_available(location):
+    """Return True if a location answers at all."""
+    if location.startswith('file://'):
+        return os.path.isdir(location.replace('file:/', ''))
+    request = urllib.request.Request(location)
+    request.get_method = lambda: 'HEAD'
+    try:
+        open_url(request, timeout=6).close()
+    except urllib.error.HTTPError:
+        # Any answer will do
+        pass
+    return True
+
+
+def open_url(url, timeout=None, cache=False):
+    """Open a url string or urllib.request.Request, through the shared
+    connection pool if one has been set. If cache is True, a url string
+    without query arguments is served from the shared HTTP cache, if one
+    has been set, when it hasn't changed.
+    """
+    if cache and http_cache is not None and isinstance(url, str) \
+            and not urllib.parse.urlsplit(url)[3]:
+        return open_cached_url(url, timeout)
+    url_span = span('system.open_url')
+    if url_span is not NULL_SPAN:
+        if isinstance(url, urllib.request.Request):
+            url_span.set(host=url.host, method=url.get_method())
+        else:
+            url_span.set(host=urllib.parse.urlsplit(url)[1], method='GET')
+    with url_span:
+        pool = get_connection_pool()
+        if pool is not None:
+            response = pool.urlopen(url, timeout=timeout)
+        elif timeout is None:
+            response = urllib.request.urlopen(url)
+        else:
+            response = urllib.request.urlopen(url, timeout=timeout)
+        if url_span is not NULL_SPAN:
+            url_span.set(bytes=get_content_length(response))
+        return response
+
+
+def open_cached_url(url, timeout=None):
+    """Open a url through the HTTP cache, revalidating a cached response
+    with If-None-Match/If-Modified-Since and serving it if the server
+    answers 304 Not Modified.
+    """
+    cache = http_cache
+    with span('system.http_cache') as cache_span:
+        cached = cache.get(url)
+        headers = {}
+        if cached is not None:
+            cached_headers = dict((name.lower(), value) for name, value in cached[0]['headers'])
+            if 'etag' in cached_headers:
+                headers['If-None-Match'] = cached_headers['etag']
+            if 'last-modified' in cached_headers:
+                headers['If-Modified-Since'] = cached_headers['last-modified']
+        try:
+            try:
+                response = open_url(urllib.request.Request(url, None, headers), timeout)
+            except urllib.error.HTTPError as e:
+                if e.code != 304 or cached is None:
+                    raise
+                response = e
+            if response.getcode() == 304 and cached is not None:
+                response.close()
+                cache.touch(url)
+                cache_span.set(cache='hit')
+                metadata, body = cached
+                cached = None
+                return CachedResponse(url, metadata, body)
+        finally:
+            if cached is not None:
+                cached[1].close()
+        cache_span.set(cache='miss')
+        info = response.info()
+        if response.getcode() != 200 or 'no-store' in info.get('Cache-Control', '') \
+                or not (info.get('ETag') or info.get('Last-Modified')):
+            return response
+        # Only bodies of a known size within the limit are stored
+        size = get_content_length(response)
+        if size is None or size > cache.max_entry_size:
+            return response
+        try:
+            with response:
+                cache.set(url, list(info.items()), response)
+        except OSError:
+            # The response couldn't be stored, so fetch it again uncached
+            return open_url(urllib.request.Request(url), timeout)
+        cached = cache.get(url)
+        if cached is None:
+            # Evicted or replaced already
+            return open_url(urllib.request.Request(url), timeout)
+        return CachedResponse(url, *cached)
+
+
+def get_content_length(response):
+    """Return the Content-Length of a response, or None if unknown."""
+    try:
+        return int(response.info().get('Content-Length'))
+    except Exception:
+        return None
+
+
 # Locates the file on the systems
-def get_file_system(meta_id, file_path, location_tuple):
-    system_path = None
-    file_location = None
+def get_file_system(meta_id, file_path, location_tuple, cache=None,
+                    concurrent=False, grace_period=0, indexed_location=None):
+    """Return the (system path, file location) of the file, or
+    (None, None) if it isn't on any system in location_tuple.
+
+    If a LocationCache is given, results are stored in and served from
+    it. Misses where a location was down or skipped are only kept for the
+    cache's unavailable_ttl (not at all for caches without one), so the
+    location is checked again soon. If concurrent is
+    True, all locations are probed at once (see
+    probe_locations_concurrently). indexed_location is the location a
+    LocationIndex gives for the object; it is checked first,
+    and the other locations are only probed if the file isn't there.
+    """
+    with span('system.get_file_system', meta_id=meta_id) as lookup_span:
+        if indexed_location is not None and indexed_location in location_tuple:
+            result = probe_location(meta_id, file_path, indexed_location)
+            if result is not None and result is not UNAVAILABLE:
+                lookup_span.set(index='hit')
+                return result
+            lookup_span.set(index='stale')
+        if cache is None:
+            return find_file_system(meta_id, file_path, location_tuple,
+                                    concurrent, grace_period)
+        cache_key = (meta_id, file_path, tuple(location_tuple))
+        result = cache.get(cache_key)
+        if result is None:
+            lookup_span.set(cache='miss')
+            result, complete = search_locations(meta_id, file_path, location_tuple,
+                                                concurrent, grace_period)
+            if result[0] is not None or complete:
+                cache.set(cache_key, result)
+            elif getattr(cache, 'unavailable_ttl', None):
+                cache.set(cache_key, result, cache.unavailable_ttl)
+        else:
+            lookup_span.set(cache='hit')
+        return result
+
 
+def find_file_system(meta_id, file_path, location_tuple, concurrent=False,
+                     grace_period=0):
+    """Check each location in location_tuple for the file."""
+    return search_locations(meta_id, file_path, location_tuple, concurrent,
+                            grace_period)[0]
+
+
+def search_locations(meta_id, file_path, location_tuple, concurrent=False,
+                     grace_period=0):
+    """Check each location in location_tuple for the file, returning the
+    (system path, file location) and whether every location answered.
+    """
+    health = location_health
+    complete = True
+    if health is not None:
+        # Skip locations that are down, and try failing ones last
+        ordered_locations = health.order(location_tuple)
+        complete = len(ordered_locations) == len(location_tuple)
+        location_tuple = ordered_locations
+    if concurrent and len(location_tuple) > 1:
+        result, answered = probe_locations_concurrently(
+            meta_id, file_path, location_tuple, grace_period, report=True)
+        return result, complete and answered
     # Loop through possible locations for files
     for file_system in location_tuple:
-        # if the system is local to this server
-        if re.compile(r'^file://').search(file_system, 0) is not None:
-            absolute_path = file_system.replace('file:/', '')
-            # if the file name starts with file://, change it to start
-            # with just a /
-            if file_path.startswith('file://'):
-                local_file_path = get_complete_filepath(meta_id, file_path, file_system)[6:]
+        result = probe_location(meta_id, file_path, file_system)
+        if result is UNAVAILABLE:
+            complete = False
+        elif result is not None:
+            return result, complete
+    return (None, None), complete
+
+
+def probe_locations_concurrently(meta_id, file_path, location_tuple,
+                                 grace_period=0, report=False):
+    """Probe every location at once and return the first hit.
+
+    Locations keep their priority order: a hit is returned as soon as all
+    locations ahead of it have missed, or after waiting up to
+    grace_period seconds for them to answer. Probes that haven't started
+    are cancelled, and running ones are left to finish in the background.
+    If report is True, a (result, every location answered) pair is
+    returned instead.
+    """
+    executor = ThreadPoolExecutor(max_workers=len(location_tuple))
+    probe = bind_thread_settings(probe_location)
+    futures = [
+        executor.submit(probe, meta_id, file_path, file_system)
+        for file_system in location_tuple
+    ]
+    priority = {future: index for index, future in enumerate(futures)}
+    best = None
+    deadline = None
+    answered = True
+    try:
+        pending = set(futures)
+        while pending:
+            if deadline is None:
+                timeout = None
             else:
-                local_file_path = file_path
-            # if the file exists on the local server, and isn't an html file
-            if os.path.exists(local_file_path):
-                system_path = local_file_path
-                file_location = absolute_path
+                timeout = max(0, deadline - time.monotonic())
+            done, pending = wait(pending, timeout=timeout,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception:
+                    result = UNAVAILABLE
+                if result is UNAVAILABLE:
+                    answered = False
+                elif result is not None and (best is None or priority[future] < best[0]):
+                    best = (priority[future], result)
+            if best is None:
+                continue
+            # Every location ahead of the hit has answered
+            if all(future.done() for future in futures[:best[0]]):
                 break
-        # if the system is on another server
-        elif re.compile(r'^https?://').search(file_system, 0) is not None:
-            try:
-                # if the file name starts with file:// or /, change it
-                # to start with no beginning slashes
-                if file_path.startswith('file://'):
-                    http_file_path = get_file_path(meta_id, file_path)
-                else:
-                    http_file_path = file_path
-                # Separate the host and the path
-                scheme, host, system_path = urllib.parse.urlsplit(file_system)[:3]
-                # Join the system and file path
-                raw_path = urllib.parse.urljoin(system_path, http_file_path[1:])
-                # Quote the url path (helps with spaces and special characters)
-                path = urllib.parse.quote(raw_path)
-                if host != '' and path != '':
-                    # Check if file exists on the server
-                    url = '%s://%s%s' % (scheme, host, path)
-                    headers = {'Host': host}
-                    request = urllib.request.Request(url, headers=headers)
-                    request.get_method = lambda: 'HEAD'
-                    status_code = urllib.request.urlopen(request, timeout=6).getcode()
-                else:
-                    system_path = None
+            if deadline is None:
+                deadline = time.monotonic() + grace_period
+            elif time.monotonic() >= deadline:
+                break
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+    result = (None, None) if best is None else best[1]
+    if report:
+        return result, answered
+    return result
+
+
+def probe_location(meta_id, file_path, file_system):
+    """Return the (system path, file location) of the file on a single
+    location, None if it isn't there, or UNAVAILABLE if the location
+    couldn't be checked.
+    """
+    health = location_health
+    if health is not None and not health.allow(file_system):
+        return UNAVAILABLE
+    probe_span = span('system.probe_location', meta_id=meta_id)
+    if probe_span is not NULL_SPAN:
+        probe_span.set(host=get_location(file_system).host)
+    with probe_span:
+        start = time.monotonic()
+        try:
+            result = check_location(meta_id, file_path, file_system)
+        except LocationUnavailable:
+            if health is not None:
+                health.record_failure(file_system)
+            probe_span.set(found=False, available=False)
+            return UNAVAILABLE
+        if health is not None:
+            health.record_success(file_system, time.monotonic() - start)
+        probe_span.set(found=result is not None)
+        return result
+
+
+def check_location(meta_id, file_path, file_system):
+    """Check for the file on a single location (see probe_location)."""
+    location = get_location(file_system)
+    # if the system is local to this server
+    if location.is_local:
+        absolute_path = location.local_path
+        # if the file name starts with file://, change it to start
+        # with just a /
+        if file_path.startswith('file://'):
+            local_file_path = get_complete_filepath(meta_id, file_path, file_system)[6:]
+        else:
+            local_file_path = file_path
+        # if the file exists on the local server, and isn't an html file
+        if os.path.exists(local_file_path):
+            return local_file_path, absolute_path
+    # if the system is on another server
+    elif location.is_remote:
+        try:
+            # if the file name starts with file:// or /, change it
+            # to start with no beginning slashes
+            if file_path.startswith('file://'):
+                http_file_path = get_file_path(meta_id, file_path)
+            else:
+                http_file_path = file_path
+            scheme, host, system_path = location.scheme, location.host, location.path
+            # Join the system and file path
+            raw_path = urllib.parse.urljoin(system_path, http_file_path[1:])
+            # Quote the url path (helps with spaces and special characters)
+            path = urllib.parse.quote(raw_path)
+            if host != '' and path != '':
+                # Check if file exists on the server
+                url = '%s://%s%s' % (scheme, host, path)
+                headers = {'Host': host}
+                request = urllib.request.Request(url, headers=headers)
+                request.get_method = lambda: 'HEAD'
+                try:
+                    response = open_url(request, timeout=6)
+                except urllib.error.HTTPError:
+                    # The server answered, but doesn't have the file
+                    return None
+                except Exception as e:
+                    raise LocationUnavailable("Location %s unavailable: %s"
+                                              % (file_system, e))
                 # if the file exists, return the necessary data
-                if status_code == 200:
-                    system_path = '%s://%s%s' % (scheme, host, path)
-                    file_location = file_system
-                    break
-                else:
-                    system_path = None
-            except Exception:
-                pass
-    # returns the file name
-    return system_path, file_location
+                if response.getcode() == 200:
+                    return url, file_system
+        except LocationUnavailable:
+            raise
+        except Exception:
+            pass
+    return None
+
+
+def make_pair_path(meta_id):
+    """Return the pairtree path of a meta_id, as
+    pypairtree.pairtree.get_pair_path does, without caching it.
+    """
+    if meta_id.startswith('/'):
+        # os.path.join drops the pair tree for absolute names
+        return pairtree.get_pair_path(meta_id)
+    return '/%s/%s' % ('/'.join([meta_id[index:index + 2]
+                                 for index in range(0, len(meta_id), 2)]), meta_id)
+
+
+@functools.lru_cache(maxsize=PAIR_PATH_CACHE_SIZE)
+def get_pair_path(meta_id):
+    """Return the pairtree path of a meta_id. The most recently used
+    PAIR_PATH_CACHE_SIZE paths are kept.
+    """
+    return make_pair_path(meta_id)
+
+
+def get_pair_paths(meta_ids):
+    """Yield the (meta_id, pair path) of each meta_id, for bulk jobs.
+    The paths bypass get_pair_path's cache, so a large batch doesn't
+    push out the paths of the objects being served.
+    """
+    for meta_id in meta_ids:
+        yield meta_id, make_pair_path(meta_id)
+
+
+def get_complete_filepaths(files, file_system):
+    """Yield the complete file path (see get_complete_filepath) of each
+    (meta_id, file name) in files on file_system. Consecutive files of
+    the same object share its pair path.
+    """
+    search = FILE_NAME_REGEX.search
+    last_meta_id = meta_path = None
+    for meta_id, file_name in files:
+        if meta_id != last_meta_id:
+            meta_path = make_pair_path(meta_id)
+            last_meta_id = meta_id
+        stripped_regex = search(file_name)
+        if stripped_regex is None:
+            raise SystemMethodsException("Can't recognize the file name: %s" % (file_name))
+        yield '%s%s/%s' % (file_system, meta_path[1:], stripped_regex.group(1))
 
 
 def get_file_path(meta_id, file_name):
@@ -77,7 +522,7 @@ def get_file_path(meta_id, file_name):
     # Create the pair path
     meta_path = get_pair_path(meta_id)
     # Get only parts of the file_name we need
-    stripped_regex = re.compile(r'^file:/?/(web/?.+)').search(file_name, 0)
+    stripped_regex = FILE_NAME_REGEX.search(file_name, 0)
     if stripped_regex is not None:
         stripped_filename = stripped_regex.group(1)
     else:
@@ -101,30 +546,45 @@ def get_complete_filepath(meta_id, file_name, file_system):
     return completed_filename
 
 
-def open_system_file(file_name):
+def open_system_file(file_name, cache=False):
     """ Open and return a file handle either on the file system or
          over http depending on the file name
+
+    If cache is True, urls are opened through the shared HTTP cache (see
+    open_url). It is meant for metadata files, not static files.
     """
     # open the file over http
-    if re.compile(r'^https?://').search(file_name, 0) is not None:
+    if is_url(file_name):
         valid_url = create_valid_url(file_name)
         try:
-            return urllib.request.urlopen(valid_url)
+            return open_url(valid_url, cache=cache)
         except Exception:
             return get_other_system(valid_url)
     # open it over the file system
     else:
-        return open(file_name, 'rb')
+        with span('system.open_file') as file_span:
+            file_handle = open(file_name, 'rb')
+            if file_span is not NULL_SPAN:
+                file_span.set(bytes=get_file_size(file_handle))
+            return file_handle
+
+
+def get_file_size(file_handle):
+    """Return the size of an open file, or None if unknown."""
+    try:
+        return os.fstat(file_handle.fileno()).st_size
+    except Exception:
+        return None
 
 
 def open_args_system_file(file_name):
     """Creates a valid url with arguments added (ex. ?start=123)"""
     # open the file over http
-    if re.compile(r'^https?://').search(file_name, 0) is not None:
+    if is_url(file_name):
         valid_url = create_valid_url(file_name)
         args = urllib.parse.urlsplit(file_name)[3]
         arg_url = "%s?%s" % (valid_url, args)
-        return urllib.request.urlopen(arg_url)
+        return open_url(arg_url)
     else:
         raise SystemMethodsException("Invalid url: %s" % (file_name))
 
@@ -155,46 +615,392 @@ def create_valid_url(file_name):
 
 
 def open_file_range(file_name, range_tuple):
-    """Open a url file, but only a certain range of bytes"""
+    """Open a url or local file, but only a certain range of bytes.
+
+    range_tuple is the (start, end) of an HTTP byte range: end is
+    inclusive, an empty end reads to the end of the file, and an empty
+    start reads the last end bytes. Local files are returned as a
+    LocalFileRange.
+    """
     # open the file over http
-    if re.compile(r'^https?://').search(file_name, 0) is not None:
+    if is_url(file_name):
         headers = {'Range': "bytes=%s-%s" % range_tuple}
         valid_url = create_valid_url(file_name)
         req = urllib.request.Request(valid_url, None, headers)
         try:
-            return urllib.request.urlopen(req)
+            return open_url(req)
         except Exception:
             raise SystemMethodsException("Specified Range (%s,%s) not valid." % range_tuple)
     # open it over the file system
     else:
-        return None
+        try:
+            with span('system.open_file_range') as range_span:
+                local_range = LocalFileRange(file_name, range_tuple)
+                range_span.set(bytes=len(local_range))
+                return local_range
+        except (OSError, ValueError):
+            raise SystemMethodsException("Specified Range (%s,%s) not valid." % range_tuple)
 
 
-def get_other_system(failed_url):
-    """Takes a file that failed to give a response
-        and tries to locate it via Django settings
+def get_range_bounds(range_tuple, size):
+    """Return the (start, stop) offsets of an HTTP byte range (see
+    open_file_range) within a file of the given size.
+    """
+    start, end = range_tuple
+    if start in (None, ''):
+        # The last end bytes of the file
+        start = max(size - int(end), 0)
+        stop = size
+    else:
+        start = int(start)
+        stop = size if end in (None, '') else min(int(end) + 1, size)
+    if start < 0 or start >= stop and size > 0:
+        raise ValueError('Range (%s,%s) not satisfiable' % tuple(range_tuple))
+    return start, max(start, stop)
+
+
+class LocalFileRange:
+    """A byte range of a local file, memory mapped so it can be read
+    without copying: view is a memoryview of the range. It also has the
+    read methods of a file (like the response of a remote range) and the
+    start, stop and size of the range within the file.
+    """
+
+    def __init__(self, file_name, range_tuple):
+        with open(file_name, 'rb') as range_file:
+            self.size = os.fstat(range_file.fileno()).st_size
+            self.start, self.stop = get_range_bounds(range_tuple, self.size)
+            if self.stop > self.start:
+                # Only the pages holding the range are mapped
+                offset = self.start - self.start % mmap.ALLOCATIONGRANULARITY
+                self._mmap = mmap.mmap(range_file.fileno(), self.stop - offset,
+                                       access=mmap.ACCESS_READ, offset=offset)
+                self.view = memoryview(self._mmap)[self.start - offset:]
+            else:
+                self._mmap = None
+                self.view = memoryview(b'')
+        self._position = 0
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def read(self, amt=None):
+        if amt is None or amt < 0:
+            amt = len(self) - self._position
+        data = self.view[self._position:self._position + amt].tobytes()
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.view[self._position:self._position + len(buffer)]
+        size = len(data)
+        memoryview(buffer).cast('B')[:size] = data
+        self._position += size
+        return size
+
+    def close(self):
+        if self._mmap is not None:
+            try:
+                self.view.release()
+                self._mmap.close()
+            except BufferError:
+                # Slices of the view are still in use, so the map is
+                # closed when they are freed
+                pass
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def coalesce_ranges(ranges, gap=0):
+    """Sort (start, end) byte ranges (end inclusive) and merge the ones
+    that overlap or are no more than gap bytes apart.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1 + gap:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [tuple(byte_range) for byte_range in merged]
+
+
+def parse_content_range(content_range):
+    """Return the first byte offset given in a Content-Range header."""
+    match = re.compile(r'bytes\s+(\d+)-(\d+)').search(content_range or '')
+    if match is None:
+        raise SystemMethodsException("Invalid Content-Range: %s" % (content_range,))
+    return int(match.group(1))
+
+
+def parse_byteranges(body, boundary):
+    """Return (start, data) segments of a multipart/byteranges body."""
+    segments = []
+    delimiter = b'--' + boundary.encode('ascii')
+    for part in body.split(delimiter)[1:]:
+        if part.startswith(b'--'):
+            break
+        headers, _, data = part.partition(b'\r\n\r\n')
+        content_range = None
+        for header in headers.split(b'\r\n'):
+            name, _, value = header.partition(b':')
+            if name.strip().lower() == b'content-range':
+                content_range = value.strip().decode('ascii')
+        # Each part ends with the CRLF before the next delimiter
+        if data.endswith(b'\r\n'):
+            data = data[:-2]
+        segments.append((parse_content_range(content_range), data))
+    return segments
+
+
+def fetch_url_segments(valid_url, ranges):
+    """Request ranges of a url in one request and return the (start, data)
+    segments the server sent: the parts of a multipart/byteranges
+    response, the single range it sent, or the whole file.
     """
-    # Determine meta/static servers locations
+    range_specs = ','.join('%s-%s' % byte_range for byte_range in ranges)
+    headers = {'Range': 'bytes=%s' % (range_specs,)}
+    request = urllib.request.Request(valid_url, None, headers)
     try:
-        from django.conf import settings
+        response = open_url(request)
     except Exception:
-        from aubreylib import METADATA_LOCATIONS, STATIC_FILE_LOCATIONS
+        raise SystemMethodsException("Specified Ranges %s not valid." % (ranges,))
+    with response:
+        body = response.read()
+        info = response.info()
+        if response.getcode() != 206:
+            return [(0, body)]
+        if info.get_content_type() == 'multipart/byteranges':
+            return parse_byteranges(body, info.get_param('boundary'))
+        return [(parse_content_range(info.get('Content-Range')), body)]
+
+
+def fetch_file_segments(file_name, ranges):
+    """Read ranges of a local file as (start, data) segments."""
+    segments = []
+    try:
+        with open(file_name, 'rb') as range_file:
+            for start, end in ranges:
+                range_file.seek(start)
+                segments.append((start, range_file.read(end - start + 1)))
+    except OSError:
+        raise SystemMethodsException("Specified Ranges %s not valid." % (ranges,))
+    return segments
+
+
+def slice_segments(segments, start, end):
+    """Return bytes start to end (inclusive) from the segment holding
+    them, or None if no segment does.
+    """
+    for segment_start, data in segments:
+        if segment_start <= start and start < segment_start + len(data):
+            return data[start - segment_start:end - segment_start + 1]
+    return None
+
+
+def open_file_ranges(file_name, ranges, gap=1024, max_ranges=16, cache=None):
+    """Return the bytes of each (start, end) range (end inclusive) of a
+    url or local file, in the order the ranges were given.
+
+    Ranges that overlap or are within gap bytes of each other are
+    fetched together, and remote files are requested with multi-range
+    requests of up to max_ranges ranges each. Ranges a server leaves out
+    of its response are requested again one at a time. If a BlockCache
+    is given,
+    remote files are fetched in whole blocks, and blocks already in the
+    cache aren't requested again.
+    """
+    ranges = [(int(start), int(end)) for start, end in ranges]
+    if not is_url(file_name):
+        segments = fetch_file_segments(file_name, coalesce_ranges(ranges, gap))
+        return [slice_segments(segments, start, end) for start, end in ranges]
+    valid_url = create_valid_url(file_name)
+    blocks = {}
+    if cache is None:
+        wanted = ranges
     else:
+        # Fetch the blocks holding the ranges that aren't cached
+        block_size = cache.block_size
+        wanted = []
+        for start, end in ranges:
+            for block in range(start // block_size, end // block_size + 1):
+                if block in blocks:
+                    continue
+                blocks[block] = cache.get((valid_url, block))
+                if blocks[block] is None:
+                    wanted.append((block * block_size, (block + 1) * block_size - 1))
+    merged = coalesce_ranges(wanted, gap)
+    segments = []
+    for index in range(0, len(merged), max_ranges):
+        segments.extend(fetch_url_segments(valid_url, merged[index:index + max_ranges]))
+    for start, end in merged:
+        # Some servers only send the first of several ranges
+        if slice_segments(segments, start, end) is None:
+            segments.extend(fetch_url_segments(valid_url, [(start, end)]))
+            if slice_segments(segments, start, end) is None:
+                raise SystemMethodsException("Range %s-%s of %s not returned."
+                                             % (start, end, valid_url))
+    if cache is None:
+        return [slice_segments(segments, start, end) for start, end in ranges]
+    for block, data in blocks.items():
+        if data is None:
+            data = slice_segments(segments, block * block_size,
+                                  (block + 1) * block_size - 1)
+            if data is not None:
+                blocks[block] = data
+                cache.set((valid_url, block), data)
+    results = []
+    for start, end in ranges:
+        data = b''.join(blocks[block] or b'' for block in
+                        range(start // block_size, end // block_size + 1))
+        offset = start - start // block_size * block_size
+        results.append(data[offset:offset + end - start + 1])
+    return results
+
+
+def send_file_range(file_name, range_tuple, out_socket, chunk_size=65536):
+    """Send a byte range (see open_file_range) of a local file or url to
+    a socket and return the number of bytes sent.
+
+    Local files are sent with socket.sendfile, which uses os.sendfile
+    where it is available, so the data is copied by the kernel rather
+    than through Python buffers.
+    """
+    if is_url(file_name):
+        sent = 0
+        with open_file_range(file_name, range_tuple) as range_file:
+            for chunk in iter(lambda: range_file.read(chunk_size), b''):
+                out_socket.sendall(chunk)
+                sent += len(chunk)
+        return sent
+    try:
+        range_file = open(file_name, 'rb')
+    except OSError:
+        raise SystemMethodsException("Specified Range (%s,%s) not valid." % range_tuple)
+    with range_file:
         try:
-            METADATA_LOCATIONS = settings.METADATA_LOCATIONS
-            STATIC_FILE_LOCATIONS = settings.STATIC_FILE_LOCATIONS
-        except Exception:
-            from aubreylib import METADATA_LOCATIONS, STATIC_FILE_LOCATIONS
-    # Combine the metadata locations with static locations
-    all_locations = METADATA_LOCATIONS + STATIC_FILE_LOCATIONS
+            start, stop = get_range_bounds(range_tuple,
+                                           os.fstat(range_file.fileno()).st_size)
+        except ValueError:
+            raise SystemMethodsException("Specified Range (%s,%s) not valid." % range_tuple)
+        if stop == start:
+            return 0
+        return out_socket.sendfile(range_file, start, stop - start)
+
+
+def get_other_system(failed_url, concurrent=None, config=None):
+    """Takes a file that failed to give a response
+        and tries to locate it via Django settings
+
+    The locations come from config, or get_location_config. The host
+    that answered is remembered for the failed host and tried first the
+    next time. If concurrent is True (defaults to concurrent_failover),
+    the other locations are tried all at once and the first to answer is
+    used.
+    """
+    if config is None:
+        config = get_location_config()
+    # Combine the metadata locations with static locations. Local
+    # locations have no host to try the url on.
+    all_locations = [metadata_location for metadata_location in config.all_locations
+                     if get_location(metadata_location).is_remote]
     # Determine the host
     host = urllib.parse.urlsplit(failed_url)[1]
-    # Try to find file on metadata/static servers
-    for metadata_location in all_locations:
-        replacement_host = urllib.parse.urlsplit(metadata_location)[1]
-        new_url = failed_url.replace(host, replacement_host)
-        try:
-            return urllib.request.urlopen(new_url, timeout=3)
-        except Exception:
-            pass
-    raise SystemMethodsException("Can't locate file: %s" % (failed_url))
+    health = location_health
+    if health is not None:
+        all_locations = health.order(all_locations)
+    # Try the host that answered last time first
+    known_host = failover_hosts.get(host)
+    if known_host is not None:
+        known_locations = [metadata_location for metadata_location in all_locations
+                           if get_location(metadata_location).host == known_host]
+        if known_locations:
+            response = open_failover_location(failed_url, host, known_locations[0])
+            if response is not None:
+                return response
+        failover_hosts.pop(host, None)
+        all_locations = [metadata_location for metadata_location in all_locations
+                         if metadata_location not in known_locations]
+    if concurrent is None:
+        concurrent = concurrent_failover
+    if concurrent and len(all_locations) > 1:
+        response, metadata_location = open_failover_concurrently(
+            failed_url, host, all_locations)
+    else:
+        response = None
+        # Try to find file on metadata/static servers
+        for metadata_location in all_locations:
+            response = open_failover_location(failed_url, host, metadata_location)
+            if response is not None:
+                break
+    if response is None:
+        raise SystemMethodsException("Can't locate file: %s" % (failed_url))
+    replacement_host = get_location(metadata_location).host
+    if replacement_host != host:
+        failover_hosts[host] = replacement_host
+    return response
+
+
+def open_failover_location(failed_url, host, metadata_location):
+    """Open the failed url on the host of metadata_location, returning
+    None if it can't be opened there.
+    """
+    health = location_health
+    if health is not None and not health.allow(metadata_location):
+        return None
+    replacement_host = get_location(metadata_location).host
+    new_url = failed_url.replace(host, replacement_host)
+    start = time.monotonic()
+    try:
+        response = open_url(new_url, timeout=3)
+    except urllib.error.HTTPError:
+        if health is not None:
+            health.record_success(metadata_location)
+        return None
+    except Exception:
+        if health is not None:
+            health.record_failure(metadata_location)
+        return None
+    if health is not None:
+        health.record_success(metadata_location, time.monotonic() - start)
+    return response
+
+
+def open_failover_concurrently(failed_url, host, locations):
+    """Try the failed url on every location at once and return the first
+    (response, location) to answer, or (None, None). Responses that
+    arrive later are closed.
+    """
+    executor = ThreadPoolExecutor(max_workers=len(locations))
+    open_location = bind_thread_settings(open_failover_location)
+    futures = {
+        executor.submit(open_location, failed_url, host, metadata_location):
+            metadata_location
+        for metadata_location in locations
+    }
+    winner = None
+    try:
+        for future in as_completed(futures):
+            if future.result() is not None:
+                winner = future
+                break
+    finally:
+        for future in futures:
+            if future is not winner and not future.cancel():
+                future.add_done_callback(close_failover_response)
+        executor.shutdown(wait=False)
+    if winner is None:
+        return None, None
+    return winner.result(), futures[winner]
+
+
+def close_failover_response(future):
+    """Close the response of a failover attempt that wasn't used."""
+    response = future.result()
+    if response is not None:
+        response.close()
@@ -0,0 +1,258 @@
+"""Generate synthetic pairtree objects (METS, UNTL, dimensions JSON and
+web files) for the benchmarks.
+"""
+import argparse
+import json
+import os
+from xml.sax.saxutils import quoteattr, escape
+
+from pypairtree.pairtree import get_pair_path
+
+from aubreylib import USE
+
+# Uses, mimetypes and file name prefixes of the files in each fileSet, in
+# the order they are added to a file group
+FILE_TYPES = (
+    (USE['high_res'], 'image/jpeg', ''),
+    (USE['thumbnail'], 'image/jpeg', 'thumbnail-'),
+    (USE['square'], 'image/jpeg', 'square-'),
+    (USE['med_res'], 'image/jpeg', 'web-'),
+    (USE['ocr'], 'text/plain', 'ocr-'),
+    (USE['zoom'], 'image/jpeg', 'zoom-'),
+    (USE['bounding_box'], 'text/xml', 'bbox-'),
+    (USE['transcription'], 'text/plain', 'transcription-'),
+    (USE['translation'], 'text/plain', 'translation-'),
+)
+
+METS_NAMESPACES = (
+    'xmlns:mets="http://www.loc.gov/METS/" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+    'xmlns:xlink="http://www.w3.org/1999/xlink"'
+)
+
+DEFAULT_PARAMETERS = {
+    'manifestations': 1,
+    'filesets': 1,
+    'files_per_group': 5,
+    'dimensions': True,
+    'extra_dimensions': 0,
+    'transcriptions': 0,
+    'creators': 1,
+    'embargo': False,
+    'lastmoddate': '2020-01-01T00:00:00Z',
+}
+
+
+def get_file_name(manifest_num, fileSet_num, file_num):
+    """Return the web file name of a file in a fileSet."""
+    use, mimetype, prefix = FILE_TYPES[file_num % len(FILE_TYPES)]
+    extension = {'text/plain': 'txt', 'text/xml': 'xml'}.get(mimetype, 'jpg')
+    if file_num >= len(FILE_TYPES):
+        prefix = '%s%s-' % (prefix, file_num)
+    return '%s%s-%s.%s' % (prefix, manifest_num, fileSet_num, extension)
+
+
+def generate_mets(meta_id, parameters):
+    """Return the METS document for the object as a string."""
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<mets %s TYPE="access content package" OBJID="ark:/67531/%s">'
+        % (METS_NAMESPACES, meta_id),
+        '  <metsHdr CREATEDATE="2020-01-01T00:00:00Z" LASTMODDATE=%s ID="hdr_00001"/>'
+        % (quoteattr(parameters['lastmoddate']),),
+        '  <dmdSec ID="dmd_00001">',
+        '    <mdRef xlink:href="file://%s.untl.xml" OTHERMDTYPE="UNTL" LOCTYPE="URL" '
+        'MDTYPE="OTHER"/>' % (meta_id,),
+        '  </dmdSec>',
+        '  <fileSec ID="sec_00001">',
+    ]
+    structMap = []
+    file_count = 0
+    group_count = 0
+    for manifest_num in range(1, parameters['manifestations'] + 1):
+        structMap.append('      <div ID="mn_%05d" TYPE="manifestation" ORDER="%s" LABEL="%s">'
+                         % (manifest_num, manifest_num, 'Manifestation %s' % manifest_num))
+        for fileSet_num in range(1, parameters['filesets'] + 1):
+            group_count += 1
+            lines.append('    <fileGrp ID="fgrp_%05d">' % (group_count,))
+            structMap.append('        <div ID="fs_%05d" TYPE="fileSet" ORDER="%s" '
+                             'ORDERLABEL="%s" LABEL="Page %s">'
+                             % (group_count, fileSet_num, fileSet_num, fileSet_num))
+            for file_num in range(parameters['files_per_group']):
+                file_count += 1
+                use, mimetype, _ = FILE_TYPES[file_num % len(FILE_TYPES)]
+                file_name = get_file_name(manifest_num, fileSet_num, file_num)
+                lines.extend([
+                    '      <file MIMETYPE="%s" USE="%s" CHECKSUMTYPE="MD5" '
+                    'CREATED="2020-01-01T00:00:00Z" CHECKSUM="%032x" '
+                    'OWNERID="urn:uuid:%032x" ID="file_%05d" SIZE="%s">'
+                    % (mimetype, use, file_count, file_count, file_count,
+                       1000 + file_count),
+                    '        <FLocat xlink:href="file://web/%s" LOCTYPE="URL"/>' % (file_name,),
+                    '      </file>',
+                ])
+                structMap.append('          <fptr FILEID="file_%05d"/>' % (file_count,))
+            lines.append('    </fileGrp>')
+            structMap.append('        </div>')
+        structMap.append('      </div>')
+    lines.append('  </fileSec>')
+    lines.append('  <structMap ID="smap_00001">')
+    lines.append('    <div DMDID="dmd_00001" ID="obj_00001" TYPE="object">')
+    # The thumbnail, square and medium images are the first fileSet's
+    for div_num, (div_type, file_num) in enumerate(
+            (('thumbnail', 1), ('square', 2), ('medium', 3)), 1):
+        if file_num < parameters['files_per_group']:
+            lines.extend([
+                '      <div ID="img_%05d" TYPE="%s">' % (div_num, div_type),
+                '        <fptr FILEID="file_%05d"/>' % (file_num + 1,),
+                '      </div>',
+            ])
+    lines.extend(structMap)
+    lines.extend(['    </div>', '  </structMap>', '</mets>', ''])
+    return '\n'.join(lines)
+
+
+def generate_untl(meta_id, parameters):
+    """Return the UNTL descriptive metadata for the object as a string."""
+    if parameters['transcriptions']:
+        resource_type = 'video'
+    else:
+        resource_type = 'image_photo'
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<metadata>',
+        '  <title qualifier="officialtitle">Synthetic object %s</title>' % (escape(meta_id),),
+    ]
+    for creator_num in range(parameters['creators']):
+        lines.extend([
+            '  <creator qualifier="aut">',
+            '    <name>Creator, Number %s</name>' % (creator_num,),
+            '    <type>per</type>',
+            '    <info>creator%s@example.edu</info>' % (creator_num,),
+            '  </creator>',
+        ])
+    lines.extend([
+        '  <date qualifier="creation">2020-01-01</date>',
+        '  <language>eng</language>',
+        '  <description qualifier="content">A generated object.</description>',
+        '  <subject qualifier="KWD">Benchmarks</subject>',
+        '  <subject qualifier="UNTL-BS">Science and Technology</subject>',
+        '  <collection>BENCH</collection>',
+        '  <institution>UNT</institution>',
+        '  <rights qualifier="access">public</rights>',
+        '  <resourceType>%s</resourceType>' % (resource_type,),
+        '  <format>image</format>',
+        '  <meta qualifier="ark">ark:/67531/%s</meta>' % (escape(meta_id),),
+        '  <meta qualifier="hidden">False</meta>',
+    ])
+    if parameters['embargo']:
+        lines.append('  <date qualifier="embargoUntil">%s</date>' % (parameters['embargo'],))
+    lines.extend(['</metadata>', ''])
+    return '\n'.join(lines)
+
+
+def generate_dimensions(parameters):
+    """Return the dimensions data for the object's images."""
+    dimensions = {}
+    if not parameters['dimensions']:
+        return dimensions
+    for manifest_num in range(1, parameters['manifestations'] + 1):
+        for fileSet_num in range(1, parameters['filesets'] + 1):
+            for file_num in range(parameters['files_per_group']):
+                if FILE_TYPES[file_num % len(FILE_TYPES)][1].startswith('image/'):
+                    file_name = get_file_name(manifest_num, fileSet_num, file_num)
+                    dimensions['file://web/%s' % (file_name,)] = {
+                        'height': 1000 + file_num,
+                        'width': 800 + file_num,
+                    }
+    # Files that aren't in the METS, to vary the size of the JSON
+    for extra_num in range(parameters['extra_dimensions']):
+        dimensions['file://web/extra-%s.jpg' % (extra_num,)] = {'height': 10, 'width': 10}
+    return dimensions
+
+
+def generate_transcriptions(parameters):
+    """Return the transcriptions data for the object, keyed by
+    manifestation and fileSet ORDER like the transcriptions server's.
+    """
+    transcriptions = {}
+    kinds = ('captions', 'subtitles', 'descriptions', 'chapters', 'thumbnails', 'metadata')
+    if not parameters['transcriptions']:
+        return transcriptions
+    for manifest_num in range(1, parameters['manifestations'] + 1):
+        manifestation = transcriptions[str(manifest_num)] = {}
+        for fileSet_num in range(1, parameters['filesets'] + 1):
+            manifestation[str(fileSet_num)] = [
+                {
+                    'vtt_kind': kinds[transcription_num % len(kinds)],
+                    'language': 'en',
+                    'flocat': 'file://web/%s-%s-%s.vtt' % (
+                        manifest_num, fileSet_num, transcription_num),
+                }
+                for transcription_num in range(parameters['transcriptions'])
+            ]
+    return transcriptions
+
+
+def generate_object(root, meta_id, **parameters):
+    """Write a synthetic object to the pairtree under root and return the
+    path of its METS file.
+
+    The parameters (see DEFAULT_PARAMETERS) set the number of
+    manifestations, fileSets per manifestation, files per fileSet,
+    whether the images have dimensions (and how many more dimension
+    entries to add), transcriptions per fileSet, creators, and an
+    embargoUntil date. Transcriptions are written to
+    root/transcriptions/<meta_id>/index.html, so a static file server
+    at root answers the transcriptions server URL root/transcriptions.
+    """
+    unknown = set(parameters) - set(DEFAULT_PARAMETERS)
+    if unknown:
+        raise TypeError('Unknown parameters: %s' % (', '.join(sorted(unknown)),))
+    parameters = dict(DEFAULT_PARAMETERS, **parameters)
+    object_directory = os.path.join(root, get_pair_path(meta_id)[1:])
+    web_directory = os.path.join(object_directory, 'web')
+    os.makedirs(web_directory, exist_ok=True)
+    mets_path = os.path.join(object_directory, meta_id + '.mets.xml')
+    with open(mets_path, 'w') as mets_file:
+        mets_file.write(generate_mets(meta_id, parameters))
+    with open(os.path.join(object_directory, meta_id + '.untl.xml'), 'w') as untl_file:
+        untl_file.write(generate_untl(meta_id, parameters))
+    if parameters['dimensions']:
+        with open(os.path.join(object_directory, meta_id + '.json'), 'w') as json_file:
+            json.dump(generate_dimensions(parameters), json_file)
+    # Web files only need to exist
+    for manifest_num in range(1, parameters['manifestations'] + 1):
+        for fileSet_num in range(1, parameters['filesets'] + 1):
+            for file_num in range(parameters['files_per_group']):
+                file_name = get_file_name(manifest_num, fileSet_num, file_num)
+                open(os.path.join(web_directory, file_name), 'wb').close()
+    transcriptions = generate_transcriptions(parameters)
+    if transcriptions:
+        transcriptions_directory = os.path.join(root, 'transcriptions', meta_id)
+        os.makedirs(transcriptions_directory, exist_ok=True)
+        with open(os.path.join(transcriptions_directory, 'index.html'), 'w') as json_file:
+            json.dump(transcriptions, json_file)
+    return mets_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('root', help='pairtree root directory')
+    parser.add_argument('meta_id')
+    parser.add_argument('--manifestations', type=int, default=1)
+    parser.add_argument('--filesets', type=int, default=1)
+    parser.add_argument('--files-per-group', type=int, default=5)
+    parser.add_argument('--no-dimensions', dest='dimensions', action='store_false')
+    parser.add_argument('--extra-dimensions', type=int, default=0)
+    parser.add_argument('--transcriptions', type=int, default=0)
+    parser.add_argument('--creators', type=int, default=1)
+    parser.add_argument('--embargo', default=False, help='embargoUntil date (YYYY-MM-DD)')
+    args = vars(parser.parse_args())
+    root = args.pop('root')
+    meta_id = args.pop('meta_id')
+    print(generate_object(root, meta_id, **args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""Benchmark ResourceObject construction and its hot paths on synthetic
+objects, and compare the results with an earlier run.
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --compare results.json
+"""
+import argparse
+import datetime
+import functools
+import json
+import multiprocessing
+import os
+import platform
+import resource as rusage
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from lxml import etree
+
+from aubreylib import USE, system
+from aubreylib.resource import ResourceObject
+from benchmarks.generate import generate_object
+
+RESULTS_VERSION = 1
+
+# Shortest time (in seconds) of a timed sample of calls
+MIN_SAMPLE_TIME = 0.02
+
+# Object shapes benchmarked by default
+SCENARIOS = {
+    'small': {
+        'manifestations': 1, 'filesets': 1, 'files_per_group': 5,
+        'transcriptions': 0, 'creators': 1,
+    },
+    'medium': {
+        'manifestations': 2, 'filesets': 100, 'files_per_group': 6,
+        'transcriptions': 2, 'creators': 10, 'extra_dimensions': 500,
+    },
+    'large': {
+        'manifestations': 4, 'filesets': 1000, 'files_per_group': 9,
+        'transcriptions': 3, 'creators': 50, 'extra_dimensions': 5000,
+        'embargo': '2999-01-01',
+    },
+}
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """Static file handler that doesn't log each request."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(root):
+    """Serve root over HTTP on a local port, standing in for the
+    metadata, static file and transcriptions servers.
+    """
+    handler = functools.partial(QuietHandler, directory=root)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def measure(function, repeat):
+    """Return the wall time, allocations and peak RSS of function."""
+    # Warm up (imports, caches of the interpreter), and find how many
+    # calls make a sample long enough to time reliably
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        if time.perf_counter() - start >= MIN_SAMPLE_TIME:
+            break
+        number *= 10
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+    # Allocations are measured on a separate run, since tracing slows
+    # everything down
+    tracemalloc.start()
+    try:
+        function()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'repeat': repeat,
+        'number': number,
+        'wall_min': min(times),
+        'wall_median': statistics.median(times),
+        'wall_mean': statistics.mean(times),
+        'alloc_peak_bytes': peak,
+        'alloc_retained_bytes': retained,
+        'peak_rss_kb': get_peak_rss_kb(),
+    }
+
+
+def get_peak_rss_kb():
+    peak_rss = rusage.getrusage(rusage.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes rather than kilobytes
+    if sys.platform == 'darwin':
+        peak_rss //= 1024
+    return peak_rss
+
+
+def build_benchmarks(setup):
+    """Return (name, function) pairs for a generated object. setup has the
+    METS path, meta_id, local and HTTP locations of the object.
+    """
+    mets_path = setup['mets_path']
+    meta_id = setup['meta_id']
+    local_locations = setup['local_locations']
+    http_locations = setup['http_locations']
+    missing_locations = setup['missing_locations']
+    kwargs = {'transcriptions_server_url': setup['transcriptions_url']}
+
+    def resource_object_local():
+        ResourceObject(mets_path, local_locations, local_locations, '', USE, **kwargs)
+
+    def resource_object_http():
+        ResourceObject(meta_id, http_locations, http_locations, '', USE, **kwargs)
+
+    built = ResourceObject(mets_path, local_locations, local_locations, '', USE, **kwargs)
+    parsed_mets = etree.parse(mets_path)
+    index = built.get_mets_index(parsed_mets)
+    fileSets = index.get_divs('fileSet')
+
+    def get_file_pointers():
+        for fileSet in fileSets:
+            built.get_file_pointers(fileSet, index.fileSec, index.file_groups)
+
+    def get_embargo():
+        built.get_embargo()
+
+    def get_file_system(locations, file_name):
+        def run():
+            system.get_file_system(meta_id, file_name, locations)
+        return run
+
+    thumbnail = 'file://web/%s' % (os.path.basename(built.thumbnail_filename),)
+    return [
+        ('ResourceObject[file]', resource_object_local),
+        ('ResourceObject[http]', resource_object_http),
+        ('get_file_pointers', get_file_pointers),
+        ('get_embargo', get_embargo),
+        ('get_file_system[file]', get_file_system(local_locations, thumbnail)),
+        ('get_file_system[http]', get_file_system(http_locations, thumbnail)),
+        ('get_file_system[miss]', get_file_system(missing_locations, 'file://web/missing.jpg')),
+    ]
+
+
+def run_benchmark(setup, name, repeat):
+    """Run a single benchmark (in its own process, so the peak RSS is
+    its own).
+    """
+    for benchmark_name, function in build_benchmarks(setup):
+        if benchmark_name == name:
+            return measure(function, repeat)
+    raise KeyError(name)
+
+
+def run_scenario(root, scenario, parameters, base_url, repeat, only=None):
+    meta_id = 'metabench%s' % (scenario,)
+    mets_path = generate_object(root, meta_id, **parameters)
+    missing_root = os.path.join(root, 'missing')
+    setup = {
+        'mets_path': mets_path,
+        'meta_id': meta_id,
+        'local_locations': ('file://%s/' % (root,),),
+        'http_locations': ('%s/' % (base_url,),),
+        # Two misses before the file is found
+        'missing_locations': ('file://%s/' % (missing_root,), '%s/missing/' % (base_url,)),
+        'transcriptions_url': '%s/transcriptions' % (base_url,),
+    }
+    results = []
+    names = [name for name, _ in build_benchmarks(setup)]
+    for name in names:
+        if only and not any(pattern in name for pattern in only):
+            continue
+        # Spawned rather than forked, so the peak RSS isn't the parent's
+        with ProcessPoolExecutor(max_workers=1,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            result = executor.submit(run_benchmark, setup, name, repeat).result()
+        result.update({'benchmark': name, 'scenario': scenario, 'parameters': parameters})
+        results.append(result)
+        print('%-8s %-24s median %9.3f ms  min %9.3f ms  peak alloc %10d B  peak RSS %8d KB'
+              % (scenario, name, result['wall_median'] * 1000, result['wall_min'] * 1000,
+                 result['alloc_peak_bytes'], result['peak_rss_kb']))
+    return results
+
+
+def get_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print the change in median wall time and peak allocations from the
+    baseline results. Return the benchmarks slower than the threshold.
+    """
+    previous = {
+        (result['scenario'], result['benchmark']): result
+        for result in baseline['results']
+    }
+    regressions = []
+    print('\n%-8s %-24s %12s %12s' % ('scenario', 'benchmark', 'wall', 'alloc'))
+    for result in results:
+        key = (result['scenario'], result['benchmark'])
+        old = previous.get(key)
+        if old is None:
+            continue
+        wall_change = result['wall_median'] / old['wall_median'] - 1
+        alloc_change = (result['alloc_peak_bytes'] / old['alloc_peak_bytes'] - 1
+                        if old['alloc_peak_bytes'] else 0)
+        flag = ''
+        if wall_change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(key)
+        print('%-8s %-24s %+11.1f%% %+11.1f%%%s'
+              % (key[0], key[1], wall_change * 100, alloc_change * 100, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run (repeatable, default all)')
+    parser.add_argument('--benchmark', action='append',
+                        help='only run benchmarks whose name contains this (repeatable)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='slowdown (0.1 = 10%%) reported as a regression')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='aubreylib-bench-')
+    server = start_server(root)
+    base_url = 'http://127.0.0.1:%s' % (server.server_address[1],)
+    results = []
+    try:
+        for scenario in args.scenario or sorted(SCENARIOS):
+            results.extend(run_scenario(root, scenario, SCENARIOS[scenario], base_url,
+                                        args.repeat, args.benchmark))
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(root, ignore_errors=True)
+
+    output = {
+        'version': RESULTS_VERSION,
+        'date': datetime.datetime.utcnow().isoformat() + 'Z',
+        'revision': get_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(output, output_file, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+import io
+import multiprocessing
+import os
+import pickle
+from unittest import mock
+
+from aubreylib import cache
+
+
+class TestLRUCache:
+
+    def test_get_missing_returns_default(self):
+        lru = cache.LRUCache()
+        assert lru.get('missing') is None
+        assert lru.get('missing', 'default') == 'default'
+
+    def test_evicts_least_recently_used(self):
+        lru = cache.LRUCache(maxsize=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        # Touch 'a' so 'b' becomes the oldest entry.
+        lru.get('a')
+        lru.set('c', 3)
+        assert 'a' in lru
+        assert 'b' not in lru
+        assert 'c' in lru
+        assert len(lru) == 2
+
+    @mock.patch('time.monotonic')
+    def test_entries_expire(self, mocked_monotonic):
+        mocked_monotonic.return_value = 100
+        lru = cache.LRUCache(ttl=10)
+        lru.set('a', 1)
+        mocked_monotonic.return_value = 109
+        assert lru.get('a') == 1
+        mocked_monotonic.return_value = 110
+        assert lru.get('a') is None
+        assert len(lru) == 0
+
+
+class TestLocationCache:
+
+    @mock.patch('time.monotonic')
+    def test_hit_and_miss_ttls(self, mocked_monotonic):
+        mocked_monotonic.return_value = 0
+        location_cache = cache.LocationCache(hit_ttl=100, miss_ttl=5)
+        location_cache.set('hit', ('/disk/f.jpg', '/disk/'))
+        location_cache.set('miss', (None, None))
+        mocked_monotonic.return_value = 6
+        assert location_cache.get('hit') == ('/disk/f.jpg', '/disk/')
+        assert location_cache.get('miss') is None
+
+
+class TestDirectoryCache:
+
+    def test_set_and_get(self, tmp_path):
+        directory_cache = cache.DirectoryCache(str(tmp_path / 'snapshots'))
+        assert directory_cache.get('metapth1:2020-01-01') is None
+        directory_cache.set('metapth1:2020-01-01', b'snapshot')
+        assert directory_cache.get('metapth1:2020-01-01') == b'snapshot'
+        # Another instance on the same directory sees the value
+        assert cache.DirectoryCache(str(tmp_path / 'snapshots')).get(
+            'metapth1:2020-01-01') == b'snapshot'
+        directory_cache.delete('metapth1:2020-01-01')
+        assert directory_cache.get('metapth1:2020-01-01') is None
+
+
+class TestHTTPCache:
+
+    def test_set_and_get(self, tmp_path):
+        http_cache = cache.HTTPCache(str(tmp_path))
+        http_cache.set('http://example.com/a', [('ETag', '"1"')], io.BytesIO(b'data'))
+        metadata, body = http_cache.get('http://example.com/a')
+        with body:
+            assert body.read() == b'data'
+        assert metadata['headers'] == [['ETag', '"1"']]
+        assert http_cache.get('http://example.com/b') is None
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        http_cache = cache.HTTPCache(str(tmp_path), max_size=10)
+        for mtime, name in enumerate('abc'):
+            url = 'http://example.com/%s' % (name,)
+            http_cache.set(url, [], io.BytesIO(b'12345'))
+            # Make the use order independent of the timestamp resolution
+            os.utime(http_cache._filename(url, '.json'), (mtime, mtime))
+        assert http_cache.get('http://example.com/a') is None
+        for name in 'bc':
+            metadata, body = http_cache.get('http://example.com/%s' % (name,))
+            body.close()
+
+
+def set_shared_value(path, key, value):
+    cache.SQLiteCache(path).set(key, value)
+
+
+class TestSQLiteCache:
+
+    def test_set_and_get(self, tmp_path):
+        sqlite_cache = cache.SQLiteCache(str(tmp_path / 'cache.db'))
+        assert sqlite_cache.get('metapth1:2020-01-01') is None
+        sqlite_cache.set('metapth1:2020-01-01', b'snapshot')
+        sqlite_cache.set(('metapth1', '/web/1.jpg'), ('/disk/1.jpg', '/disk/'))
+        assert sqlite_cache.get('metapth1:2020-01-01') == b'snapshot'
+        assert sqlite_cache.get(('metapth1', '/web/1.jpg')) == ('/disk/1.jpg', '/disk/')
+        assert len(sqlite_cache) == 2
+        sqlite_cache.delete('metapth1:2020-01-01')
+        assert 'metapth1:2020-01-01' not in sqlite_cache
+
+    @mock.patch('time.time')
+    def test_entries_expire(self, mocked_time, tmp_path):
+        mocked_time.return_value = 100
+        sqlite_cache = cache.SQLiteCache(str(tmp_path / 'cache.db'), ttl=10)
+        sqlite_cache.set('a', b'1')
+        mocked_time.return_value = 109
+        assert sqlite_cache.get('a') == b'1'
+        mocked_time.return_value = 110
+        assert sqlite_cache.get('a') is None
+        assert len(sqlite_cache) == 0
+
+    @mock.patch('time.time')
+    def test_evicts_least_recently_used(self, mocked_time, tmp_path):
+        sqlite_cache = cache.SQLiteCache(str(tmp_path / 'cache.db'), max_size=12)
+        sqlite_cache.access_resolution = 0
+        for now, name in enumerate('abc'):
+            mocked_time.return_value = now
+            if name == 'c':
+                # Use 'a' so 'b' is the least recently used
+                assert sqlite_cache.get('a') == b'12345'
+            sqlite_cache.set(name, b'12345')
+        assert sqlite_cache.get('b') is None
+        assert sqlite_cache.get('a') == sqlite_cache.get('c') == b'12345'
+        assert sqlite_cache.total_size() == 10
+
+    def test_shared_between_processes(self, tmp_path):
+        path = str(tmp_path / 'cache.db')
+        sqlite_cache = cache.SQLiteCache(path)
+        context = multiprocessing.get_context('spawn')
+        process = context.Process(target=set_shared_value, args=(path, 'a', b'from child'))
+        process.start()
+        process.join(30)
+        assert process.exitcode == 0
+        assert sqlite_cache.get('a') == b'from child'
+        # Pickled caches reconnect to the same file
+        assert pickle.loads(pickle.dumps(sqlite_cache)).get('a') == b'from child'
+
+    @mock.patch('time.time')
+    def test_shared_location_cache_ttls(self, mocked_time, tmp_path):
+        mocked_time.return_value = 0
+        location_cache = cache.SharedLocationCache(str(tmp_path / 'cache.db'),
+                                                   hit_ttl=100, miss_ttl=5)
+        location_cache.set('hit', ('/disk/f.jpg', '/disk/'))
+        location_cache.set('miss', (None, None))
+        mocked_time.return_value = 6
+        assert location_cache.get('hit') == ('/disk/f.jpg', '/disk/')
+        assert location_cache.get('miss') is None
@@ -0,0 +1,251 @@
+import os
+import socket
+import threading
+import urllib.error
+import urllib.request
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from aubreylib import cache, connection, system
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.client_ports.append(self.client_address[1])
+        if self.path == '/missing':
+            self.send_error(404)
+            return
+        if self.path == '/moved':
+            self.send_response(302)
+            self.send_header('Location', '/file.xml')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = b'<root>%s</root>' % self.path.encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    do_HEAD = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+    httpd.client_ports = []
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def base_url(httpd):
+    return 'http://127.0.0.1:%s' % (httpd.server_address[1],)
+
+
+class TestConnectionPool:
+
+    def test_connection_is_reused(self, server):
+        """Test sequential requests to one host share a connection."""
+        pool = connection.ConnectionPool()
+        for name in ('a', 'b', 'c'):
+            response = pool.urlopen('%s/%s' % (base_url(server), name))
+            assert response.getcode() == 200
+            assert response.read() == b'<root>/%s</root>' % name.encode()
+        assert len(server.client_ports) == 3
+        assert len(set(server.client_ports)) == 1
+        pool.close()
+
+    def test_head_request_releases_connection(self, server):
+        """Test a HEAD response is returned to the pool without a read."""
+        pool = connection.ConnectionPool()
+        request = urllib.request.Request('%s/a' % (base_url(server),))
+        request.get_method = lambda: 'HEAD'
+        assert pool.urlopen(request, timeout=6).getcode() == 200
+        pool.urlopen('%s/b' % (base_url(server),)).read()
+        assert len(set(server.client_ports)) == 1
+        pool.close()
+
+    def test_idle_connections_are_evicted(self, server):
+        """Test connections idle past idle_timeout aren't reused."""
+        pool = connection.ConnectionPool(idle_timeout=0)
+        pool.urlopen('%s/a' % (base_url(server),)).read()
+        pool.urlopen('%s/b' % (base_url(server),)).read()
+        assert len(set(server.client_ports)) == 2
+
+    def test_default_timeout(self, server):
+        """Test requests without a timeout use the socket default, also
+        on a reused connection that had a timeout before.
+        """
+        pool = connection.ConnectionPool()
+        previous_timeout = socket.getdefaulttimeout()
+        socket.setdefaulttimeout(7)
+        try:
+            pool.urlopen('%s/a' % (base_url(server),), timeout=3).read()
+            conn, _ = pool._idle[('http', base_url(server)[7:])][-1]
+            assert conn.sock.gettimeout() == 3
+            pool.urlopen('%s/b' % (base_url(server),)).read()
+            assert conn.sock.gettimeout() == 7
+        finally:
+            socket.setdefaulttimeout(previous_timeout)
+            pool.close()
+        assert len(set(server.client_ports)) == 1
+
+    def test_max_connections(self, server):
+        """Test requests wait for a free connection to a host that has
+        max_connections open, and give up after wait_timeout.
+        """
+        pool = connection.ConnectionPool(max_connections=1, wait_timeout=0.1)
+        url = '%s/a' % (base_url(server),)
+        response = pool.urlopen(url)
+        with pytest.raises(urllib.error.URLError):
+            pool.urlopen(url)
+        # Once the first response is done its connection is used
+        threading.Timer(0.05, response.read).start()
+        pool.wait_timeout = None
+        assert pool.urlopen(url).read() == b'<root>/a</root>'
+        assert len(set(server.client_ports)) == 1
+        pool.close()
+        assert pool._open[('http', base_url(server)[7:])] == 0
+
+    def test_error_status_raises_http_error(self, server):
+        pool = connection.ConnectionPool()
+        with pytest.raises(urllib.error.HTTPError) as excinfo:
+            pool.urlopen('%s/missing' % (base_url(server),))
+        assert excinfo.value.code == 404
+
+    def test_redirect_is_followed(self, server):
+        pool = connection.ConnectionPool()
+        response = pool.urlopen('%s/moved' % (base_url(server),))
+        assert response.read() == b'<root>/file.xml</root>'
+        assert response.geturl() == '%s/file.xml' % (base_url(server),)
+
+
+class TestSystemConnectionPool:
+
+    def test_open_system_file_uses_pool(self, server):
+        """Test system functions go through the shared pool."""
+        system.set_connection_pool(connection.ConnectionPool())
+        try:
+            for name in ('a', 'b'):
+                url = '%s/%s' % (base_url(server), name)
+                assert system.open_system_file(url).read() == \
+                    b'<root>/%s</root>' % name.encode()
+        finally:
+            system.set_connection_pool(None)
+        assert len(set(server.client_ports)) == 1
+
+    def test_thread_pool_is_used_by_its_thread(self, server):
+        """Test a pool set for a thread is used there, and by the
+        concurrent probes it starts, but not by other threads.
+        """
+        pool = connection.ConnectionPool()
+        pools = []
+
+        def probe():
+            system.set_thread_settings(pool)
+            try:
+                pools.append(system.get_connection_pool())
+                assert system.get_file_system('metapthx', '/missing',
+                                              (base_url(server) + '/',) * 2,
+                                              concurrent=True) == (None, None)
+            finally:
+                system.set_thread_settings()
+        with mock.patch.object(pool, 'urlopen', wraps=pool.urlopen) as mocked_urlopen:
+            thread = threading.Thread(target=probe)
+            thread.start()
+            thread.join()
+        assert pools == [pool]
+        assert system.get_connection_pool() is None
+        assert mocked_urlopen.call_count == 2
+        pool.close()
+
+
+class ETagHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        etag = '"v%s"' % (self.server.version,)
+        if self.headers.get('If-None-Match') == etag:
+            self.server.statuses.append(304)
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.server.statuses.append(200)
+        body = b'<root>%s %s</root>' % (self.path.encode(), etag.encode())
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def etag_server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), ETagHandler)
+    httpd.version = 1
+    httpd.statuses = []
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestHTTPCache:
+
+    @pytest.mark.parametrize('pooled', [False, True])
+    def test_unchanged_response_served_from_cache(self, etag_server, tmp_path, pooled):
+        """Test a 304 response is served from the cache."""
+        url = '%s/file.xml' % (base_url(etag_server),)
+        system.set_http_cache(cache.HTTPCache(str(tmp_path)))
+        if pooled:
+            system.set_connection_pool(connection.ConnectionPool())
+        try:
+            bodies = []
+            for version in (1, 1, 2):
+                etag_server.version = version
+                with system.open_system_file(url, cache=True) as response:
+                    assert response.getcode() == 200
+                    bodies.append(response.read())
+        finally:
+            system.set_http_cache(None)
+            system.set_connection_pool(None)
+        assert bodies == [b'<root>/file.xml "v1"</root>'] * 2 + [b'<root>/file.xml "v2"</root>']
+        assert etag_server.statuses == [200, 304, 200]
+
+    @pytest.mark.parametrize('path, cache_option, max_entry_size', [
+        # Static files aren't cached
+        ('/video.mp4', False, 1024),
+        # Nor are urls with query arguments (pseudo-streaming)
+        ('/video.mp4?start=10', True, 1024),
+        # Nor responses over the size limit
+        ('/file.xml', True, 10),
+    ])
+    def test_response_not_cached(self, etag_server, tmp_path, path, cache_option,
+                                 max_entry_size):
+        url = '%s%s' % (base_url(etag_server), path)
+        http_cache = cache.HTTPCache(str(tmp_path), max_entry_size=max_entry_size)
+        system.set_http_cache(http_cache)
+        try:
+            for _ in range(2):
+                with system.open_url(url, cache=cache_option) as response:
+                    assert response.read().startswith(b'<root>')
+        finally:
+            system.set_http_cache(None)
+        assert etag_server.statuses == [200, 200]
+        assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,148 @@
+import os
+import time
+import urllib.error
+from unittest import mock
+
+import pytest
+
+from aubreylib import health, location, system
+from aubreylib.cache import LocationCache
+
+
+class TestHealthTracker:
+
+    def test_circuit_opens_after_threshold(self):
+        tracker = health.HealthTracker(failure_threshold=2)
+        tracker.record_failure('http://a.edu/')
+        assert tracker.allow('http://a.edu/')
+        tracker.record_failure('http://a.edu/')
+        assert tracker.get_state('http://a.edu/') == health.OPEN
+        assert not tracker.allow('http://a.edu/')
+
+    def test_half_open_allows_one_trial(self):
+        tracker = health.HealthTracker(failure_threshold=1, reset_timeout=0)
+        tracker.record_failure('http://a.edu/')
+        assert tracker.allow('http://a.edu/')
+        assert tracker.get_state('http://a.edu/') == health.HALF_OPEN
+        assert not tracker.allow('http://a.edu/')
+        tracker.record_success('http://a.edu/', 0.1)
+        assert tracker.get_state('http://a.edu/') == health.CLOSED
+        assert tracker.allow('http://a.edu/')
+
+    def test_failed_trial_opens_circuit(self):
+        tracker = health.HealthTracker(failure_threshold=1, reset_timeout=0)
+        tracker.record_failure('http://a.edu/')
+        assert tracker.allow('http://a.edu/')
+        tracker.record_failure('http://a.edu/')
+        assert tracker.get_state('http://a.edu/') == health.OPEN
+
+    def test_order(self):
+        tracker = health.HealthTracker(failure_threshold=2)
+        locations = ('http://a.edu/', 'http://b.edu/', 'http://c.edu/')
+        tracker.record_failure('http://a.edu/')
+        tracker.record_failure('http://b.edu/')
+        tracker.record_failure('http://b.edu/')
+        # Open locations are skipped, failing ones are tried last
+        assert tracker.order(locations) == ['http://c.edu/', 'http://a.edu/']
+
+    def test_latency_moving_average(self):
+        tracker = health.HealthTracker(latency_weight=0.5)
+        tracker.record_success('http://a.edu/', 1.0)
+        tracker.record_success('http://a.edu/', 2.0)
+        assert tracker.snapshot()['http://a.edu/']['latency'] == 1.5
+
+    def test_background_recovery(self):
+        checker = mock.Mock(return_value=True)
+        tracker = health.HealthTracker(failure_threshold=1, reset_timeout=60,
+                                       recovery_interval=0.01, checker=checker)
+        try:
+            tracker.record_failure('http://a.edu/')
+            deadline = time.monotonic() + 2
+            while tracker.get_state('http://a.edu/') != health.CLOSED:
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+        finally:
+            tracker.stop()
+        checker.assert_called_with('http://a.edu/')
+
+
+class TestSystemLocationHealth:
+
+    location_tuple = ('http://down.edu/', 'http://up.edu/')
+
+    @pytest.fixture
+    def tracker(self):
+        tracker = health.HealthTracker(failure_threshold=1)
+        system.set_location_health(tracker)
+        yield tracker
+        system.set_location_health(None)
+
+    @mock.patch('urllib.request.urlopen')
+    def test_down_location_is_skipped(self, mocked_urlopen, tracker):
+        def urlopen(request, timeout=None):
+            if 'down.edu' in request.full_url:
+                raise urllib.error.URLError('timed out')
+            return mock.Mock(**{'getcode.return_value': 200})
+        mocked_urlopen.side_effect = urlopen
+        for _ in range(2):
+            path, location = system.get_file_system('metapthx', '/web/4.jpg',
+                                                    self.location_tuple)
+            assert location == 'http://up.edu/'
+        assert tracker.get_state('http://down.edu/') == health.OPEN
+        # The down location was only tried the first time
+        assert mocked_urlopen.call_count == 3
+        assert tracker.checker is system.check_location_available
+
+    @mock.patch('urllib.request.urlopen')
+    def test_missing_file_is_not_a_failure(self, mocked_urlopen, tracker):
+        mocked_urlopen.side_effect = urllib.error.HTTPError(
+            'http://up.edu/web/4.jpg', 404, 'Not Found', {}, None)
+        assert system.get_file_system('metapthx', '/web/4.jpg',
+                                      self.location_tuple) == (None, None)
+        assert tracker.get_state('http://down.edu/') == health.CLOSED
+
+    @pytest.mark.parametrize('concurrent', [False, True])
+    @mock.patch('time.monotonic')
+    @mock.patch('urllib.request.urlopen')
+    def test_miss_with_down_location_is_cached_briefly(self, mocked_urlopen,
+                                                       mocked_monotonic, tracker,
+                                                       concurrent):
+        def urlopen(request, timeout=None):
+            if 'down.edu' in request.full_url:
+                raise urllib.error.URLError('timed out')
+            raise urllib.error.HTTPError(request.full_url, 404, 'Not Found', {}, None)
+        mocked_urlopen.side_effect = urlopen
+        mocked_monotonic.return_value = 0
+        location_cache = LocationCache(miss_ttl=60, unavailable_ttl=5)
+        for now in (0, 1, 6):
+            mocked_monotonic.return_value = now
+            assert system.get_file_system('metapthx', '/web/4.jpg', self.location_tuple,
+                                          cache=location_cache,
+                                          concurrent=concurrent) == (None, None)
+        # The miss was served from the cache until unavailable_ttl passed,
+        # and the down location was skipped after that
+        assert mocked_urlopen.call_count == 3
+
+    @mock.patch('urllib.request.urlopen')
+    def test_failover_skips_local_locations(self, mocked_urlopen, tracker, tmp_path):
+        """Test failed failovers don't open the circuit of a local location
+        that the files can still be found on.
+        """
+        mocked_urlopen.side_effect = urllib.error.URLError('timed out')
+        local_location = 'file:/%s/' % (tmp_path,)
+        mets_path = str(tmp_path) + system.get_pair_path('metapthx') + '/metapthx.mets.xml'
+        os.makedirs(os.path.dirname(mets_path))
+        open(mets_path, 'w').close()
+        config = location.LocationConfig((local_location, 'http://down.edu/'))
+        try:
+            for _ in range(3):
+                with pytest.raises(system.SystemMethodsException):
+                    system.get_other_system('http://gone.edu/metapthx.mets.xml',
+                                            config=config)
+        finally:
+            system.failover_hosts.clear()
+        assert tracker.get_state(local_location) == health.CLOSED
+        assert [call[0][0] for call in mocked_urlopen.call_args_list] == [
+            'http://down.edu/metapthx.mets.xml']
+        assert system.get_file_system('metapthx', mets_path, (local_location,)) == (
+            mets_path, str(tmp_path) + '/')
@@ -0,0 +1,114 @@
+import pickle
+from unittest.mock import patch
+
+import pytest
+
+from aubreylib import index, resource, system
+
+
+@pytest.fixture
+def locations(tmp_path):
+    """Two file:// locations, with metapth1 in both."""
+    first = tmp_path / 'first'
+    second = tmp_path / 'second'
+    for root, meta_ids in ((first, ('metapth1', 'metapth22')),
+                           (second, ('metapth1', 'metadc333'))):
+        for meta_id in meta_ids:
+            object_directory = root / system.get_pair_path(meta_id)[1:]
+            (object_directory / 'web').mkdir(parents=True)
+            (object_directory / (meta_id + '.mets.xml')).touch()
+    return 'file://%s/' % first, 'file://%s/' % second
+
+
+class TestBuildLocationIndex:
+
+    def test_find_local_objects(self, locations):
+        assert sorted(index.find_local_objects(locations[0])) == ['metapth1', 'metapth22']
+
+    def test_first_location_is_indexed(self, locations):
+        location_index = index.build_location_index(locations, locations[::-1])
+        assert len(location_index) == 3
+        assert location_index.get('metapth1') == (locations[0], locations[1])
+        assert location_index.get('metapth22') == (locations[0], locations[0])
+        assert location_index.get('metadc333') == (locations[1], locations[1])
+        assert location_index.get('metapth4') == (None, None)
+
+    def test_remote_locations_are_skipped(self, locations):
+        location_index = index.build_location_index(('http://example.com/',), ())
+        assert len(location_index) == 0
+
+
+class TestMappedLocationIndex:
+
+    def test_lookup(self, tmp_path):
+        entries = {'meta%05d' % number: ('file://disk%d/' % (number % 3), None)
+                   for number in range(500)}
+        path = str(tmp_path / 'locations.idx')
+        index.LocationIndex(entries).save(path)
+        mapped_index = index.load_location_index(path)
+        try:
+            assert len(mapped_index) == 500
+            for meta_id, entry in entries.items():
+                assert mapped_index.get(meta_id) == entry
+            for meta_id in ('meta', 'meta00000a', 'meta99999', 'aaa', 'zzz'):
+                assert mapped_index.get(meta_id) == (None, None)
+        finally:
+            mapped_index.close()
+
+    def test_empty_index(self, tmp_path):
+        path = str(tmp_path / 'locations.idx')
+        index.LocationIndex().save(path)
+        mapped_index = index.MappedLocationIndex(path)
+        assert len(mapped_index) == 0
+        assert mapped_index.get('metapth1') == (None, None)
+
+    def test_pickle_keeps_path(self, tmp_path, locations):
+        path = str(tmp_path / 'locations.idx')
+        index.build_location_index(locations, ()).save(path)
+        mapped_index = pickle.loads(pickle.dumps(index.MappedLocationIndex(path)))
+        assert mapped_index.get('metadc333') == (locations[1], None)
+
+    def test_not_an_index(self, tmp_path):
+        path = tmp_path / 'locations.idx'
+        path.write_bytes(b'metapth1\t0\t0\n')
+        with pytest.raises(ValueError):
+            index.MappedLocationIndex(str(path))
+
+
+class TestIndexedLookup:
+
+    location_tuple = ('file://disk1/', 'file://disk2/', 'file://disk3/')
+
+    @patch('os.path.exists')
+    def test_indexed_location_is_checked_first(self, mocked_exists):
+        mocked_exists.return_value = True
+        result = system.get_file_system('metapthx', 'file://web/4.jpg', self.location_tuple,
+                                        indexed_location='file://disk3/')
+        assert result == ('/disk3/me/ta/pt/hx/metapthx/web/4.jpg', '/disk3/')
+        mocked_exists.assert_called_once_with('/disk3/me/ta/pt/hx/metapthx/web/4.jpg')
+
+    @patch('os.path.exists')
+    def test_stale_index_falls_back_to_probing(self, mocked_exists):
+        mocked_exists.side_effect = lambda path: path.startswith('/disk2/')
+        result = system.get_file_system('metapthx', 'file://web/4.jpg', self.location_tuple,
+                                        indexed_location='file://disk3/')
+        assert result == ('/disk2/me/ta/pt/hx/metapthx/web/4.jpg', '/disk2/')
+        assert mocked_exists.call_count == 3
+
+    @patch('os.path.exists')
+    def test_unknown_indexed_location_is_ignored(self, mocked_exists):
+        mocked_exists.return_value = True
+        result = system.get_file_system('metapthx', 'file://web/4.jpg', self.location_tuple,
+                                        indexed_location='file://disk9/')
+        assert result == ('/disk1/me/ta/pt/hx/metapthx/web/4.jpg', '/disk1/')
+
+    @patch('aubreylib.system.probe_location')
+    def test_get_mets_record_system(self, mocked_probe):
+        mocked_probe.return_value = ('/me/ta/pt/hx/metapthx/metapthx.mets.xml', '/disk2/')
+        location_index = index.LocationIndex({'metapthx': ('file://disk2/', None)})
+        result = resource.get_mets_record_system('metapthx', '/me/ta/pt/hx/metapthx',
+                                                 self.location_tuple,
+                                                 location_index=location_index)
+        assert result == mocked_probe.return_value
+        mocked_probe.assert_called_once_with(
+            'metapthx', '/me/ta/pt/hx/metapthx/metapthx.mets.xml', 'file://disk2/')
@@ -0,0 +1,84 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from aubreylib import instrument, resource, system, USE
+from aubreylib.cache import LocationCache
+
+
+@pytest.fixture
+def recorder():
+    span_recorder = instrument.SpanRecorder()
+    instrument.add_sink(span_recorder)
+    yield span_recorder
+    instrument.remove_sink(span_recorder)
+
+
+class TestSpan:
+
+    def test_no_sinks_returns_null_span(self):
+        assert instrument.span('stage', host='example.com') is instrument.NULL_SPAN
+
+    def test_span_is_given_to_sinks(self, recorder):
+        with instrument.span('stage', host='example.com') as stage_span:
+            stage_span.set(bytes=10)
+        recorded, = recorder.spans
+        assert recorded.name == 'stage'
+        assert recorded.attributes == {'host': 'example.com', 'bytes': 10}
+        assert recorded.duration >= 0
+
+    def test_span_records_error(self, recorder):
+        with pytest.raises(ValueError):
+            with instrument.span('stage'):
+                raise ValueError()
+        assert recorder.get('stage')[0].attributes['error'] == 'ValueError'
+
+    def test_failing_sink_is_ignored(self, recorder):
+        def failing_sink(finished_span):
+            raise RuntimeError()
+        instrument.add_sink(failing_sink)
+        try:
+            with instrument.span('stage'):
+                pass
+        finally:
+            instrument.remove_sink(failing_sink)
+        assert recorder.names() == ['stage']
+
+
+class TestInstrumentation:
+
+    @patch('os.path.exists')
+    def test_get_file_system_cache_status(self, mocked_exists, recorder):
+        mocked_exists.return_value = True
+        location_cache = LocationCache()
+        for _ in range(2):
+            system.get_file_system('metapthx', 'web/4.jpg', ('file://disk2/',),
+                                   cache=location_cache)
+        lookups = recorder.get('system.get_file_system')
+        assert [lookup.attributes['cache'] for lookup in lookups] == ['miss', 'hit']
+        probe, = recorder.get('system.probe_location')
+        assert probe.attributes == {'meta_id': 'metapthx', 'host': 'disk2', 'found': True}
+
+    @patch.object(resource.ResourceObject, 'get_fileSet_file')
+    def test_resource_object_stages(self, mocked_fileSet_file, recorder):
+        mocked_fileSet_file.return_value = {'file_mimetype': '',
+                                            'file_name': '',
+                                            'files_system': ''}
+        current_directory = os.path.dirname(os.path.abspath(__file__))
+        mets_path = '{0}/data/metapth12434.mets.xml'.format(current_directory)
+        ro = resource.ResourceObject(identifier=mets_path, metadataLocations=[],
+                                     staticFileLocations=[], mimetypeIconsPath='', use=USE)
+        # Completeness is computed when it is first used
+        assert 'resource.completeness' not in recorder.names()
+        ro.completeness
+        names = recorder.names()
+        for name in ('resource.dimensions', 'resource.parse_mets', 'resource.desc_metadata',
+                     'resource.mets_index', 'resource.images',
+                     'resource.manifestations', 'resource.embargo',
+                     'resource.author_citation', 'resource.completeness'):
+            assert name in names
+        desc_metadata, = recorder.get('resource.desc_metadata')
+        assert desc_metadata.attributes['bytes'] == os.path.getsize(
+            mets_path.replace('.mets.xml', '.untl.xml'))
+        assert len(recorder.get('system.open_file')) == 3
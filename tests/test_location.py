@@ -0,0 +1,109 @@
+import os
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from aubreylib import location, resource, system, USE
+
+
+@pytest.fixture
+def no_django():
+    with mock.patch('aubreylib.location._django_settings', None):
+        yield
+
+
+class TestLocation:
+
+    def test_local_location(self):
+        local = location.Location('file://disk2/')
+        assert local.is_local and not local.is_remote
+        assert local.local_path == '/disk2/'
+
+    def test_remote_location(self):
+        remote = location.Location('https://unt.edu/disk3/')
+        assert remote.is_remote and not remote.is_local
+        assert (remote.scheme, remote.host, remote.path) == ('https', 'unt.edu', '/disk3/')
+
+    def test_get_location_is_memoized(self):
+        assert location.get_location('http://unt.edu/') is location.get_location('http://unt.edu/')
+
+    def test_is_url(self):
+        assert location.is_url('http://unt.edu/a.xml')
+        assert location.is_url('https://unt.edu/a.xml')
+        assert not location.is_url('/disk2/http://a.xml')
+
+
+class TestLocationConfig:
+
+    def test_kinds(self):
+        config = location.LocationConfig(('http://meta.edu/', 'file://disk1/'),
+                                         ('http://static.edu/', 'file://disk1/'))
+        assert config.all_locations == ('http://meta.edu/', 'file://disk1/',
+                                        'http://static.edu/', 'file://disk1/')
+        assert config.get_kind('http://static.edu/') == location.STATIC
+        # A location used for both is a metadata location
+        assert config.get_kind('file://disk1/') == location.METADATA
+        assert config.get_kind('http://other.edu/') is None
+
+    @mock.patch('aubreylib.METADATA_LOCATIONS', ('http://url.com/disk2',))
+    @mock.patch('aubreylib.STATIC_FILE_LOCATIONS', ('http://url2.com/disk2',))
+    def test_from_aubreylib_defaults(self, no_django):
+        config = location.LocationConfig.from_settings()
+        assert config.all_locations == ('http://url.com/disk2', 'http://url2.com/disk2')
+        assert config.repository_admin_contact is None
+
+    def test_from_django_settings(self):
+        settings = SimpleNamespace(METADATA_LOCATIONS=('http://url.com/',),
+                                   STATIC_FILE_LOCATIONS=(),
+                                   REPOSITORY_ADMIN_DICT={'name': 'Admin'})
+        with mock.patch('aubreylib.location._django_settings', settings):
+            config = location.LocationConfig.from_settings()
+        assert config.metadata_locations == ('http://url.com/',)
+        assert config.repository_admin_contact == {'name': 'Admin'}
+
+    def test_settings_config_is_reused_until_settings_change(self, no_django):
+        with mock.patch('aubreylib.METADATA_LOCATIONS', ('http://url.com/',)):
+            config = system.get_location_config()
+            assert system.get_location_config() is config
+        with mock.patch('aubreylib.METADATA_LOCATIONS', ('http://url2.com/',)):
+            assert system.get_location_config().metadata_locations == ('http://url2.com/',)
+
+    def test_set_location_config(self):
+        config = location.LocationConfig(('http://url.com/',))
+        system.set_location_config(config)
+        try:
+            assert system.get_location_config() is config
+        finally:
+            system.set_location_config(None)
+
+
+class TestLocationConfigUse:
+
+    @mock.patch('urllib.request.urlopen')
+    def test_get_other_system_config(self, mocked_urlopen):
+        mocked_urlopen.return_value = 'file'
+        config = location.LocationConfig((), ('http://url3.com/disk2',))
+        try:
+            assert system.get_other_system('http://example.com/disk1/a.jpg',
+                                           config=config) == 'file'
+        finally:
+            system.failover_hosts.clear()
+        mocked_urlopen.assert_called_once_with('http://url3.com/disk1/a.jpg', timeout=3)
+
+    @mock.patch.object(resource.ResourceObject, 'get_fileSet_file')
+    def test_repository_admin_contact(self, mocked_fileSet_file):
+        mocked_fileSet_file.return_value = {'file_mimetype': '',
+                                            'file_name': '',
+                                            'files_system': ''}
+        current_directory = os.path.dirname(os.path.abspath(__file__))
+        mets_path = '{0}/data/metapth12434.mets.xml'.format(current_directory)
+        contact = {'name': 'Admin', 'email': 'admin@example.com'}
+        config = location.LocationConfig(repository_admin_contact=contact)
+        ro = resource.ResourceObject(identifier=mets_path, metadataLocations=[],
+                                     staticFileLocations=[], mimetypeIconsPath='',
+                                     use=USE, location_config=config)
+        ro.desc_MD = {'date': [{'qualifier': 'embargoUntil', 'content': '2999-01-01'}]}
+        ro.get_embargo()
+        assert ro.embargo_info['embargo']
+        assert ro.embargo_info['repository_admin_contact'] == contact
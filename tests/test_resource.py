@@ -1,13 +1,21 @@
 #!/usr/bin/env python
 import os
+import pickle
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import mock_open, patch, MagicMock
 from io import BytesIO
 
 import pytest
+import urllib.error
 import urllib.request
 from lxml import etree
+from pyuntl.untldoc import untldict2py, untlxml2pydict
 
 from aubreylib import resource, USE
+from aubreylib.cache import DirectoryCache, LRUCache, SharedLocationCache
+from aubreylib.connection import ConnectionPool
+from aubreylib.location import LocationConfig
 
 
 def generate_creator_list(num_creators, creator_type, name):
@@ -66,6 +74,103 @@ class TestGetDimensionsData:
             assert returned_json is None
 
 
+class TestGetDescMetadata:
+
+    untl_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'data', 'metapth12434.untl.xml')
+
+    def test_get_desc_metadata_local(self):
+        desc_MD = resource.get_desc_metadata(self.untl_path, 'UNTL')
+        assert desc_MD['title'][0]['content'] == \
+            'Eagle Park Bleachers at the North Texas State College'
+
+    @patch('urllib.request.urlopen')
+    def test_get_desc_metadata_read_in_chunks(self, mocked_urlopen):
+        """Test a url response is fed to the parser as it is read."""
+        with open(self.untl_path, 'rb') as untl_file:
+            body = BytesIO(untl_file.read())
+        reads = []
+
+        def read(size=-1):
+            reads.append(size)
+            return body.read(min(size, 100))
+        response = MagicMock(spec=['read', 'close', 'info'])
+        response.read.side_effect = read
+        mocked_urlopen.return_value = response
+        desc_MD = resource.get_desc_metadata('http://example.com/metapthx.untl.xml', 'UNTL')
+        assert desc_MD == resource.get_desc_metadata(self.untl_path, 'UNTL')
+        assert len(reads) > 1 and -1 not in reads
+        response.close.assert_called_once_with()
+
+    def test_get_desc_metadata_unsupported_type(self):
+        with pytest.raises(resource.ResourceObjectException):
+            resource.get_desc_metadata(self.untl_path, 'MODS')
+
+
+class TestGetCachedDescMetadata:
+
+    untl_path = TestGetDescMetadata.untl_path
+
+    def test_local_file_cached_by_version(self, tmp_path):
+        untl_path = tmp_path / 'metapthx.untl.xml'
+        with open(self.untl_path, 'rb') as untl_file:
+            untl_path.write_bytes(untl_file.read())
+        desc_cache = LRUCache()
+        with patch('aubreylib.resource.untlxml2pydict',
+                   wraps=resource.untlxml2pydict) as mocked_parse:
+            desc_MD, completeness = resource.get_cached_desc_metadata(
+                str(untl_path), 'UNTL', desc_cache)
+            cached_desc_MD, cached_completeness = resource.get_cached_desc_metadata(
+                str(untl_path), 'UNTL', desc_cache)
+            assert mocked_parse.call_count == 1
+            assert cached_desc_MD == desc_MD and cached_desc_MD is not desc_MD
+            assert cached_completeness == completeness == \
+                untldict2py(desc_MD).completeness
+            # A changed file is parsed again
+            stat = os.stat(str(untl_path))
+            os.utime(str(untl_path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            resource.get_cached_desc_metadata(str(untl_path), 'UNTL', desc_cache)
+            assert mocked_parse.call_count == 2
+
+    @patch('aubreylib.resource.open_url')
+    def test_url_revalidated_with_etag(self, mocked_open_url):
+        with open(self.untl_path, 'rb') as untl_file:
+            body = untl_file.read()
+        response = MagicMock(spec=['read', 'close', 'info', 'getcode'])
+        response.read.side_effect = BytesIO(body).read
+        response.getcode.return_value = 200
+        response.info.return_value = {'ETag': '"v1"'}
+        not_modified = urllib.error.HTTPError('http://example.com/metapthx.untl.xml', 304,
+                                              'Not Modified', {}, None)
+        mocked_open_url.side_effect = [response, not_modified]
+        desc_cache = LRUCache()
+        url = 'http://example.com/metapthx.untl.xml'
+        first = resource.get_cached_desc_metadata(url, 'UNTL', desc_cache)
+        second = resource.get_cached_desc_metadata(url, 'UNTL', desc_cache)
+        assert first == second
+        request = mocked_open_url.call_args[0][0]
+        assert request.get_header('If-none-match') == '"v1"'
+
+    @patch.object(resource.ResourceObject, 'get_fileSet_file')
+    def test_resource_object_desc_metadata_cache(self, mocked_fileSet_file):
+        mocked_fileSet_file.return_value = {'file_mimetype': '',
+                                            'file_name': '',
+                                            'files_system': ''}
+        mets_path = self.untl_path.replace('.untl.xml', '.mets.xml')
+        desc_cache = LRUCache()
+        objects = [
+            resource.ResourceObject(identifier=mets_path, metadataLocations=[],
+                                    staticFileLocations=[], mimetypeIconsPath='', use=USE,
+                                    **kwargs)
+            for kwargs in ({}, {'desc_metadata_cache': desc_cache},
+                           {'desc_metadata_cache': desc_cache})
+        ]
+        assert len(desc_cache) == 1
+        for ro in objects[1:]:
+            assert ro.desc_MD == objects[0].desc_MD
+            assert ro.completeness == objects[0].completeness
+
+
 class TestGetTranscriptionsData:
 
     @pytest.mark.parametrize('resource_type', [
@@ -126,6 +231,23 @@ class TestGetTranscriptionsData:
         assert result == {'some': 'data'}
 
 
+class TestMetsIndex:
+
+    def test_index(self):
+        current_directory = os.path.dirname(os.path.abspath(__file__))
+        parsed_mets = etree.parse('{0}/data/metadc2280433.mets.xml'.format(current_directory))
+        root = parsed_mets.getroot()
+        index = resource.MetsIndex(root.find('fileSec'), root.find('structMap'))
+        manifestations = index.get_divs('manifestation')
+        assert [m.get('ORDER') for m in manifestations] == ['1', '2', '4']
+        assert index.get_divs('nonexistent') == []
+        assert index.first_fileSet is root.xpath('.//div[@TYPE="fileSet"][@ORDER="1"]')[0]
+        fileSet, manifestation = index.file_pointers['file_00211']
+        assert fileSet.get('TYPE') == 'fileSet'
+        assert manifestation is manifestations[0]
+        assert index.file_groups['file_00211'].get('ID') == 'fgrp_00001'
+
+
 class TestResourceObject:
 
     @patch.object(resource.ResourceObject, 'get_fileSet_file')
@@ -157,6 +279,26 @@ class TestResourceObject:
                               'flocat': 'file://web/pf_b-229.txt'}
         assert no_dimensions_data in ro.manifestation_dict[1][1]['file_ptrs']
 
+    @patch('aubreylib.resource.get_getCopy_data')
+    @patch.object(resource.ResourceObject, 'get_fileSet_file')
+    def testResourceObjectExecutor(self, mocked_fileSet_file, mocked_get_getCopy_data):
+        """Verifies dimensions and getCopy data fetched on an executor are used."""
+        mocked_fileSet_file.return_value = {'file_mimetype': '',
+                                            'file_name': '',
+                                            'files_system': ''}
+        mocked_get_getCopy_data.return_value = {'copies': 1}
+        current_directory = os.path.dirname(os.path.abspath(__file__))
+        mets_path = '{0}/data/metapth12434.mets.xml'.format(current_directory)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            ro = resource.ResourceObject(identifier=mets_path, metadataLocations=[],
+                                         staticFileLocations=[], mimetypeIconsPath='',
+                                         use=USE, getCopy_url='http://example.com/',
+                                         executor=executor)
+        mocked_get_getCopy_data.assert_called_once_with('http://example.com/', 'metapth12434')
+        assert ro.getCopy_data == {'copies': 1}
+        assert ro.dimensions['file://web/pf_b-229.jpg'] == {'width': 1500, 'height': 1154}
+
     @patch('aubreylib.resource.get_transcriptions_data')
     @patch.object(resource.ResourceObject, 'get_fileSet_file')
     def testResourceObjectTranscriptions(self, mocked_fileSet_file,
@@ -287,3 +429,400 @@ class TestResourceObject:
                                      staticFileLocations=[],
                                      mimetypeIconsPath='', use=USE)
         assert ro.wacz_dict == {}
+
+    @patch.object(resource.ResourceObject, 'get_fileSet_file')
+    def testResourceObjectSnapshot(self, mocked_fileSet_file):
+        """Verifies an unchanged object is restored from its snapshot."""
+        mocked_fileSet_file.return_value = {'file_mimetype': '',
+                                            'file_name': '',
+                                            'files_system': ''}
+        current_directory = os.path.dirname(os.path.abspath(__file__))
+        mets_path = '{0}/data/metapth12434.mets.xml'.format(current_directory)
+        snapshot_cache = LRUCache()
+
+        ro = resource.ResourceObject(identifier=mets_path, metadataLocations=[],
+                                     staticFileLocations=[], mimetypeIconsPath='',
+                                     use=USE, snapshot_cache=snapshot_cache)
+        assert resource.get_snapshot_key('metapth12434', '2009-06-17T23:48:57Z', USE) \
+            in snapshot_cache
+
+        with patch('aubreylib.resource.get_desc_metadata') as mocked_get_desc_metadata:
+            restored = resource.ResourceObject(identifier=mets_path, metadataLocations=[],
+                                               staticFileLocations=[], mimetypeIconsPath='',
+                                               use=USE, snapshot_cache=snapshot_cache)
+        mocked_get_desc_metadata.assert_not_called()
+        assert restored.desc_MD == ro.desc_MD
+        assert restored.manifestation_dict == ro.manifestation_dict
+        assert restored.thumbnail_filename == ro.thumbnail_filename
+        assert restored.embargo_info == ro.embargo_info
+        assert restored.completeness == ro.completeness
+
+    @pytest.mark.parametrize('options', [
+        {'compact': True},
+        {'use': dict(USE, high_res=99)},
+        {'transcriptions_server_url': 'http://transcriptions.edu/'},
+    ])
+    @patch.object(resource.ResourceObject, 'get_fileSet_file')
+    def testResourceObjectSnapshotOptions(self, mocked_fileSet_file, options):
+        """Verifies objects built with other options aren't restored."""
+        mocked_fileSet_file.return_value = {'file_mimetype': '',
+                                            'file_name': '',
+                                            'files_system': ''}
+        current_directory = os.path.dirname(os.path.abspath(__file__))
+        mets_path = '{0}/data/metapth12434.mets.xml'.format(current_directory)
+        snapshot_cache = LRUCache()
+        resource.ResourceObject(identifier=mets_path, metadataLocations=[],
+                                staticFileLocations=[], mimetypeIconsPath='',
+                                use=USE, snapshot_cache=snapshot_cache)
+        kwargs = dict({'use': USE}, **options)
+        with patch('aubreylib.resource.get_transcriptions_data', return_value={}):
+            ro = resource.ResourceObject(identifier=mets_path, metadataLocations=[],
+                                         staticFileLocations=[], mimetypeIconsPath='',
+                                         snapshot_cache=snapshot_cache, **kwargs)
+        unrestored = resource.ResourceObject(identifier=mets_path, metadataLocations=[],
+                                             staticFileLocations=[], mimetypeIconsPath='',
+                                             **kwargs)
+        assert ro.manifestation_dict == unrestored.manifestation_dict
+        assert ro.manifestation_view_types == unrestored.manifestation_view_types
+        # Compact objects aren't restored with dictionaries, or the reverse
+        assert type(ro.manifestation_dict[1][1]) is type(unrestored.manifestation_dict[1][1])
+        assert len(snapshot_cache) == 2
+
+    @pytest.mark.parametrize('options', [{}, {'lazy': True}, {'streaming': True}])
+    def testResourceObjectSnapshotStaticFilesMoved(self, mets_paths, tmp_path, options):
+        """Verifies the static files are located again when restoring a
+        snapshot rather than taken from it.
+        """
+        location, mets_path = mets_paths
+        moved_location = str(tmp_path / 'moved')
+        snapshot_cache = LRUCache()
+        ro = resource.ResourceObject(mets_path, ('file:/%s/' % location,),
+                                     ('file:/%s/' % location,), '', USE,
+                                     snapshot_cache=snapshot_cache)
+        assert ro.files_system == location + '/'
+        # Move the web files to another static file location
+        web_directory = os.path.join(os.path.dirname(mets_path), 'web')
+        shutil.move(web_directory, moved_location + web_directory[len(location):])
+        static_locations = ('file:/%s/' % location, 'file:/%s/' % moved_location)
+        with patch('aubreylib.resource.get_desc_metadata') as mocked_get_desc_metadata:
+            restored = resource.ResourceObject(mets_path, ('file:/%s/' % location,),
+                                               static_locations, '', USE,
+                                               snapshot_cache=snapshot_cache, **options)
+        mocked_get_desc_metadata.assert_not_called()
+        assert restored.files_system == moved_location + '/'
+        assert restored.thumbnail_filename == ro.thumbnail_filename
+
+    @patch.object(resource.ResourceObject, 'get_fileSet_file')
+    def testLazyResourceObject(self, mocked_fileSet_file):
+        """Verifies lazy objects only compute the attribute groups accessed."""
+        mocked_fileSet_file.return_value = {'file_mimetype': 'image/jpeg',
+                                            'file_name': 'file://web/thumb.jpg',
+                                            'files_system': '/disk2/'}
+        current_directory = os.path.dirname(os.path.abspath(__file__))
+        mets_path = '{0}/data/metapth12434.mets.xml'.format(current_directory)
+        ro = resource.ResourceObject(identifier=mets_path, metadataLocations=[],
+                                     staticFileLocations=[], mimetypeIconsPath='',
+                                     use=USE)
+
+        with patch('aubreylib.resource.get_desc_metadata',
+                   wraps=resource.get_desc_metadata) as mocked_get_desc_metadata, \
+                patch('aubreylib.resource.get_dimensions_data',
+                      wraps=resource.get_dimensions_data) as mocked_get_dimensions_data:
+            lazy_ro = resource.ResourceObject(identifier=mets_path, metadataLocations=[],
+                                              staticFileLocations=[], mimetypeIconsPath='',
+                                              use=USE, lazy=True)
+            assert lazy_ro.acp_modification_date == ro.acp_modification_date
+            assert lazy_ro.thumbnail_filename == ro.thumbnail_filename
+            assert lazy_ro.files_system == '/disk2/'
+            mocked_get_desc_metadata.assert_not_called()
+            mocked_get_dimensions_data.assert_not_called()
+
+            assert lazy_ro.manifestation_dict == ro.manifestation_dict
+            mocked_get_dimensions_data.assert_called_once()
+            # The transcriptions need the resource type
+            mocked_get_desc_metadata.assert_called_once()
+            assert lazy_ro.embargo_info == ro.embargo_info
+            assert lazy_ro.completeness == ro.completeness
+            mocked_get_desc_metadata.assert_called_once()
+        assert not hasattr(lazy_ro, '_parsed_mets')
+
+    @patch.object(resource.ResourceObject, 'get_fileSet_file')
+    def testPickleLazyResourceObject(self, mocked_fileSet_file):
+        """Verifies pickling a lazy object loads its remaining attributes."""
+        mocked_fileSet_file.return_value = {'file_mimetype': '',
+                                            'file_name': '',
+                                            'files_system': ''}
+        current_directory = os.path.dirname(os.path.abspath(__file__))
+        mets_path = '{0}/data/metapth12434.mets.xml'.format(current_directory)
+        lazy_ro = resource.ResourceObject(identifier=mets_path, metadataLocations=[],
+                                          staticFileLocations=[], mimetypeIconsPath='',
+                                          use=USE, lazy=True, location_cache=LRUCache())
+        unpickled = pickle.loads(pickle.dumps(lazy_ro))
+        assert unpickled.location_cache is None
+        assert unpickled.manifestation_dict == lazy_ro.manifestation_dict
+        assert unpickled.desc_MD == lazy_ro.desc_MD
+
+    @pytest.mark.parametrize('mets_name', [
+        'metapth12434.mets.xml',
+        'metadc2280433.mets.xml',
+    ])
+    @patch('aubreylib.resource.get_file_system')
+    def testStreamingResourceObject(self, mocked_get_file_system, mets_name):
+        """Verifies the streaming METS loader builds the same object."""
+        mocked_get_file_system.return_value = ('/disk2/path', '/disk2/')
+        current_directory = os.path.dirname(os.path.abspath(__file__))
+        mets_path = '{0}/data/{1}'.format(current_directory, mets_name)
+        ro = resource.ResourceObject(identifier=mets_path, metadataLocations=[],
+                                     staticFileLocations=[], mimetypeIconsPath='',
+                                     use=USE)
+        streamed_ro = resource.ResourceObject(identifier=mets_path, metadataLocations=[],
+                                              staticFileLocations=[], mimetypeIconsPath='',
+                                              use=USE, streaming=True)
+        assert streamed_ro.__dict__ == ro.__dict__
+
+    @patch('aubreylib.resource.get_file_system')
+    def testStreamingResourceObjectSnapshot(self, mocked_get_file_system):
+        """Verifies the streaming METS loader keeps the restored snapshot."""
+        mocked_get_file_system.return_value = ('/disk2/path', '/disk2/')
+        current_directory = os.path.dirname(os.path.abspath(__file__))
+        mets_path = '{0}/data/metadc2280433.mets.xml'.format(current_directory)
+        snapshot_cache = LRUCache()
+        ro = resource.ResourceObject(identifier=mets_path, metadataLocations=[],
+                                     staticFileLocations=[], mimetypeIconsPath='',
+                                     use=USE, streaming=True, snapshot_cache=snapshot_cache)
+        with patch('aubreylib.resource.get_desc_metadata') as mocked_get_desc_metadata:
+            restored = resource.ResourceObject(identifier=mets_path, metadataLocations=[],
+                                               staticFileLocations=[], mimetypeIconsPath='',
+                                               use=USE, streaming=True,
+                                               snapshot_cache=snapshot_cache)
+        mocked_get_desc_metadata.assert_not_called()
+        assert restored.manifestation_dict
+        assert restored.manifestation_dict == ro.manifestation_dict
+        assert restored.manifestation_labels == ro.manifestation_labels
+        assert restored.manifestation_view_types == ro.manifestation_view_types
+        assert restored.pdf_dict == ro.pdf_dict
+        assert restored.wacz_dict == ro.wacz_dict
+
+    @patch.object(resource.ResourceObject, 'get_fileSet_file')
+    def testCompactResourceObject(self, mocked_fileSet_file):
+        """Verifies compact file pointers and fileSets read like dictionaries."""
+        mocked_fileSet_file.return_value = {'file_mimetype': '',
+                                            'file_name': '',
+                                            'files_system': ''}
+        current_directory = os.path.dirname(os.path.abspath(__file__))
+        mets_path = '{0}/data/metapth12434.mets.xml'.format(current_directory)
+        transcriptions = {'1': {'1': [{'vtt_kind': 'captions'}, {'vtt_kind': 'chapters'}]}}
+        with patch('aubreylib.resource.get_transcriptions_data', return_value=transcriptions):
+            ro = resource.ResourceObject(identifier=mets_path, metadataLocations=[],
+                                         staticFileLocations=[], mimetypeIconsPath='',
+                                         use=USE)
+            compact_ro = resource.ResourceObject(identifier=mets_path, metadataLocations=[],
+                                                 staticFileLocations=[], mimetypeIconsPath='',
+                                                 use=USE, compact=True)
+        fileSet = compact_ro.manifestation_dict[1][1]
+        assert isinstance(fileSet, resource.FileSet)
+        assert fileSet['has_vtt_captions'] and fileSet['has_vtt_chapters']
+        assert not fileSet['has_vtt_subtitles']
+        file_ptr = fileSet['file_ptrs'][0]
+        assert isinstance(file_ptr, resource.FilePointer)
+        assert file_ptr['flocat'] == 'file://web/pf_b-229.jpg'
+        assert file_ptr.get('width') == 1500
+        assert 'SIZE' in file_ptr
+        with pytest.raises(KeyError):
+            fileSet['file_ptrs'][1]['SIZE']
+        assert compact_ro.manifestation_dict == ro.manifestation_dict
+        assert pickle.loads(pickle.dumps(compact_ro)).manifestation_dict == ro.manifestation_dict
+        # Subclasses have to provide keys() and __getitem__
+        with pytest.raises(TypeError):
+            resource.CompactRecord()
+
+
+@pytest.fixture
+def mets_paths(tmp_path):
+    """Copy the test METS into a pairtree with its web files."""
+    data_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+    object_directory = tmp_path / 'me/ta/pt/h1/24/34/metapth12434'
+    (object_directory / 'web').mkdir(parents=True)
+    for name in os.listdir(data_directory):
+        if name.startswith('metapth12434'):
+            with open(os.path.join(data_directory, name), 'rb') as data_file:
+                (object_directory / name).write_bytes(data_file.read())
+    for name in ('pf_b-229.jpg', 'pf_b-229.txt', 'square-pf_b-229.jpg',
+                 'thumbnail-pf_b-229.jpg', 'web-pf_b-229.jpg'):
+        (object_directory / 'web' / name).touch()
+    return str(tmp_path), str(object_directory / 'metapth12434.mets.xml')
+
+
+class TestLoadMany:
+
+    @pytest.mark.parametrize('use_processes', [False, True])
+    def test_load_many(self, mets_paths, use_processes):
+        location, mets_path = mets_paths
+        missing_path = mets_path.replace('metapth12434.mets', 'metapth99999.mets')
+        locations = ('file://%s/' % location,)
+        results = list(resource.load_many([mets_path, missing_path, mets_path],
+                                          locations, locations, '', USE,
+                                          max_workers=2, use_processes=use_processes))
+        assert sorted(result.identifier for result in results) == sorted(
+            [mets_path, mets_path, missing_path])
+        for result in results:
+            if result.identifier == missing_path:
+                assert result.resource is None
+                assert isinstance(result.error, Exception)
+            else:
+                assert result.error is None
+                assert result.resource.meta_id == 'metapth12434'
+                assert result.resource.thumbnail_filename.endswith('thumbnail-pf_b-229.jpg')
+
+    def test_load_many_processes_share_location_cache(self, mets_paths, tmp_path):
+        location, mets_path = mets_paths
+        locations = ('file://%s/' % location,)
+        location_cache = SharedLocationCache(str(tmp_path / 'locations.db'))
+        results = list(resource.load_many([mets_path], locations, locations, '', USE,
+                                          use_processes=True, location_cache=location_cache))
+        assert results[0].error is None
+        # The worker process stored its lookups in the shared cache
+        assert len(location_cache) > 0
+
+    def test_load_many_processes_drop_unshared_caches(self, mets_paths, tmp_path):
+        location, mets_path = mets_paths
+        locations = ('file://%s/' % location,)
+        snapshot_cache = DirectoryCache(str(tmp_path / 'snapshots'))
+        results = list(resource.load_many([mets_path], locations, locations, '', USE,
+                                          use_processes=True, snapshot_cache=snapshot_cache,
+                                          desc_metadata_cache=LRUCache()))
+        assert results[0].error is None
+        # The shared snapshot cache was used, the LRUCache wasn't pickled
+        assert os.listdir(snapshot_cache.path)
+
+    @pytest.mark.parametrize('given', [False, True])
+    def test_load_many_batch_settings(self, mets_paths, given):
+        """Test the batch's threads share a connection pool and location
+        config without the module's shared ones being changed.
+        """
+        location, mets_path = mets_paths
+        locations = ('file://%s/' % location,)
+        pool = ConnectionPool() if given else None
+        config = LocationConfig(locations, locations) if given else None
+        settings = []
+
+        def build(identifier, *args, **kwargs):
+            settings.append((resource.system.get_connection_pool(),
+                             resource.system.get_location_config(),
+                             kwargs['location_config']))
+        with patch.object(resource, 'ResourceObject', side_effect=build):
+            results = list(resource.load_many([mets_path] * 4, locations, locations, '',
+                                              USE, max_workers=2, connection_pool=pool,
+                                              location_config=config))
+        assert [result.error for result in results] == [None] * 4
+        assert len(set(settings)) == 1
+        batch_pool, batch_config, object_config = settings[0]
+        assert isinstance(batch_pool, ConnectionPool)
+        assert batch_config is object_config
+        if given:
+            assert (batch_pool, batch_config) == (pool, config)
+        assert resource.system.connection_pool is None
+        assert resource.system.get_connection_pool() is None
+        assert resource.system.location_config is None
+
+
+class TestThumbnailObject:
+
+    IMAGE_ATTRIBUTES = ('thumbnail_mimetype', 'thumbnail_filename', 'files_system',
+                        'square_mimetype', 'square_filename', 'medium_mimetype',
+                        'medium_filename', 'primary_fileSet', 'primary_manifestation')
+
+    def test_matches_resource_object(self, mets_paths):
+        location, mets_path = mets_paths
+        locations = ('file://%s/' % location,)
+        ro = resource.ResourceObject(mets_path, locations, locations, '', USE)
+        with patch('aubreylib.resource.get_desc_metadata') as mocked_desc_metadata, \
+                patch('aubreylib.resource.get_dimensions_data') as mocked_dimensions:
+            thumbnail = resource.ThumbnailObject(mets_path, locations, locations, USE)
+        mocked_desc_metadata.assert_not_called()
+        mocked_dimensions.assert_not_called()
+        for name in self.IMAGE_ATTRIBUTES:
+            assert getattr(thumbnail, name) == getattr(ro, name)
+        assert thumbnail.thumbnail_filename.endswith('thumbnail-pf_b-229.jpg')
+        assert thumbnail.thumbnail_icon_mimetype is None
+        assert thumbnail.acp_modification_date == ro.acp_modification_date
+        assert not hasattr(thumbnail, 'manifestation_dict')
+
+    def test_load_thumbnails(self, mets_paths):
+        location, mets_path = mets_paths
+        missing_path = mets_path.replace('metapth12434.mets', 'metapth99999.mets')
+        locations = ('file://%s/' % location,)
+        with patch.object(resource.system, 'set_connection_pool') as mocked_set_pool:
+            results = resource.load_thumbnails([mets_path, missing_path, mets_path],
+                                               locations, locations, USE, max_workers=2)
+        # The global connection pool is left to the caller
+        mocked_set_pool.assert_not_called()
+        assert resource.system.get_connection_pool() is None
+        assert [result.identifier for result in results] == [mets_path, missing_path,
+                                                             mets_path]
+        assert results[1].resource is None
+        assert isinstance(results[1].error, resource.ResourceObjectException)
+        for result in (results[0], results[2]):
+            assert result.error is None
+            assert result.resource.thumbnail_filename.endswith('thumbnail-pf_b-229.jpg')
+
+
+class TestCompleteness:
+
+    data_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+    @pytest.mark.parametrize('desc_MD', [
+        {},
+        {'title': [{'qualifier': 'officialtitle', 'content': ' A Title '}]},
+        {'title': [{'content': '{{{ title }}}'}], 'format': [{'content': 'text'}]},
+        {'description': [{'content': 'Change as necessary'}],
+         'language': [{'content': ''}, {'content': 'eng'}]},
+        {'meta': [{'qualifier': 'ark', 'content': 'ark:/1'},
+                  {'qualifier': ' system ', 'content': 'PTH'}],
+         'subject': [{'qualifier': 'KWD', 'content': 'Dogs'}]},
+        {'collection': [{'content': 'ABC'}], 'institution': [{'content': 'UNT'}],
+         'resourceType': [{'content': 'text'}],
+         'creator': [{'content': {'name': 'Name', 'type': 'per'}}]},
+    ])
+    def test_matches_pyuntl(self, desc_MD):
+        assert resource.get_completeness(desc_MD) == untldict2py(desc_MD).completeness
+
+    @pytest.mark.parametrize('name', ['metapth12434.untl.xml', 'metadc2280433.untl.xml'])
+    def test_matches_pyuntl_for_record(self, name):
+        desc_MD = untlxml2pydict(os.path.join(self.data_directory, name))
+        assert resource.get_completeness(desc_MD) == untldict2py(desc_MD).completeness
+
+    @pytest.mark.parametrize('element', sorted(resource.COMPLETENESS_WEIGHTS))
+    def test_weights_match_pyuntl(self, element):
+        # COMPLETENESS_WEIGHTS is a copy of the weights in
+        # pyuntl.quality.determine_completeness, so check each one still agrees
+        content = {'content': 'Content'}
+        if element in ('meta', 'title', 'description', 'subject'):
+            content['qualifier'] = 'system'
+        desc_MD = {element: [content]}
+        assert resource.get_completeness(desc_MD) == untldict2py(desc_MD).completeness > 0
+
+    def test_matches_pyuntl_for_records(self):
+        desc_MDs = [
+            untlxml2pydict(os.path.join(self.data_directory, name))
+            for name in ('metapth12434.untl.xml', 'metadc2280433.untl.xml')
+        ]
+        assert resource.get_completeness_scores(desc_MDs) == [
+            untldict2py(desc_MD).completeness for desc_MD in desc_MDs]
+
+    @patch.object(resource.ResourceObject, 'get_fileSet_file')
+    def test_completeness_computed_on_access(self, mocked_fileSet_file):
+        mocked_fileSet_file.return_value = {'file_mimetype': '',
+                                            'file_name': '',
+                                            'files_system': ''}
+        mets_path = os.path.join(self.data_directory, 'metapth12434.mets.xml')
+        with patch('aubreylib.resource.get_completeness',
+                   wraps=resource.get_completeness) as mocked_completeness:
+            ro = resource.ResourceObject(identifier=mets_path, metadataLocations=[],
+                                         staticFileLocations=[], mimetypeIconsPath='',
+                                         use=USE)
+            assert 'completeness' not in ro.__dict__
+            mocked_completeness.assert_not_called()
+            assert ro.completeness == untldict2py(ro.desc_MD).completeness
+            assert ro.completeness == ro.completeness
+            assert mocked_completeness.call_count == 1
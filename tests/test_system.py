@@ -1,6 +1,14 @@
+import email
+import http.client
+import socket
+import threading
+import time
+import urllib.error
 from unittest import mock
 import pytest
+from pypairtree import pairtree
 from aubreylib import system
+from aubreylib.cache import BlockCache, LocationCache
 
 
 class TestGetFileSystem:
@@ -101,6 +109,19 @@ class TestGetFileSystem:
         expected = (None, None)
         assert (path, location) == expected
 
+    @mock.patch('aubreylib.system.search_locations')
+    def test_results_are_cached(self, mocked_find):
+        """Test a cached result (including a miss) isn't looked up again."""
+        mocked_find.return_value = ((None, None), True)
+        location_cache = LocationCache()
+        for _ in range(3):
+            result = system.get_file_system('metapthx', 'web/4.jpg',
+                                            list(self.location_tuple),
+                                            cache=location_cache)
+            assert result == (None, None)
+        assert mocked_find.call_count == 1
+        assert ('metapthx', 'web/4.jpg', self.location_tuple) in location_cache
+
 
 class TestGetFilePath:
 
@@ -126,6 +147,46 @@ class TestGetCompleteFilePath:
         expected_path = 'http://unt.edu/disk2/me/ta/pt/hx/metapthx/web/4.jpg'
         assert complete_path == expected_path
 
+    def test_get_complete_filepaths(self):
+        """Test batches match get_complete_filepath."""
+        files = [('metapthx', 'file://web/4.jpg'), ('metapthx', 'file:/web/5.jpg'),
+                 ('metadc1', 'file://web/01_tif/1.tif'), ('metapthx', 'file://web/6.jpg')]
+        complete_paths = list(system.get_complete_filepaths(files, 'file://disk2/'))
+        assert complete_paths == [
+            system.get_complete_filepath(meta_id, file_name, 'file://disk2/')
+            for meta_id, file_name in files
+        ]
+
+    def test_get_complete_filepaths_raises_exception(self):
+        """Test invalid file name raises SystemMethodsException."""
+        with pytest.raises(system.SystemMethodsException):
+            list(system.get_complete_filepaths([('metapthx', '/web/4.jpg')], 'file://disk2/'))
+
+
+class TestGetPairPath:
+
+    @pytest.mark.parametrize('meta_id', ['metapth12434', 'metadc2280433', 'a', 'ab', '',
+                                         'ark:/67531/metapth1', '/abc', 'a.b+c=d,e'])
+    def test_matches_pypairtree(self, meta_id):
+        """Test the pair path is the one pypairtree computes."""
+        assert system.make_pair_path(meta_id) == pairtree.get_pair_path(meta_id)
+        assert system.get_pair_path(meta_id) == pairtree.get_pair_path(meta_id)
+
+    def test_get_pair_path_is_cached(self):
+        """Test repeated meta_ids are served from the cache."""
+        system.get_pair_path.cache_clear()
+        system.get_pair_path('metapth12434')
+        system.get_pair_path('metapth12434')
+        assert system.get_pair_path.cache_info().hits == 1
+
+    def test_get_pair_paths(self):
+        """Test batches bypass the cache."""
+        system.get_pair_path.cache_clear()
+        pair_paths = list(system.get_pair_paths(iter(['metapth1', 'metadc22'])))
+        assert pair_paths == [('metapth1', '/me/ta/pt/h1/metapth1'),
+                              ('metadc22', '/me/ta/dc/22/metadc22')]
+        assert system.get_pair_path.cache_info().currsize == 0
+
 
 class TestOpenSystemFile:
 
@@ -214,14 +275,175 @@ class TestOpenFileRange:
                                               None,
                                               {'Range': 'bytes=0-10'})
 
-    def test_open_file_range_with_non_url(self):
-        """Test result with file_name that is not a URL."""
-        file_obj = system.open_file_range('/this/is/local', (0, 10))
-        assert file_obj is None
+    def test_open_file_range_with_missing_local_file(self):
+        """Test a local file that doesn't exist raises exception."""
+        with pytest.raises(system.SystemMethodsException):
+            system.open_file_range('/this/is/local', (0, 10))
+
+    @pytest.mark.parametrize('content, range_tuple, expected', [
+        (b'0123456789' + b'a' * 10, (0, 9), b'0123456789'),
+        (b'0123456789' + b'a' * 10, (10, ''), b'a' * 10),
+        (b'0123456789' + b'a' * 10, ('', 3), b'aaa'),
+        (b'0123456789' + b'a' * 10, (19, 100), b'a'),
+        # A range beyond the first mapped page of the file
+        (b'x' * 5000 + b'0123456789' * 500, (5000, 9999), b'0123456789' * 500),
+    ])
+    def test_open_file_range_local(self, tmp_path, content, range_tuple, expected):
+        """Test the range of a local file is read."""
+        local_file = tmp_path / 'file.bin'
+        local_file.write_bytes(content)
+        with system.open_file_range(str(local_file), range_tuple) as range_file:
+            assert range_file.view == expected
+            assert range_file.read(3) == expected[:3]
+            buffer = bytearray(len(expected))
+            size = range_file.readinto(buffer)
+            assert bytes(buffer[:size]) == expected[3:]
+            assert range_file.read() == b''
+
+    def test_open_file_range_local_not_satisfiable(self, tmp_path):
+        local_file = tmp_path / 'file.bin'
+        local_file.write_bytes(b'0123456789')
+        with pytest.raises(system.SystemMethodsException):
+            system.open_file_range(str(local_file), (10, 20))
+
+
+class FakeRangeResponse:
+    """Response of a server that supports multi-range requests."""
+
+    boundary = 'THIS_STRING_SEPARATES'
+
+    def __init__(self, content, range_header, multipart=True):
+        ranges = [tuple(int(offset) for offset in spec.split('-'))
+                  for spec in range_header[len('bytes='):].split(',')]
+        if len(ranges) == 1 or not multipart:
+            start, end = ranges[0]
+            headers = 'Content-Range: bytes %s-%s/%s\r\n' % (start, end, len(content))
+            self.body = content[start:end + 1]
+        else:
+            headers = 'Content-Type: multipart/byteranges; boundary=%s\r\n' % (
+                self.boundary,)
+            self.body = b''
+            for start, end in ranges:
+                self.body += (b'\r\n--%s\r\nContent-Type: application/pdf\r\n'
+                              b'Content-Range: bytes %d-%d/%d\r\n\r\n'
+                              % (self.boundary.encode(), start, end, len(content)))
+                self.body += content[start:end + 1]
+            self.body += b'\r\n--%s--\r\n' % (self.boundary.encode(),)
+        self.headers = email.message_from_string(headers, _class=http.client.HTTPMessage)
+
+    def read(self):
+        return self.body
+
+    def info(self):
+        return self.headers
+
+    def getcode(self):
+        return 206
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class TestOpenFileRanges:
+
+    content = bytes(range(256)) * 40
+    ranges = [(100, 199), (150, 160), (5000, 5009), (230, 239), (9000, 9100)]
+
+    def expected(self):
+        return [self.content[start:end + 1] for start, end in self.ranges]
+
+    def test_coalesce_ranges(self):
+        assert system.coalesce_ranges(self.ranges, gap=50) == [
+            (100, 239), (5000, 5009), (9000, 9100)]
+        assert system.coalesce_ranges(self.ranges) == [
+            (100, 199), (230, 239), (5000, 5009), (9000, 9100)]
+
+    @mock.patch('aubreylib.system.open_url')
+    def test_open_file_ranges(self, mocked_open_url):
+        """Test each range is returned from one request."""
+        mocked_open_url.side_effect = lambda request: FakeRangeResponse(
+            self.content, request.get_header('Range'))
+        results = system.open_file_ranges('http://example.com/f.pdf', self.ranges, gap=50)
+        assert results == self.expected()
+        assert mocked_open_url.call_count == 1
+        request = mocked_open_url.call_args[0][0]
+        assert request.get_header('Range') == 'bytes=100-239,5000-5009,9000-9100'
+
+    @pytest.mark.parametrize('block_size', [None, 1024])
+    @mock.patch('aubreylib.system.open_url')
+    def test_open_file_ranges_partial_response(self, mocked_open_url, block_size):
+        """Test ranges left out by a server that only sends the first
+        range are requested again one at a time.
+        """
+        mocked_open_url.side_effect = lambda request: FakeRangeResponse(
+            self.content, request.get_header('Range'), multipart=False)
+        cache = None if block_size is None else BlockCache(block_size=block_size)
+        results = system.open_file_ranges('http://example.com/f.pdf', self.ranges,
+                                          gap=50, cache=cache)
+        assert results == self.expected()
+        assert mocked_open_url.call_count == 3
+        range_headers = [call[0][0].get_header('Range')
+                         for call in mocked_open_url.call_args_list]
+        if block_size is None:
+            assert range_headers[1:] == ['bytes=5000-5009', 'bytes=9000-9100']
+        else:
+            assert range_headers[1:] == ['bytes=4096-5119', 'bytes=8192-9215']
+
+    @mock.patch('aubreylib.system.open_url')
+    def test_open_file_ranges_max_ranges(self, mocked_open_url):
+        mocked_open_url.side_effect = lambda request: FakeRangeResponse(
+            self.content, request.get_header('Range'))
+        results = system.open_file_ranges('http://example.com/f.pdf', self.ranges,
+                                          gap=0, max_ranges=2)
+        assert results == self.expected()
+        assert mocked_open_url.call_count == 2
+
+    @mock.patch('aubreylib.system.open_url')
+    def test_open_file_ranges_block_cache(self, mocked_open_url):
+        """Test cached blocks aren't requested again."""
+        mocked_open_url.side_effect = lambda request: FakeRangeResponse(
+            self.content, request.get_header('Range'))
+        block_cache = BlockCache(block_size=1024)
+        results = system.open_file_ranges('http://example.com/f.pdf', self.ranges,
+                                          cache=block_cache)
+        assert results == self.expected()
+        request = mocked_open_url.call_args[0][0]
+        assert request.get_header('Range') == 'bytes=0-1023,4096-5119,8192-9215'
+        results = system.open_file_ranges('http://example.com/f.pdf', [(1000, 1010)],
+                                          cache=block_cache)
+        assert results == [self.content[1000:1011]]
+        assert mocked_open_url.call_count == 1
+
+    def test_open_file_ranges_local(self, tmp_path):
+        local_file = tmp_path / 'file.bin'
+        local_file.write_bytes(self.content)
+        assert system.open_file_ranges(str(local_file), self.ranges) == self.expected()
+
+
+class TestSendFileRange:
+
+    def test_send_file_range(self, tmp_path):
+        """Test the range of a local file is sent to the socket."""
+        local_file = tmp_path / 'file.bin'
+        local_file.write_bytes(b'0123456789' * 1000)
+        sender, receiver = socket.socketpair()
+        with sender, receiver:
+            sent = system.send_file_range(str(local_file), (5, 14), sender)
+            assert sent == 10
+            assert receiver.recv(100) == b'5678901234'
 
 
 class TestGetOtherSystem:
 
+    @pytest.fixture(autouse=True)
+    def clear_failover_hosts(self):
+        system.failover_hosts.clear()
+        yield
+        system.failover_hosts.clear()
+
     @mock.patch('aubreylib.METADATA_LOCATIONS', ('http://url.com/disk2',))
     @mock.patch('aubreylib.STATIC_FILE_LOCATIONS', ('http://url2.com/disk2',))
     @mock.patch('urllib.request.urlopen')
@@ -241,3 +463,110 @@ class TestGetOtherSystem:
         file_obj = system.get_other_system('http://example.com/disk1/noexist')
         assert file_obj == expected
         mocked_urlopen.assert_called_once_with('http://url.com/disk1/noexist', timeout=3)
+
+    @mock.patch('aubreylib.METADATA_LOCATIONS', ('http://url.com/disk2',))
+    @mock.patch('aubreylib.STATIC_FILE_LOCATIONS', ('http://url2.com/disk2',))
+    @mock.patch('urllib.request.urlopen')
+    def test_get_other_system_remembers_host(self, mocked_urlopen):
+        """Test the host that answered is tried first next time."""
+        def urlopen(url, timeout=None):
+            if 'url2.com' not in url:
+                raise urllib.error.URLError('timed out')
+            return url
+        mocked_urlopen.side_effect = urlopen
+        system.get_other_system('http://example.com/disk1/1.jpg')
+        assert system.failover_hosts == {'example.com': 'url2.com'}
+        mocked_urlopen.reset_mock()
+        assert system.get_other_system('http://example.com/disk1/2.jpg') == \
+            'http://url2.com/disk1/2.jpg'
+        mocked_urlopen.assert_called_once_with('http://url2.com/disk1/2.jpg', timeout=3)
+
+    @mock.patch('aubreylib.METADATA_LOCATIONS', ('http://url.com/disk2',))
+    @mock.patch('aubreylib.STATIC_FILE_LOCATIONS', ('http://url2.com/disk2',))
+    @mock.patch('urllib.request.urlopen')
+    def test_get_other_system_forgets_failed_host(self, mocked_urlopen):
+        """Test a remembered host that fails is tried once, then forgotten."""
+        system.failover_hosts['example.com'] = 'url2.com'
+
+        def urlopen(url, timeout=None):
+            if 'url2.com' in url:
+                raise urllib.error.URLError('timed out')
+            return url
+        mocked_urlopen.side_effect = urlopen
+        assert system.get_other_system('http://example.com/disk1/1.jpg') == \
+            'http://url.com/disk1/1.jpg'
+        assert mocked_urlopen.call_count == 2
+        assert system.failover_hosts == {'example.com': 'url.com'}
+
+    @mock.patch('aubreylib.METADATA_LOCATIONS', ('http://slow.com/disk2',))
+    @mock.patch('aubreylib.STATIC_FILE_LOCATIONS',
+                ('http://down.com/disk2', 'http://fast.com/disk2'))
+    @mock.patch('urllib.request.urlopen')
+    def test_get_other_system_concurrent(self, mocked_urlopen):
+        """Test the first location to answer is used and the others closed."""
+        slow_response = mock.Mock()
+        slow_started = threading.Event()
+        release_slow = threading.Event()
+
+        def urlopen(url, timeout=None):
+            if 'down.com' in url:
+                raise urllib.error.URLError('refused')
+            if 'slow.com' in url:
+                slow_started.set()
+                release_slow.wait(2)
+                return slow_response
+            return url
+        mocked_urlopen.side_effect = urlopen
+        response = system.get_other_system('http://example.com/disk1/1.jpg', concurrent=True)
+        assert response == 'http://fast.com/disk1/1.jpg'
+        assert system.failover_hosts == {'example.com': 'fast.com'}
+        assert slow_started.wait(2)
+        release_slow.set()
+        deadline = time.monotonic() + 2
+        while not slow_response.close.called:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+
+class TestProbeLocationsConcurrently:
+
+    location_tuple = ('http://slow.edu/', 'http://fast.edu/', 'http://other.edu/')
+
+    @staticmethod
+    def fake_probe(delays, hits):
+        def probe(meta_id, file_path, file_system):
+            time.sleep(delays[file_system])
+            if file_system in hits:
+                return file_system + file_path, file_system
+            return None
+        return probe
+
+    @mock.patch('aubreylib.system.probe_location')
+    def test_returns_first_hit_without_waiting(self, mocked_probe):
+        """Test a fast hit isn't held up by a slow higher priority miss."""
+        mocked_probe.side_effect = self.fake_probe(
+            {'http://slow.edu/': 1, 'http://fast.edu/': 0, 'http://other.edu/': 1},
+            ['http://fast.edu/'])
+        start = time.monotonic()
+        result = system.get_file_system('metapthx', 'web/4.jpg', self.location_tuple,
+                                        concurrent=True)
+        assert time.monotonic() - start < 0.5
+        assert result == ('http://fast.edu/web/4.jpg', 'http://fast.edu/')
+
+    @mock.patch('aubreylib.system.probe_location')
+    def test_priority_order_within_grace_period(self, mocked_probe):
+        """Test an earlier location wins if it hits within the grace period."""
+        mocked_probe.side_effect = self.fake_probe(
+            {'http://slow.edu/': 0.1, 'http://fast.edu/': 0, 'http://other.edu/': 0},
+            self.location_tuple)
+        result = system.get_file_system('metapthx', 'web/4.jpg', self.location_tuple,
+                                        concurrent=True, grace_period=1)
+        assert result == ('http://slow.edu/web/4.jpg', 'http://slow.edu/')
+
+    @mock.patch('aubreylib.system.probe_location')
+    def test_no_hits(self, mocked_probe):
+        mocked_probe.return_value = None
+        result = system.get_file_system('metapthx', 'web/4.jpg', self.location_tuple,
+                                        concurrent=True)
+        assert result == (None, None)
+        assert mocked_probe.call_count == 3